@@ -1,13 +1,18 @@
 from django.contrib import admin
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
-from django.urls import reverse
+from django.utils.html import format_html
 
 from django.contrib.auth import get_user_model
 
-from .models import Board, Post, Response, Newsletter
+from django.db.models import Q
+
+from .models import Board, Post, Response, Newsletter, NewsletterDelivery, UploadedImage
+from .images import enqueue
+from .newsletter import send_newsletter_in_background, throughput
+from . import search
 
 # Получение модели пользователя.
 User = get_user_model()
@@ -34,6 +39,25 @@ class PostAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     ordering = ('-created_at',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Ищет по полнотекстовому индексу вместо LIKE '%q%' по HTML-содержимому.
+        """
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search.matching_ids('post', search_term)), False
+
+
+def _set_accepted(queryset, accepted):
+    """
+    Массово меняет статус откликов. update() не вызывает сигналов, поэтому время изменения
+    откликов и их постов сдвигается здесь: от него зависят Last-Modified и ETag страниц постов.
+    """
+    now = timezone.now()
+    queryset.update(is_accepted=accepted, updated_at=now)
+    Post.objects.filter(pk__in=queryset.values('post_id')).update(updated_at=now)
+
+
 @admin.register(Response)
 class ResponseAdmin(admin.ModelAdmin):
     """
@@ -46,12 +70,25 @@ class ResponseAdmin(admin.ModelAdmin):
     raw_id_fields = ('post', 'author')
     actions = ['mark_as_accepted', 'mark_as_unaccepted']
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Ищет отклики по полнотекстовому индексу (текст отклика и заголовок поста)
+        и по имени автора вместо LIKE '%q%' по HTML-содержимому.
+        """
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(
+            Q(pk__in=search.matching_ids('response', search_term))
+            | Q(post_id__in=search.matching_ids('post', search_term, column='title'))
+            | Q(author__username__icontains=search_term)
+        ), False
+
     @admin.action(description='Пометить выбранные отклики как принятые')
     def mark_as_accepted(self, request, queryset):
         """
         Помечает выбранные отклики как принятые.
         """
-        queryset.update(is_accepted=True)
+        _set_accepted(queryset, True)
         self.message_user(request, "Выбранные отклики успешно помечены как принятые.")
 
     @admin.action(description='Пометить выбранные отклики как непринятые')
@@ -59,79 +96,107 @@ class ResponseAdmin(admin.ModelAdmin):
         """
         Помечает выбранные отклики как непринятые.
         """
-        queryset.update(is_accepted=False)
+        _set_accepted(queryset, False)
         self.message_user(request, "Выбранные отклики успешно помечены как непринятые.")
 
+@admin.register(UploadedImage)
+class UploadedImageAdmin(admin.ModelAdmin):
+    """
+    Загруженные изображения и состояние создания их вариантов.
+    """
+    list_display = ('path', 'status', 'size', 'width', 'height', 'created_at', 'processed_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('path',)
+    readonly_fields = ('path', 'size', 'width', 'height', 'variants', 'status', 'error', 'created_at', 'processed_at')
+    actions = ['reprocess']
+
+    @admin.action(description='Пересоздать варианты выбранных изображений')
+    def reprocess(self, request, queryset):
+        """
+        Ставит выбранные изображения в очередь фоновой обработки повторно.
+        """
+        pks = list(queryset.values_list('pk', flat=True))
+        UploadedImage.objects.filter(pk__in=pks).update(status=UploadedImage.STATUS_PENDING, error='')
+        for pk in pks:
+            enqueue(pk)
+        self.message_user(request, f"Изображений поставлено в очередь: {len(pks)}.")
+
 @admin.register(Newsletter)
 class NewsletterAdmin(admin.ModelAdmin):
     """
     Настройки отображения модели Newsletter в административной панели.
-    Добавлено действие для отправки новостной рассылки.
+    Добавлено действие для фоновой отправки новостной рассылки и страница прогресса.
     """
-    list_display = ('subject', 'created_at', 'sent_at', 'is_sent')
-    list_filter = ('is_sent', 'created_at')
+    list_display = ('subject', 'created_at', 'status', 'progress_link', 'sent_at', 'is_sent')
+    list_filter = ('status', 'is_sent', 'created_at')
     search_fields = ('subject', 'content')
-    readonly_fields = ('created_at', 'sent_at', 'is_sent')
+    readonly_fields = ('created_at', 'sent_at', 'is_sent', 'status', 'started_at',
+                       'total_recipients', 'sent_count', 'failed_count')
 
     actions = ['send_newsletter']
 
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/progress/', self.admin_site.admin_view(self.progress_view),
+                 name='boards_newsletter_progress'),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description='Прогресс')
+    def progress_link(self, obj):
+        if obj.status == Newsletter.STATUS_DRAFT:
+            return '—'
+        return format_html(
+            '<a href="{}">{} / {}</a>',
+            reverse('admin:boards_newsletter_progress', args=[obj.pk]),
+            obj.sent_count + obj.failed_count,
+            obj.total_recipients,
+        )
+
+    def progress_view(self, request, pk):
+        """
+        Страница прогресса отправки рассылки: счетчики и скорость (писем в секунду).
+        """
+        newsletter = get_object_or_404(Newsletter, pk=pk)
+        processed = newsletter.sent_count + newsletter.failed_count
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Отправка рассылки «{newsletter.subject}»',
+            'newsletter': newsletter,
+            'processed': processed,
+            'percent': round(100 * processed / newsletter.total_recipients) if newsletter.total_recipients else 0,
+            'throughput': throughput(newsletter),
+            'failed_deliveries': newsletter.deliveries.filter(status=NewsletterDelivery.STATUS_FAILED)
+                                 .select_related('user')[:20],
+        }
+        return TemplateResponse(request, 'admin/boards/newsletter/progress.html', context)
+
     @admin.action(description='Отправить выбранные рассылки')
     def send_newsletter(self, request, queryset):
         """
-        Отправляет выбранные новостные рассылки пользователям.
+        Ставит выбранные черновики в очередь и запускает их отправку в фоне.
+        Для прерванных рассылок («В очереди», «Отправляется») отправка запускается снова
+        и продолжается с неотправленных писем: уже взятые в отправку письма не дублируются.
+        Подписчики получают письма без ожидания в запросе админ-панели.
         """
-        # Определите получателей рассылки.
-        # Пример: Отправлять всем активным пользователям.
-        users_to_receive_newsletter = User.objects.filter(is_active=True)
-
-        emails_sent_count = 0
-        emails_failed_count = 0
-
         for newsletter in queryset:
-            if not newsletter.is_sent:
-                subject = newsletter.subject
-                template_name = 'boards/emails/newsletter_email.html'
-
-                for user in users_to_receive_newsletter:
-                    # Вставьте реальный URL для отписки, если он существует.
-                    # Например: unsubscribe_url = request.build_absolute_uri(reverse('boards:unsubscribe_newsletter'))
-                    unsubscribe_url = '#'
-
-                    context = {
-                        'subject': subject,
-                        'newsletter_content': newsletter.content,
-                        'recipient_username': user.username if user.username else user.email,
-                        'unsubscribe_url': unsubscribe_url,
-                        'current_year': timezone.now().year,
-                    }
-
-                    plain_message = f"Здравствуйте, {context['recipient_username']}!\n\n{newsletter.content}\n\nС уважением,\nКоманда MyFanBoard."
-                    html_message = render_to_string(template_name, context)
-
-                    try:
-                        send_mail(
-                            subject,
-                            plain_message,
-                            settings.DEFAULT_FROM_EMAIL,
-                            [user.email],
-                            html_message=html_message,
-                            fail_silently=False,
-                        )
-                        emails_sent_count += 1
-                    except Exception as e:
-                        emails_failed_count += 1
-                        print(f"Ошибка при отправке рассылки пользователю {user.email}: {e}")
-
-                if emails_sent_count > 0:
-                    newsletter.is_sent = True
-                    newsletter.sent_at = timezone.now()
-                    newsletter.save()
-                    self.message_user(request, f'Рассылка "{newsletter.subject}" успешно отправлена {emails_sent_count} пользователям.', level='success')
-                    if emails_failed_count > 0:
-                        self.message_user(request, f'{emails_failed_count} писем не удалось отправить.', level='error')
-                else:
-                    self.message_user(request, f'Рассылка "{newsletter.subject}" не была отправлена ни одному пользователю (возможно, нет активных пользователей или произошла ошибка).', level='warning')
-            else:
-                self.message_user(request, f'Рассылка "{newsletter.subject}" уже была отправлена ранее.', level='info')
-
-        self.message_user(request, f'Завершено действие отправки рассылок.', level='info')
\ No newline at end of file
+            if newsletter.status == Newsletter.STATUS_SENT:
+                self.message_user(request, f'Рассылка "{newsletter.subject}" уже отправлена.', level='info')
+                continue
+            if newsletter.status == Newsletter.STATUS_DRAFT:
+                updated = Newsletter.objects.filter(pk=newsletter.pk, status=Newsletter.STATUS_DRAFT).update(
+                    status=Newsletter.STATUS_QUEUED
+                )
+                if not updated:
+                    continue
+            send_newsletter_in_background(newsletter)
+            self.message_user(
+                request,
+                format_html(
+                    'Отправка рассылки "{}" запущена. <a href="{}">Следить за отправкой</a>.',
+                    newsletter.subject,
+                    reverse('admin:boards_newsletter_progress', args=[newsletter.pk]),
+                ),
+                level='success',
+            )
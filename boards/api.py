@@ -0,0 +1,141 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import generics
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response as APIResponse
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .conditional import board_list_state, board_state, conditional_page, post_state
+from .models import Board, Post, Response
+from .pagination import InvalidCursor, keyset_paginate
+from .serializers import BoardSerializer, PostDetailSerializer, PostListSerializer, ResponseSerializer
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Курсорная пагинация API поверх keyset_paginate: параметры ?after= и ?before=,
+    как на HTML-страницах, и ссылки next/previous в ответе.
+    """
+    page_size = 20
+    max_page_size = 100
+    descending = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.page_size
+        if request.query_params.get('page_size', '').isdigit():
+            page_size = min(int(request.query_params['page_size']), self.max_page_size) or self.page_size
+        try:
+            self.page = keyset_paginate(
+                queryset,
+                after=request.query_params.get('after'),
+                before=request.query_params.get('before'),
+                per_page=page_size,
+                descending=self.descending,
+            )
+        except InvalidCursor:
+            raise NotFound('Некорректный курсор страницы.')
+        return list(self.page)
+
+    def _link(self, param, cursor):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(remove_query_param(url, 'after'), 'before')
+        return replace_query_param(url, param, cursor)
+
+    def get_paginated_response(self, data):
+        return APIResponse({
+            'next': self._link('after', self.page.next_cursor) if self.page.has_next else None,
+            'previous': self._link('before', self.page.previous_cursor) if self.page.has_previous else None,
+            'results': data,
+        })
+
+
+class AscendingKeysetCursorPagination(KeysetCursorPagination):
+    descending = False
+
+
+class ConditionalStateMixin:
+    """
+    Условные GET-запросы API, как на HTML-страницах (см. boards/conditional.py): ETag и Last-Modified
+    вычисляются по состоянию объектов одним агрегирующим запросом, а совпадающий If-None-Match
+    или If-Modified-Since дает 304 без выборки, сериализации и рендеринга JSON.
+    Экономит трафик и время сервера для мобильного клиента.
+
+    conditional_state — метод, получающий аргументы URL и возвращающий состояние
+    в формате conditional_page. ETag включает адрес с параметрами (?fields=, ?after=, ...).
+    """
+    def conditional_state(self, **kwargs):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        return conditional_page(self.conditional_state)(super().get)(request, *args, **kwargs)
+
+
+class SparseFieldsetMixin:
+    """
+    Загружает из базы только колонки, нужные для запрошенных ?fields= полей.
+    """
+    def sparse_queryset(self, queryset, *extra):
+        serializer_class = self.get_serializer_class()
+        fields = serializer_class.model_fields(self.request)
+        related = [name for name in ('author',) if name in serializer_class.requested_fields(self.request)]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*fields, *extra)
+
+
+class BoardList(ConditionalStateMixin, SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Список досок в порядке создания, с курсорной пагинацией.
+    """
+    serializer_class = BoardSerializer
+    pagination_class = AscendingKeysetCursorPagination
+
+    def conditional_state(self):
+        return board_list_state()
+
+    def get_queryset(self):
+        return self.sparse_queryset(Board.objects.all(), 'created_at')
+
+
+class BoardPostList(ConditionalStateMixin, SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Посты доски от новых к старым, без содержимого.
+    """
+    serializer_class = PostListSerializer
+    pagination_class = KeysetCursorPagination
+
+    def conditional_state(self, board_pk):
+        return board_state(board_pk)
+
+    def get_queryset(self):
+        board = get_object_or_404(Board.objects.only('pk'), pk=self.kwargs['board_pk'])
+        return self.sparse_queryset(Post.objects.filter(board=board), 'created_at')
+
+
+class PostDetail(ConditionalStateMixin, SparseFieldsetMixin, generics.RetrieveAPIView):
+    """
+    Пост целиком.
+    """
+    serializer_class = PostDetailSerializer
+
+    def conditional_state(self, pk):
+        return post_state(None, pk)
+
+    def get_queryset(self):
+        return self.sparse_queryset(Post.objects.all())
+
+
+class PostResponseList(ConditionalStateMixin, SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Отклики на пост от старых к новым.
+    """
+    serializer_class = ResponseSerializer
+    pagination_class = AscendingKeysetCursorPagination
+
+    def conditional_state(self, post_pk):
+        return post_state(None, post_pk)
+
+    def get_queryset(self):
+        post = get_object_or_404(Post.objects.only('pk'), pk=self.kwargs['post_pk'])
+        return self.sparse_queryset(Response.objects.filter(post=post), 'created_at')
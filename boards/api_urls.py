@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    # Список досок.
+    path('boards/', api.BoardList.as_view(), name='board_list'),
+    # Посты доски с курсорной пагинацией.
+    path('boards/<int:board_pk>/posts/', api.BoardPostList.as_view(), name='board_posts'),
+    # Пост целиком.
+    path('posts/<int:pk>/', api.PostDetail.as_view(), name='post_detail'),
+    # Отклики на пост с курсорной пагинацией.
+    path('posts/<int:post_pk>/responses/', api.PostResponseList.as_view(), name='post_responses'),
+]
@@ -0,0 +1,17 @@
+from django.urls import path
+
+from . import views
+from .urls import app_name, urlpatterns as sync_urlpatterns
+
+# Маршруты досок под ASGI (см. myfanboard_project/urls_asgi.py): страницы для чтения
+# обслуживают асинхронные представления, остальные маршруты те же, что в urls.py.
+# Первый совпавший маршрут побеждает, поэтому асинхронные варианты стоят раньше синхронных.
+urlpatterns = [
+    # Список всех досок.
+    path('', views.aboard_list, name='list'),
+    # Посты по выбранной доске.
+    path('<int:pk>/', views.aposts_by_board, name='posts_by_board'),
+    # Детали конкретного поста.
+    path('<int:board_pk>/post/<int:post_pk>/', views.apost_detail, name='post_detail'),
+    *sync_urlpatterns,
+]
@@ -0,0 +1,449 @@
+import asyncio
+import io
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from main.asynchronous import ASGIHandler
+from users.models import OneTimeCode
+from .models import Board, Post, Response
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Сценарии в порядке запуска. Каждый сценарий — один «запрос пользователя»;
+# вход по коду состоит из двух HTTP-запросов и замеряется целиком.
+SCENARIOS = (
+    'board_list',
+    'posts_by_board',
+    'post_detail',
+    'my_posts_responses',
+    'add_response',
+    'otp_login',
+)
+# Сценарии, изменяющие данные (пропускаются с --no-writes).
+WRITE_SCENARIOS = {'add_response', 'otp_login'}
+# Страницы для чтения с асинхронными представлениями, на которых сравниваются WSGI и ASGI.
+READ_SCENARIOS = ('board_list', 'posts_by_board', 'post_detail')
+INTERFACES = ('wsgi', 'asgi')
+
+
+def percentile(values, fraction):
+    """
+    Перцентиль по методу ближайшего ранга; values должны быть отсортированы.
+    """
+    if not values:
+        return None
+    rank = max(int(fraction * len(values) + 0.999999) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Sample:
+    """
+    Случайная выборка досок, постов и пользователей, по которой ходят сценарии.
+    Посты выбираются по случайным диапазонам pk, чтобы не сортировать всю таблицу.
+    """
+    def __init__(self, seed=0, size=200):
+        rng = random.Random(seed)
+        self.boards = list(Board.objects.values_list('pk', flat=True)[:1000])
+        last_post = Post.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if not self.boards or last_post is None:
+            raise ValueError('В базе нет досок или постов: сначала запустите seed_fanboard.')
+        self.posts = []
+        for _ in range(size):
+            post = (Post.objects.filter(pk__gte=rng.randint(1, last_post)).order_by('pk')
+                    .values_list('pk', 'board_id', 'author_id').first())
+            if post is not None:
+                self.posts.append(post)
+        users = list(User.objects.filter(is_active=True).exclude(email='').order_by('pk')
+                     .values_list('pk', 'email')[:size * 10])
+        self.users = rng.sample(users, min(size, len(users)))
+        # Для страницы откликов нужен автор постов; выбираются авторы случайных постов.
+        authors = {author for _, _, author in self.posts}
+        self.authors = [user for user in self.users if user[0] in authors] or \
+            list(User.objects.filter(pk__in=authors).values_list('pk', 'email')[:size])
+
+
+class Scenario:
+    """
+    Один сценарий для одного потока: собственный тестовый клиент и генератор случайных чисел.
+    """
+    def __init__(self, name, sample, rng):
+        self.name = name
+        self.sample = sample
+        self.rng = rng
+        self.client = Client()
+        if name == 'my_posts_responses':
+            self.client.force_login(User.objects.get(pk=rng.choice(sample.authors)[0]))
+        elif name == 'add_response':
+            self.client.force_login(User.objects.get(pk=rng.choice(sample.users)[0]))
+
+    def run(self):
+        """
+        Выполняет один шаг сценария; возвращает True, если ответы такие, как ожидалось.
+        """
+        return getattr(self, self.name)()
+
+    def board_list(self):
+        return self.client.get(reverse('boards:list')).status_code == 200
+
+    def posts_by_board(self):
+        board = self.rng.choice(self.sample.boards)
+        return self.client.get(reverse('boards:posts_by_board', args=[board])).status_code == 200
+
+    def post_detail(self):
+        post, board, _ = self.rng.choice(self.sample.posts)
+        return self.client.get(reverse('boards:post_detail', args=[board, post])).status_code == 200
+
+    def my_posts_responses(self):
+        return self.client.get(reverse('boards:my_posts_responses')).status_code == 200
+
+    def add_response(self):
+        post, board, _ = self.rng.choice(self.sample.posts)
+        response = self.client.post(
+            reverse('boards:add_response', args=[board, post]),
+            {'content': f'<p>Отклик нагрузочного теста {self.rng.random():.6f}</p>'},
+        )
+        return response.status_code == 302
+
+    def otp_login(self):
+        user_id, email = self.rng.choice(self.sample.users)
+        self.client.logout()
+        if self.client.post(reverse('login_request_code'), {'email': email}).status_code != 302:
+            return False
+        # Письмо с кодом не читается: код берется из базы, как его получил бы пользователь.
+        code = (OneTimeCode.objects.filter(user_id=user_id, type='login', is_used=False)
+                .values_list('code', flat=True).first())
+        response = self.client.post(reverse('verify_login_code'), {'code': code, 'email': email})
+        return response.status_code == 302 and '_auth_user_id' in self.client.session
+
+
+def run_scenario(name, sample, requests, concurrency, seed=0):
+    """
+    Выполняет requests шагов сценария в concurrency потоках и возвращает сводку:
+    пропускную способность, перцентили задержки и число SQL-запросов на шаг.
+    """
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(number):
+        try:
+            scenario = Scenario(name, sample, random.Random(f'{seed}:{name}:{number}'))
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                with ExitStack() as stack:
+                    contexts = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                    started = time.perf_counter()
+                    try:
+                        ok = scenario.run()
+                    except Exception:
+                        ok = False
+                        logger.exception('Сценарий %s завершился ошибкой', name)
+                    elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed * 1000)
+                    queries.append(sum(len(context) for context in contexts))
+                    if not ok:
+                        errors.append(1)
+        finally:
+            # У каждого потока свои подключения к базе; закрываем их сами.
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        **_summary(latencies, len(errors), concurrency, wall),
+        'queries': {
+            'mean': _round(statistics.fmean(queries) if queries else None),
+            'max': max(queries, default=None),
+        },
+    }
+
+
+def _summary(latencies, errors, concurrency, wall):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'concurrency': concurrency,
+        'seconds': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'latency_ms': {
+            'p50': _round(percentile(latencies, 0.50)),
+            'p90': _round(percentile(latencies, 0.90)),
+            'p95': _round(percentile(latencies, 0.95)),
+            'p99': _round(percentile(latencies, 0.99)),
+            'max': _round(latencies[-1] if latencies else None),
+            'mean': _round(statistics.fmean(latencies) if latencies else None),
+        },
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def environment():
+    """
+    Условия прогона: коммит, версии и объем данных, чтобы сравнивать только сопоставимые результаты.
+    """
+    return {
+        'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': settings.DATABASES['default']['ENGINE'],
+        'data': {
+            'boards': Board.objects.count(),
+            'posts': Post.objects.count(),
+            'responses': Response.objects.count(),
+        },
+    }
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Сравнение WSGI и ASGI ---
+
+class SlowDatabase:
+    """
+    Добавляет задержку delay секунд к каждому SQL-запросу во всех подключениях, в том числе
+    созданных внутри блока в других потоках. Имитирует базу по сети: локальная SQLite
+    отвечает за микросекунды, и разница между WSGI и ASGI на ней не видна.
+    """
+    def __init__(self, delay):
+        self.delay = delay
+
+    def _wrapper(self, execute, sql, params, many, context):
+        time.sleep(self.delay)
+        return execute(sql, params, many, context)
+
+    def _add(self, sender=None, connection=None, **kwargs):
+        if self._wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self._wrapper)
+
+    def __enter__(self):
+        if self.delay:
+            connection_created.connect(self._add)
+            for connection in connections.all(initialized_only=True):
+                self._add(connection=connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._add)
+        for connection in connections.all(initialized_only=True):
+            if self._wrapper in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self._wrapper)
+
+
+def read_paths(name, sample, count, seed=0):
+    """
+    Адреса count запросов сценария чтения name по выборке sample.
+    """
+    rng = random.Random(f'{seed}:{name}')
+    paths = []
+    for _ in range(count):
+        if name == 'board_list':
+            paths.append(reverse('boards:list'))
+        elif name == 'posts_by_board':
+            paths.append(reverse('boards:posts_by_board', args=[rng.choice(sample.boards)]))
+        else:
+            post, board, _ = rng.choice(sample.posts)
+            paths.append(reverse('boards:post_detail', args=[board, post]))
+    return paths
+
+
+def _wsgi_get(application, path):
+    status = []
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+    }
+    result = application(environ, lambda line, headers, exc_info=None: status.append(int(line.split()[0])))
+    try:
+        b''.join(result)
+    finally:
+        # close() отправляет request_finished, как это делает WSGI-сервер.
+        result.close()
+    return status[0]
+
+
+async def _asgi_get(application, path):
+    status = []
+    disconnected = asyncio.get_running_loop().create_future()
+    delivered = False
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается: ожидание отменяет сам обработчик по окончании ответа.
+        return await disconnected
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    await application(scope, receive, send)
+    return status[0]
+
+
+# Имя потоков клиентов нагрузки: они не считаются потоками сервера.
+_CLIENT_THREAD = 'bench-client'
+
+
+def _server_threads():
+    return sum(1 for thread in threading.enumerate() if not thread.name.startswith(_CLIENT_THREAD))
+
+
+class _ThreadPeak:
+    """
+    Наибольшее число потоков процесса, кроме потоков клиентов, за время прогона (опрос каждые 5 мс).
+    """
+    def __init__(self):
+        self.peak = _server_threads()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=_CLIENT_THREAD + '-monitor', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, _server_threads())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_wsgi(paths, concurrency, workers):
+    """
+    concurrency клиентов по кругу запрашивают paths у WSGI-приложения, которое обслуживает
+    не больше workers запросов одновременно (как WSGI-сервер с workers потоками); остальные
+    запросы ждут в очереди. Задержка считается от отправки запроса, включая ожидание в очереди.
+    Страницы обслуживают синхронные представления (ROOT_URLCONF), как у WSGI-сервера проекта.
+    """
+    application = WSGIHandler()
+    latencies, errors = [], []
+    lock = threading.Lock()
+    queue = iter(paths)
+
+    def client(server):
+        while True:
+            with lock:
+                path = next(queue, None)
+            if path is None:
+                return
+            started = time.perf_counter()
+            try:
+                ok = server.submit(_wsgi_get, application, path).result() == 200
+            except Exception:
+                ok = False
+                logger.exception('Запрос WSGI %s завершился ошибкой', path)
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not ok:
+                    errors.append(path)
+
+    with _ThreadPeak() as threads_peak, ThreadPoolExecutor(workers) as server:
+        threads = [threading.Thread(target=client, args=(server,), name=f'{_CLIENT_THREAD}-{number}')
+                   for number in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        # У каждого рабочего потока свои подключения к базе; закрываем их там же.
+        for _ in range(workers):
+            server.submit(connections.close_all)
+    return {**_summary(latencies, len(errors), concurrency, wall), 'workers': workers, 'peak_threads': threads_peak.peak}
+
+
+def run_asgi(paths, concurrency, workers):
+    """
+    concurrency клиентов по кругу запрашивают paths у ASGI-приложения в одном цикле событий
+    (один рабочий процесс ASGI-сервера). Пул потоков цикла ограничен workers потоками;
+    ORM асинхронных представлений Django выполняет в отдельном потоке каждого запроса.
+    Обработчик проекта разрешает URL по ASGI_URLCONF, как в myfanboard_project/asgi.py.
+    """
+    application = ASGIHandler()
+    latencies, errors = [], []
+    queue = iter(paths)
+
+    async def client():
+        for path in queue:
+            started = time.perf_counter()
+            try:
+                ok = await _asgi_get(application, path) == 200
+            except Exception:
+                ok = False
+                logger.exception('Запрос ASGI %s завершился ошибкой', path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors.append(path)
+
+    async def main():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(workers))
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    with _ThreadPeak() as threads_peak:
+        started = time.perf_counter()
+        asyncio.run(main())
+        wall = time.perf_counter() - started
+    return {**_summary(latencies, len(errors), concurrency, wall), 'workers': workers, 'peak_threads': threads_peak.peak}
+
+
+def run_interface(interface, paths, concurrency, workers):
+    """
+    Прогон paths через 'wsgi' или 'asgi'.
+    """
+    runner = run_wsgi if interface == 'wsgi' else run_asgi
+    return runner(paths, concurrency, workers)
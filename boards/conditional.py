@@ -0,0 +1,182 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from main.asynchronous import load_request
+from .models import Board, Post
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _board_list_aggregates():
+    return {
+        'updated': Max('updated_at'), 'activity': Max('last_activity_at'), 'boards': Count('pk'),
+        'posts': Sum('post_count'), 'responses': Sum('response_count'),
+    }
+
+
+def board_list_state():
+    """
+    Состояние списка досок одним агрегирующим запросом: изменение доски, новый пост или отклик
+    (last_activity_at) и удаления (число досок и суммы счетчиков).
+    Удаленная доска не оставляет времени изменения, поэтому Last-Modified для списка
+    не отдается: он проверяется только по ETag.
+    """
+    return None, tuple(Board.objects.aggregate(**_board_list_aggregates()).values())
+
+
+async def aboard_list_state():
+    """
+    Асинхронный вариант board_list_state.
+    """
+    return None, tuple((await Board.objects.aaggregate(**_board_list_aggregates())).values())
+
+
+def _board_query(pk):
+    return Board.objects.filter(pk=pk).values('updated_at', 'last_activity_at', 'post_count', 'response_count')
+
+
+def _board_result(state):
+    if state is None:
+        return None
+    return _latest(state['updated_at'], state['last_activity_at']), tuple(state.values())
+
+
+def board_state(pk):
+    """
+    Состояние страницы доски: только поля строки доски, чтение по первичному ключу.
+    Новые посты и отклики сдвигают last_activity_at, а редактирование и удаление постов —
+    updated_at доски (см. boards/signals.py), поэтому посты доски при проверке не читаются.
+    """
+    return _board_result(_board_query(pk).first())
+
+
+async def aboard_state(pk):
+    """
+    Асинхронный вариант board_state.
+    """
+    return _board_result(await _board_query(pk).afirst())
+
+
+def _post_query(board_pk, post_pk):
+    posts = Post.objects.filter(pk=post_pk)
+    if board_pk is not None:
+        posts = posts.filter(board_id=board_pk)
+    return posts.values('updated_at', 'response_count')
+
+
+def _post_result(state):
+    if state is None:
+        return None
+    return state['updated_at'], tuple(state.values())
+
+
+def post_state(board_pk, post_pk):
+    """
+    Состояние страницы поста: только поля строки поста, чтение по первичному ключу.
+    Создание, редактирование и удаление откликов сдвигают updated_at поста (см. boards/signals.py).
+    Количество просмотров в состояние не входит: иначе каждый просмотр менял бы ETag.
+    board_pk=None — пост ищется только по id (адреса API не содержат доску).
+    """
+    return _post_result(_post_query(board_pk, post_pk).first())
+
+
+async def apost_state(board_pk, post_pk):
+    """
+    Асинхронный вариант post_state.
+    """
+    return _post_result(await _post_query(board_pk, post_pk).afirst())
+
+
+def _is_conditional(request):
+    # Непоказанные flash-сообщения делают страницу разовой: ее нельзя подтверждать ответом 304.
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def _validators(request, current):
+    """
+    ETag и Last-Modified (в секундах) страницы по ее состоянию current и готовый ответ 304/412,
+    если предусловия запроса выполнены (иначе None).
+    """
+    last_modified, values = current
+    user_key = request.user.pk if request.user.is_authenticated else 'anon'
+    digest = hashlib.md5(repr((values, user_key, request.get_full_path())).encode()).hexdigest()
+    if request.user.is_authenticated or last_modified is None:
+        last_modified = None
+    else:
+        last_modified = int(last_modified.timestamp())
+    etag = quote_etag(digest)
+    return etag, last_modified, get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _add_validators(response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional_page(state, on_not_modified=None):
+    """
+    Поддержка условных GET-запросов (ETag / Last-Modified) для страниц досок и постов.
+
+    state — функция, получающая аргументы URL и возвращающая пару (время последнего изменения,
+    кортеж значений, определяющих содержимое страницы) или None, если объекта нет.
+    Если клиент прислал совпадающий If-None-Match или If-Modified-Since, ответ 304
+    возвращается без вызова представления и рендеринга шаблонов.
+
+    Страницы содержат персональные части base.html (имя пользователя, ссылки автора),
+    поэтому ETag включает id пользователя, а Last-Modified отдается только анонимным.
+    Страницы с непоказанными flash-сообщениями обрабатываются как обычно.
+
+    on_not_modified — необязательная функция, вызываемая с аргументами URL при ответе 304
+    (например, чтобы учесть просмотр поста).
+
+    Декоратор подходит и для асинхронных представлений (см. asgi_urls.py); тогда state
+    и on_not_modified тоже должны быть асинхронными. Представления API подключают его
+    через ConditionalStateMixin (см. boards/api.py).
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                await load_request(request)
+                current = await state(**kwargs) if _is_conditional(request) else None
+                if current is None:
+                    return await view_func(request, *args, **kwargs)
+                etag, last_modified, response = _validators(request, current)
+                if response is None:
+                    response = await view_func(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                elif response.status_code == 304 and on_not_modified is not None:
+                    await on_not_modified(**kwargs)
+                return _add_validators(response, etag, last_modified)
+
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            current = state(**kwargs) if _is_conditional(request) else None
+            if current is None:
+                return view_func(request, *args, **kwargs)
+            etag, last_modified, response = _validators(request, current)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            elif response.status_code == 304 and on_not_modified is not None:
+                on_not_modified(**kwargs)
+            return _add_validators(response, etag, last_modified)
+
+        return wrapper
+    return decorator
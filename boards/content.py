@@ -0,0 +1,257 @@
+import hashlib
+import re
+from html import escape
+from html.parser import HTMLParser
+
+# Теги, содержимое которых не является текстом поста.
+SKIPPED_TAGS = {'script', 'style', 'template'}
+# Блочные теги: на их границах вставляется пробел, чтобы слова соседних абзацев не склеивались.
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'tr', 'td', 'th', 'figure', 'figcaption', 'pre', 'hr',
+}
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Собирает текстовое содержимое HTML-документа, пропуская скрипты и стили.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    """
+    Преобразует HTML из CKEditor в простой текст с нормализованными пробелами.
+    """
+    if not html:
+        return ''
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return ' '.join(''.join(parser.parts).split())
+
+
+# Разрешенные теги и атрибуты для HTML, выводимого на страницах без экранирования.
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'div', 'span', 'strong', 'b', 'em', 'i', 'u', 's', 'sub', 'sup', 'code', 'pre',
+    'a', 'ul', 'ol', 'li', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'figure', 'figcaption', 'img', 'oembed', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+ALLOWED_ATTRIBUTES = {
+    '*': {'class', 'style'},
+    'a': {'href', 'title', 'target'},
+    'img': {'src', 'alt', 'title', 'width', 'height', 'srcset', 'sizes'},
+    'oembed': {'url'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+URL_ATTRIBUTES = {'href', 'src', 'url'}
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto'}
+# Разрешенные CSS-свойства атрибута style. Позиционирование, размеры блоков и фоновые
+# изображения запрещены: ими можно наложить поддельный интерфейс поверх страницы.
+STYLE_PROPERTIES = {
+    '*': {'text-align', 'color', 'background-color'},
+    'img': {'width', 'height'},
+    'figure': {'width'},
+}
+# Допустимое значение CSS-свойства: слова, числа с единицами, проценты и цвета.
+# Скобки запрещены, поэтому url(), expression() и var() не проходят.
+SAFE_STYLE_VALUE = re.compile(r'^[#a-zA-Z0-9.,%\s-]+$')
+# Единственное разрешенное значение target; ссылке с ним всегда ставится rel="noopener noreferrer".
+ALLOWED_LINK_TARGETS = {'_blank'}
+# Длина текстовой выдержки для списков и писем.
+EXCERPT_LENGTH = 300
+# Версия правил очистки. Входит в content_hash: после изменения правил сохраненные
+# записи перестают совпадать по хешу и перестраиваются командой backfill_rendered_content.
+RENDER_VERSION = 3
+
+
+def _is_safe_url(value):
+    scheme, sep, _ = value.strip().partition(':')
+    # Относительные ссылки (/media/..., #anchor) и ссылки без схемы разрешены.
+    if not sep or '/' in scheme or '?' in scheme or '#' in scheme:
+        return True
+    return scheme.lower() in ALLOWED_URL_SCHEMES
+
+
+def _is_safe_srcset(value):
+    """
+    Проверяет адрес каждого варианта srcset ("url 2x, url 640w").
+    Запятые внутри адреса (data:...;base64,...) дают кандидатов с опасной схемой, и атрибут отбрасывается.
+    """
+    return all(_is_safe_url(candidate.split()[0]) for candidate in value.split(',') if candidate.strip())
+
+
+def _clean_style(tag, value):
+    """
+    Оставляет в style только разрешенные для тега свойства с безопасными значениями.
+    """
+    allowed = STYLE_PROPERTIES.get(tag, set()) | STYLE_PROPERTIES['*']
+    declarations = []
+    for declaration in value.split(';'):
+        prop, sep, prop_value = declaration.partition(':')
+        prop, prop_value = prop.strip().lower(), prop_value.strip()
+        if sep and prop in allowed and SAFE_STYLE_VALUE.match(prop_value):
+            declarations.append(f'{prop}: {prop_value}')
+    return '; '.join(declarations)
+
+
+class _Sanitizer(HTMLParser):
+    """
+    Пропускает только разрешенные теги и атрибуты, экранируя все остальное.
+    Попутно собирает адреса изображений и подставляет готовые варианты изображений
+    (src, srcset, sizes, width, height) из image_variants.
+    """
+    def __init__(self, image_variants=None):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.images = []
+        self.image_variants = image_variants or {}
+        self._skip_depth = 0
+
+    def _attrs(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set()) | ALLOWED_ATTRIBUTES['*']
+        result = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not _is_safe_url(value):
+                continue
+            if name == 'srcset' and not _is_safe_srcset(value):
+                continue
+            if name == 'style':
+                value = _clean_style(tag, value)
+                if not value:
+                    continue
+            if name == 'target' and value not in ALLOWED_LINK_TARGETS:
+                continue
+            result.append((name, value))
+        if tag == 'a' and any(name == 'target' for name, _ in result):
+            # Без noopener открытая страница получает window.opener и может подменить исходную вкладку.
+            result.append(('rel', 'noopener noreferrer'))
+        if tag == 'img':
+            src = dict(result).get('src')
+            if src:
+                self.images.append(src)
+            variant_attrs = self.image_variants.get(src)
+            if variant_attrs:
+                present = {name for name, _ in result}
+                result = [(name, value) for name, value in result if name not in ('src', 'srcset', 'sizes')]
+                result += [
+                    (name, str(value)) for name, value in variant_attrs.items()
+                    if name in ('src', 'srcset', 'sizes') or name not in present
+                ]
+            result.append(('loading', 'lazy'))
+        return ''.join(f' {name}="{escape(value)}"' for name, value in result)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif not self._skip_depth and tag in ALLOWED_TAGS:
+            self.parts.append(f'<{tag}{self._attrs(tag, attrs)}>')
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif not self._skip_depth and tag in ALLOWED_TAGS and tag not in VOID_TAGS:
+            self.parts.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(escape(data))
+
+
+class _ImageCollector(HTMLParser):
+    """
+    Собирает адреса изображений документа.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.images = []
+
+    def handle_starttag(self, tag, attrs):
+        src = dict(attrs).get('src') if tag == 'img' else None
+        if src:
+            self.images.append(src)
+
+
+def image_sources(html):
+    """
+    Возвращает список адресов изображений (<img src>) в HTML.
+    """
+    if not html or '<img' not in html:
+        return []
+    parser = _ImageCollector()
+    parser.feed(html)
+    parser.close()
+    return parser.images
+
+
+def sanitize_html(html, image_variants=None):
+    """
+    Очищает HTML от опасных тегов, атрибутов и ссылок.
+    image_variants — словарь {адрес изображения: атрибуты <img>} с готовыми вариантами изображений.
+    Возвращает пару (очищенный HTML, список адресов изображений).
+    """
+    parser = _Sanitizer(image_variants)
+    parser.feed(html or '')
+    parser.close()
+    return ''.join(parser.parts), parser.images
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """
+    Обрезает текст до length символов по границе слова.
+    """
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(' ', 1)[0] + '…'
+
+
+def content_hash(html):
+    """
+    Хеш исходного HTML и версии правил очистки: по нему определяется,
+    нужно ли заново строить производные поля.
+    """
+    return hashlib.sha256(f'{RENDER_VERSION}:{html or ""}'.encode()).hexdigest()
+
+
+def render_content(html, image_variants=None):
+    """
+    Вычисляет все производные представления HTML из CKEditor.
+    Вызывается один раз при сохранении, а не при каждом показе страницы.
+    """
+    safe_html, images = sanitize_html(html, image_variants)
+    text = html_to_text(html)
+    return {
+        'content_html': safe_html,
+        'excerpt': make_excerpt(text),
+        'word_count': len(text.split()),
+        'image_refs': images,
+        'content_hash': content_hash(html),
+    }
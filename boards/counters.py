@@ -0,0 +1,81 @@
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Board, Post, Response
+
+
+def increment_board_counters(lookup, posts=0, responses=0, activity_at=None, touched_at=None):
+    """
+    Атомарно изменяет счетчики доски через F()-выражения, без чтения строки в Python.
+    lookup — условие выбора доски, например {'pk': board_id} или {'posts': post_id}.
+    touched_at — новое время изменения доски (updated_at); auto_now при update() не срабатывает.
+    """
+    updates = {}
+    queryset = Board.objects.filter(**lookup)
+    if posts:
+        updates['post_count'] = F('post_count') + posts
+        if posts < 0:
+            # PositiveIntegerField не допускает отрицательных значений.
+            queryset = queryset.filter(post_count__gte=-posts)
+    if responses:
+        updates['response_count'] = F('response_count') + responses
+        if responses < 0:
+            queryset = queryset.filter(response_count__gte=-responses)
+    if activity_at is not None:
+        updates['last_activity_at'] = activity_at
+    if touched_at is not None:
+        updates['updated_at'] = touched_at
+    if updates:
+        queryset.update(**updates)
+
+
+def increment_post_response_count(post_id, delta, touched_at=None):
+    """
+    Атомарно изменяет денормализованный счетчик откликов поста.
+    touched_at — новое время изменения поста (updated_at); при delta=0 меняется только оно.
+    """
+    updates = {}
+    queryset = Post.objects.filter(pk=post_id)
+    if delta:
+        updates['response_count'] = F('response_count') + delta
+        if delta < 0:
+            queryset = queryset.filter(response_count__gte=-delta)
+    if touched_at is not None:
+        updates['updated_at'] = touched_at
+    if updates:
+        queryset.update(**updates)
+
+
+def board_counter_expressions():
+    """
+    Выражения, вычисляющие точные значения счетчиков доски из постов и откликов.
+    """
+    posts = Post.objects.filter(board_id=OuterRef('pk')).order_by().values('board_id')
+    responses = Response.objects.filter(post__board_id=OuterRef('pk')).order_by().values('post__board_id')
+    last_post = Subquery(posts.annotate(m=Max('created_at')).values('m'))
+    last_response = Subquery(responses.annotate(m=Max('created_at')).values('m'))
+    return {
+        'post_count': Coalesce(Subquery(posts.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), 0),
+        'response_count': Coalesce(Subquery(responses.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), 0),
+        # Greatest() в SQLite возвращает NULL, если хотя бы один аргумент NULL.
+        'last_activity_at': Greatest(Coalesce(last_post, last_response), Coalesce(last_response, last_post)),
+    }
+
+
+def reconcile_board_counters(chunk_size=500):
+    """
+    Пересчитывает счетчики всех досок порциями по chunk_size досок.
+    Каждая порция — один короткий UPDATE, поэтому блокировка записи не держится долго.
+    Генерирует количество обработанных досок после каждой порции.
+    """
+    expressions = board_counter_expressions()
+    last_pk = 0
+    while True:
+        ids = list(
+            Board.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return
+        Board.objects.filter(pk__in=ids).update(**expressions)
+        last_pk = ids[-1]
+        yield len(ids)
@@ -0,0 +1,282 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+from PIL import Image, ImageOps
+
+from .models import Post, Response, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+# Настройки по умолчанию; переопределяются словарем IMAGE_PIPELINE в settings.py.
+DEFAULTS = {
+    'WORKERS': 2,                # Потоков фоновой обработки в процессе сайта.
+    'WIDTHS': {                  # Ширины WebP-вариантов для srcset.
+        'thumbnail': 320,
+        'medium': 960,
+        'large': 1600,
+    },
+    'FALLBACK_WIDTH': 960,       # Ширина перекодированного оригинала для браузеров без WebP.
+    'MAX_PIXELS': 50_000_000,    # Изображения большего разрешения не обрабатываются (защита памяти).
+    'WEBP_QUALITY': 80,
+    'JPEG_QUALITY': 82,
+    'VARIANTS_DIR': 'variants/',  # Каталог вариантов внутри MEDIA_ROOT.
+}
+
+# Расширения файлов, которые считаются изображениями при сканировании медиафайлов.
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_config():
+    """
+    Возвращает настройки обработки изображений с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_PIPELINE', {})}
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_config()['WORKERS'], thread_name_prefix='image-pipeline'
+            )
+        return _executor
+
+
+def register_upload(path, size=0):
+    """
+    Регистрирует загруженное изображение и ставит его в очередь фоновой обработки
+    после фиксации транзакции. Повторно загруженное (уже обработанное) изображение
+    в очередь не ставится. Возвращает запись UploadedImage.
+    """
+    image, _ = UploadedImage.objects.get_or_create(path=path, defaults={'size': size})
+    if image.status == UploadedImage.STATUS_PENDING:
+        transaction.on_commit(lambda: enqueue(image.pk))
+    return image
+
+
+def enqueue(pk):
+    """
+    Отправляет изображение в пул фоновой обработки, не дожидаясь результата.
+    Если процесс завершится раньше, изображение обработает команда backfill_image_variants.
+    """
+    _get_executor().submit(_process_in_background, pk)
+
+
+def _process_in_background(pk):
+    close_old_connections()
+    try:
+        image = UploadedImage.objects.filter(pk=pk, status=UploadedImage.STATUS_PENDING).first()
+        if image is not None:
+            process_image(image)
+    except Exception:
+        logger.exception('Обработка изображения #%s прервана', pk)
+    finally:
+        close_old_connections()
+
+
+def _variant_path(image, name, extension):
+    stem, _ = os.path.splitext(image.path)
+    return f"{get_config()['VARIANTS_DIR']}{stem}-{name}.{extension}"
+
+
+def _save(path, data):
+    # Имена вариантов детерминированы: при повторной обработке старый файл заменяется.
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    return default_storage.save(path, ContentFile(data))
+
+
+def _encode(picture, fmt, config):
+    buffer = BytesIO()
+    if fmt == 'WEBP':
+        picture.save(buffer, 'WEBP', quality=config['WEBP_QUALITY'], method=6)
+    elif fmt == 'JPEG':
+        picture.convert('RGB').save(buffer, 'JPEG', quality=config['JPEG_QUALITY'], optimize=True, progressive=True)
+    else:
+        picture.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _resized(picture, width):
+    if width >= picture.width:
+        return picture
+    height = max(1, round(picture.height * width / picture.width))
+    # reducing_gap: сначала быстрое целочисленное уменьшение (Image.reduce), затем LANCZOS
+    # на изображении, лишь в несколько раз большем результата.
+    return picture.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+
+# Значения EXIF Orientation, при которых exif_transpose меняет местами ширину и высоту.
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def _open(source, config):
+    """
+    Открывает изображение, проверяя разрешение по заголовку до декодирования пикселей.
+    Возвращает (изображение, ширина, высота оригинала с учетом EXIF-поворота).
+    """
+    picture = Image.open(source)
+    width, height = picture.size
+    if width * height > config['MAX_PIXELS']:
+        raise ValueError(
+            f"Разрешение {width}×{height} больше допустимых {config['MAX_PIXELS']} пикселей."
+        )
+    rotated = picture.getexif().get(0x0112) in _ROTATED_ORIENTATIONS
+    if rotated:
+        width, height = height, width
+    # JPEG декодируется сразу в уменьшенном в 2-8 раз масштабе, если самый широкий
+    # вариант это позволяет: память и время декодирования падают квадратично.
+    largest = min(max(*config['WIDTHS'].values(), config['FALLBACK_WIDTH']), width)
+    needed = (largest, -(-height * largest // width))
+    picture.draft(None, needed[::-1] if rotated else needed)
+    return picture, width, height
+
+
+def make_variants(image):
+    """
+    Создает варианты изображения: WebP для каждой ширины из WIDTHS (не больше оригинала)
+    и перекодированный оригинал шириной не более FALLBACK_WIDTH. Анимированные изображения
+    не трогаются; изображения больше MAX_PIXELS отклоняются с ValueError.
+    Возвращает кортеж (ширина, высота оригинала, список вариантов).
+    """
+    config = get_config()
+    with default_storage.open(image.path, 'rb') as source:
+        picture, original_width, original_height = _open(source, config)
+        if getattr(picture, 'is_animated', False):
+            return original_width, original_height, []
+        picture = ImageOps.exif_transpose(picture)
+        picture.load()
+
+    has_alpha = picture.mode in ('RGBA', 'LA') or (picture.mode == 'P' and 'transparency' in picture.info)
+    if has_alpha:
+        picture = picture.convert('RGBA')
+        # Скриншоты часто сохраняются с полностью непрозрачным альфа-каналом.
+        has_alpha = picture.getchannel('A').getextrema()[0] < 255
+    picture = picture.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = []
+    produced = set()
+    for name, width in sorted(config['WIDTHS'].items(), key=lambda item: item[1]):
+        width = min(width, picture.width)
+        if width in produced:
+            continue
+        produced.add(width)
+        resized = _resized(picture, width)
+        data = _encode(resized, 'WEBP', config)
+        variants.append({
+            'name': name, 'path': _save(_variant_path(image, name, 'webp'), data),
+            'width': resized.width, 'height': resized.height, 'format': 'WEBP', 'size': len(data),
+        })
+
+    # Без прозрачности JPEG в разы меньше PNG (особенно для скриншотов).
+    fmt, extension = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+    resized = _resized(picture, config['FALLBACK_WIDTH'])
+    data = _encode(resized, fmt, config)
+    variants.append({
+        'name': 'fallback', 'path': _save(_variant_path(image, 'fallback', extension), data),
+        'width': resized.width, 'height': resized.height, 'format': fmt, 'size': len(data),
+    })
+    return original_width, original_height, variants
+
+
+def process_image(image):
+    """
+    Создает варианты изображения и переписывает HTML постов и откликов, в которых оно встречается.
+    Ошибка обработки сохраняется в записи; страницы продолжают показывать оригинал.
+    Возвращает True при успехе.
+    """
+    try:
+        width, height, variants = make_variants(image)
+    except Exception as e:
+        UploadedImage.objects.filter(pk=image.pk).update(
+            status=UploadedImage.STATUS_FAILED, error=str(e), processed_at=timezone.now()
+        )
+        logger.exception("Не удалось обработать изображение '%s'", image.path)
+        return False
+
+    image.width, image.height, image.variants = width, height, variants
+    image.status, image.error, image.processed_at = UploadedImage.STATUS_READY, '', timezone.now()
+    if not image.size and default_storage.exists(image.path):
+        image.size = default_storage.size(image.path)
+    image.save(update_fields=['width', 'height', 'variants', 'status', 'error', 'processed_at', 'size'])
+    rerender_referencing(image)
+    return True
+
+
+def rerender_referencing(image):
+    """
+    Пересчитывает очищенный HTML постов и откликов, ссылающихся на изображение,
+    чтобы в нем появились srcset и размеры. Возвращает количество обновленных объектов.
+    """
+    condition = Q(content__contains=image.path) | Q(content__contains=filepath_to_uri(image.path))
+    updated = 0
+    for model, extra in ((Post, 'board_id'), (Response, 'post_id')):
+        objects = model.objects.filter(condition).only('pk', 'content', extra, *model.RENDERED_FIELDS)
+        for obj in objects.iterator():
+            obj.render_content(force=True)
+            # updated_at меняет ETag страниц; сохранение сбрасывает кеш страниц (см. signals.py).
+            obj.save(update_fields=[*model.RENDERED_FIELDS, 'updated_at'])
+            updated += 1
+    return updated
+
+
+def pending_images(batch_size=100, retry_failed=False):
+    """
+    Генератор необработанных изображений по возрастанию id порциями по batch_size.
+    """
+    statuses = [UploadedImage.STATUS_PENDING]
+    if retry_failed:
+        statuses.append(UploadedImage.STATUS_FAILED)
+    last_pk = 0
+    while True:
+        batch = list(UploadedImage.objects.filter(status__in=statuses, pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        yield from batch
+
+
+def scan_media(directory=''):
+    """
+    Генератор путей изображений в хранилище, кроме каталога вариантов.
+    """
+    variants_dir = get_config()['VARIANTS_DIR'].strip('/')
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            yield f'{directory}{name}'
+    for name in directories:
+        path = f'{directory}{name}'
+        if path != variants_dir:
+            yield from scan_media(f'{path}/')
+
+
+def served_bytes(url, images, viewport=1280):
+    """
+    Оценивает, сколько байт браузер загрузит для изображения по адресу url:
+    без вариантов — оригинал, с вариантами — наименьший WebP не уже слота sizes.
+    images — словарь {путь в хранилище: UploadedImage}. Возвращает пару (до, после).
+    """
+    image = images.get(UploadedImage.path_from_url(url) or '')
+    if image is None:
+        return 0, 0
+    webp = sorted((v for v in image.variants if v['format'] == 'WEBP'), key=lambda v: v['width'])
+    if image.status != UploadedImage.STATUS_READY or not webp:
+        return image.size, image.size
+    slot = min(viewport, webp[-1]['width'])
+    chosen = next((v for v in webp if v['width'] >= slot), webp[-1])
+    return image.size, chosen['size']
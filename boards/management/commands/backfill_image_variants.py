@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from boards import images
+from boards.models import Post, Response, UploadedImage
+
+
+class Command(BaseCommand):
+    """
+    Создает варианты для изображений, загруженных до появления конвейера (см. boards/images.py),
+    и для изображений, обработка которых не завершилась (например, процесс сайта перезапустился).
+    В конце выводит, сколько байт изображений загружает страница поста до и после.
+    """
+    help = 'Регистрирует существующие медиафайлы, создает их варианты и сравнивает объем изображений страниц.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Количество потоков обработки.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Количество изображений в одной порции.')
+        parser.add_argument('--retry-failed', action='store_true', help='Повторить изображения с ошибкой обработки.')
+        parser.add_argument('--no-scan', action='store_true', help='Не искать новые файлы в хранилище.')
+        parser.add_argument('--report-only', action='store_true', help='Только вывести отчет об объеме изображений.')
+        parser.add_argument('--viewport', type=int, default=1280, help='Ширина окна браузера для отчета, px.')
+        parser.add_argument('--top', type=int, default=20, help='Количество страниц в отчете.')
+
+    def handle(self, *args, **options):
+        if not options['report_only']:
+            if not options['no_scan']:
+                self._register_existing(options['batch_size'])
+            self._process(options)
+        self._report(options['viewport'], options['top'])
+
+    def _register_existing(self, batch_size):
+        known = set(UploadedImage.objects.values_list('path', flat=True))
+        batch = []
+        registered = 0
+        for path in images.scan_media():
+            if path in known:
+                continue
+            batch.append(UploadedImage(path=path, size=default_storage.size(path)))
+            if len(batch) >= batch_size:
+                UploadedImage.objects.bulk_create(batch, ignore_conflicts=True)
+                registered += len(batch)
+                batch = []
+        if batch:
+            UploadedImage.objects.bulk_create(batch, ignore_conflicts=True)
+            registered += len(batch)
+        self.stdout.write(f'Найдено новых изображений: {registered}')
+
+    def _process(self, options):
+        workers = options['workers'] or images.get_config()['WORKERS']
+
+        def run(image):
+            close_old_connections()
+            try:
+                return images.process_image(image)
+            finally:
+                close_old_connections()
+
+        done = failed = 0
+        pending = images.pending_images(options['batch_size'], retry_failed=options['retry_failed'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for ok in executor.map(run, pending):
+                done += ok
+                failed += not ok
+                if (done + failed) % options['batch_size'] == 0:
+                    self.stdout.write(f'Обработано изображений: {done + failed}')
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {done}, ошибок: {failed}.'))
+
+    def _report(self, viewport, top):
+        pages = {}
+        for pk, title, refs in Post.objects.exclude(image_refs=[]).values_list('pk', 'title', 'image_refs'):
+            pages[pk] = [title, list(refs)]
+        for post_id, refs in Response.objects.exclude(image_refs=[]).values_list('post_id', 'image_refs'):
+            if post_id not in pages:
+                pages[post_id] = [Post.objects.filter(pk=post_id).values_list('title', flat=True).first(), []]
+            pages[post_id][1].extend(refs)
+        if not pages:
+            self.stdout.write('Нет постов с изображениями.')
+            return
+
+        paths = {UploadedImage.path_from_url(url) for _, refs in pages.values() for url in refs} - {None}
+        known = {image.path: image for image in UploadedImage.objects.filter(path__in=paths)}
+        rows = []
+        for pk, (title, refs) in pages.items():
+            before = after = 0
+            for url in refs:
+                original, served = images.served_bytes(url, known, viewport)
+                before += original
+                after += served
+            rows.append((before, after, pk, title))
+        rows.sort(reverse=True)
+
+        self.stdout.write(f'Байт изображений на странице поста (окно {viewport}px):')
+        for before, after, pk, title in rows[:top]:
+            self.stdout.write(f'  #{pk} {title[:40]}: {before / 1024:.0f} КиБ → {after / 1024:.0f} КиБ')
+        total_before = sum(row[0] for row in rows)
+        total_after = sum(row[1] for row in rows)
+        saved = 100 * (1 - total_after / total_before) if total_before else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Страниц с изображениями: {len(rows)}; в среднем {total_before / len(rows) / 1024:.0f} КиБ → '
+            f'{total_after / len(rows) / 1024:.0f} КиБ на страницу (−{saved:.0f}%).'
+        ))
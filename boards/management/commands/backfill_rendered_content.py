@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from boards.models import Post, Response, RenderedContentModel
+from boards.storage import update_references
+
+
+class Command(BaseCommand):
+    """
+    Заполняет производные поля содержимого (очищенный HTML, выдержка, метаданные)
+    для постов и откликов, сохраненных до появления конвейера или в обход save().
+    """
+    help = 'Пересчитывает очищенный HTML, выдержку и метаданные постов и откликов порциями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество строк в одной порции.')
+        parser.add_argument('--force', action='store_true', help='Пересчитать даже неизмененное содержимое.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Post, Response):
+            updated = 0
+            batch = []
+            queryset = model.objects.only('pk', 'content', 'content_hash', 'image_refs').order_by('pk')
+            for obj in queryset.iterator(chunk_size=batch_size):
+                if options['force']:
+                    obj.content_hash = ''
+                if not obj.render_content():
+                    continue
+                # bulk_update не отправляет сигналы: изменение ссылок на изображения учитывается здесь.
+                change = obj.pop_image_refs_change()
+                if change is not None:
+                    update_references(*change)
+                batch.append(obj)
+                if len(batch) >= batch_size:
+                    model.objects.bulk_update(batch, RenderedContentModel.RENDERED_FIELDS)
+                    updated += len(batch)
+                    batch = []
+                    self.stdout.write(f'{model._meta.verbose_name_plural}: обновлено {updated}')
+            if batch:
+                model.objects.bulk_update(batch, RenderedContentModel.RENDERED_FIELDS)
+                updated += len(batch)
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: обновлено {updated}.'))
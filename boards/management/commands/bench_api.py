@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from boards.models import Post
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает размер ответа и задержку JSON API с HTML-страницами, которые клиенты разбирали раньше.
+    Кеш страниц отключается, чтобы сравнивать стоимость построения ответа.
+    """
+    help = 'Измеряет размер ответа и задержку API /api/v1/ и соответствующих HTML-страниц.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', type=int, help='ID поста (по умолчанию пост с наибольшим числом откликов).')
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов на каждый адрес.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('pk', 'board_id')
+        post = posts.filter(pk=options['post']).first() if options['post'] else posts.order_by('-response_count').first()
+        if post is None:
+            raise CommandError('Нет постов для измерения. Создайте пост или укажите --post.')
+
+        pairs = [
+            ('Посты доски', reverse('boards:posts_by_board', args=[post.board_id]),
+             reverse('api:board_posts', args=[post.board_id])),
+            ('Пост', reverse('boards:post_detail', args=[post.board_id, post.pk]),
+             reverse('api:post_detail', args=[post.pk])),
+            ('Отклики', reverse('boards:post_responses', args=[post.board_id, post.pk]),
+             reverse('api:post_responses', args=[post.pk])),
+        ]
+        client = Client()
+        with override_settings(PAGE_CACHE={'ENABLED': False}, ALLOWED_HOSTS=['testserver']):
+            for label, html_url, api_url in pairs:
+                self.stdout.write(label)
+                variants = [('HTML', html_url), ('API', api_url), ('API ?fields=id,title', f'{api_url}?fields=id,title')]
+                for kind, url in variants:
+                    size, latency = self._measure(client, url, options['requests'])
+                    self.stdout.write(f'  {kind}: {size} байт, медиана {latency:.2f} мс')
+
+    def _measure(self, client, url, count):
+        timings = []
+        size = 0
+        for number in range(count):
+            # Разные адреса клиентов, чтобы измерение не упиралось в ограничение частоты API.
+            remote_addr = f'10.0.{number // 256 % 256}.{number % 256}'
+            started = time.perf_counter()
+            response = client.get(url, REMOTE_ADDR=remote_addr)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: код ответа {response.status_code}.')
+            size = len(response.content)
+        return size, statistics.median(timings)
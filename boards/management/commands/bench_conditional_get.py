@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from boards.models import Board, Post
+
+
+class Command(BaseCommand):
+    """
+    Воспроизводит обход сайта поисковым роботом: список досок, страницы досок и постов.
+    Сравнивает повторный обход без заголовков If-None-Match / If-Modified-Since
+    и с ними (ответы 304) по объему переданных данных и процессорному времени.
+    """
+    help = 'Измеряет экономию трафика и CPU от условных GET-запросов при повторном обходе сайта.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=200, help='Сколько постов включить в обход.')
+        parser.add_argument('--rounds', type=int, default=5, help='Количество повторных обходов.')
+
+    def handle(self, *args, **options):
+        urls = [reverse('boards:list')]
+        urls += [reverse('boards:posts_by_board', args=[pk]) for pk in Board.objects.values_list('pk', flat=True)]
+        urls += [
+            reverse('boards:post_detail', args=[board_id, pk])
+            for pk, board_id in Post.objects.values_list('pk', 'board_id')[:options['posts']]
+        ]
+        client = Client()
+
+        for cache_label, cache_enabled in (('кеш страниц включен', True), ('кеш страниц выключен', False)):
+            self.stdout.write(cache_label.capitalize())
+            with override_settings(ALLOWED_HOSTS=['testserver'], PAGE_CACHE={'ENABLED': cache_enabled}):
+                self._replay(client, urls, options['rounds'])
+
+    def _replay(self, client, urls, rounds):
+        # Первый обход: робот запоминает валидаторы каждой страницы.
+        validators = {}
+        for url in urls:
+            response = client.get(url)
+            validators[url] = {
+                'HTTP_IF_NONE_MATCH': response.get('ETag', ''),
+                'HTTP_IF_MODIFIED_SINCE': response.get('Last-Modified', ''),
+            }
+
+        for label, conditional in (('без условных заголовков', False), ('с If-None-Match', True)):
+            sent = not_modified = 0
+            started_cpu, started = time.process_time(), time.perf_counter()
+            for _ in range(rounds):
+                for url in urls:
+                    response = client.get(url, **(validators[url] if conditional else {}))
+                    sent += len(response.content)
+                    not_modified += response.status_code == 304
+            cpu, elapsed = time.process_time() - started_cpu, time.perf_counter() - started
+            self.stdout.write(
+                f'  Обход {label}: {len(urls) * rounds} запросов, передано {sent / 1024:.1f} КиБ, '
+                f'ответов 304: {not_modified}, CPU {cpu:.2f} с, время {elapsed:.2f} с'
+            )
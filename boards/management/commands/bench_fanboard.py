@@ -0,0 +1,77 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from boards.benchmark import SCENARIOS, WRITE_SCENARIOS, Sample, environment, run_scenario
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный прогон основных страниц фанборда через тестовый клиент Django в нескольких потоках.
+    Результат — JSON с перцентилями задержки, пропускной способностью и числом SQL-запросов
+    по каждому сценарию; файлы разных коммитов удобно сравнивать между собой.
+    Данные для прогона создаются командой seed_fanboard.
+    """
+    help = 'Замеряет задержку, пропускную способность и число SQL-запросов основных сценариев и выводит JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество шагов каждого сценария.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Количество параллельных потоков.')
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS,
+                            help='Запускаемые сценарии (по умолчанию все).')
+        parser.add_argument('--no-writes', action='store_true', help='Пропустить сценарии, изменяющие данные.')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Не отключать кеш страниц (по умолчанию замеряется сама генерация страниц).')
+        parser.add_argument('--warmup', type=int, default=10, help='Шагов прогрева каждого сценария без замера.')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел.')
+        parser.add_argument('--output', help='Файл для JSON-результата (по умолчанию вывод в консоль).')
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios']
+                     if not (options['no_writes'] and name in WRITE_SCENARIOS)]
+        overrides = {
+            'ALLOWED_HOSTS': ['testserver'],
+            # Письма с кодами не отправляются: замеряется только работа сайта.
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        }
+        if not options['page_cache']:
+            overrides['PAGE_CACHE'] = {**settings.PAGE_CACHE, 'ENABLED': False}
+
+        with override_settings(**overrides):
+            try:
+                sample = Sample(seed=options['seed'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            results = {}
+            for name in scenarios:
+                if options['warmup']:
+                    run_scenario(name, sample, options['warmup'], 1, seed=options['seed'])
+                results[name] = run_scenario(name, sample, options['requests'], options['concurrency'],
+                                             seed=options['seed'])
+                self.stderr.write(
+                    f'{name}: {results[name]["throughput_rps"]} з/с, '
+                    f'p95 {results[name]["latency_ms"]["p95"]} мс, '
+                    f'SQL {results[name]["queries"]["mean"]}, ошибок {results[name]["errors"]}'
+                )
+
+        report = json.dumps({'meta': self._meta(options), 'scenarios': results}, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Результат записан в {options["output"]}.'))
+        else:
+            self.stdout.write(report)
+
+    def _meta(self, options):
+        return {
+            **environment(),
+            'options': {
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'page_cache': options['page_cache'],
+            },
+        }
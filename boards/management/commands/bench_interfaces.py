@@ -0,0 +1,85 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from boards.benchmark import INTERFACES, READ_SCENARIOS, Sample, SlowDatabase, environment, read_paths, run_interface
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает обслуживание страниц для чтения через WSGI и ASGI при одинаковом числе рабочих потоков.
+    Множество клиентов одновременно читают доски и посты; к каждому SQL-запросу добавляется
+    задержка --io-delay, как у базы по сети. Под WSGI запрос занимает рабочий поток все время
+    ожидания базы, под ASGI асинхронные представления ждут базу, не занимая цикл событий.
+    Каждый интерфейс обслуживает свои варианты страниц, как в работе: WSGI — синхронные
+    представления (ROOT_URLCONF), ASGI — асинхронные (ASGI_URLCONF).
+    Обработчики Django вызываются в процессе, без HTTP-сервера: сравнивается сама обработка запроса.
+    Данные для прогона создаются командой seed_fanboard.
+    """
+    help = 'Сравнивает задержку и пропускную способность страниц для чтения под WSGI и ASGI и выводит JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов каждого сценария.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Количество одновременных клиентов.')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Рабочих потоков: у WSGI-сервера и в пуле потоков цикла событий ASGI.')
+        parser.add_argument('--io-delay', type=float, default=20,
+                            help='Задержка каждого SQL-запроса в миллисекундах (0 — без задержки).')
+        parser.add_argument('--interfaces', nargs='+', choices=INTERFACES, default=INTERFACES,
+                            help='Сравниваемые интерфейсы (по умолчанию оба).')
+        parser.add_argument('--scenarios', nargs='+', choices=READ_SCENARIOS, default=READ_SCENARIOS,
+                            help='Запускаемые сценарии (по умолчанию все).')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Не отключать кеш страниц (по умолчанию замеряется сама генерация страниц).')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел.')
+        parser.add_argument('--output', help='Файл для JSON-результата (по умолчанию вывод в консоль).')
+
+    def handle(self, *args, **options):
+        overrides = {
+            'ALLOWED_HOSTS': ['testserver'],
+            # С задержкой базы каждый запрос медленный; журнал медленных запросов не нужен.
+            'INSTRUMENTATION': {**getattr(settings, 'INSTRUMENTATION', {}), 'LOG': False},
+        }
+        if not options['page_cache']:
+            overrides['PAGE_CACHE'] = {**settings.PAGE_CACHE, 'ENABLED': False}
+
+        with override_settings(**overrides):
+            try:
+                sample = Sample(seed=options['seed'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            results = {interface: {} for interface in options['interfaces']}
+            with SlowDatabase(options['io_delay'] / 1000):
+                for name in options['scenarios']:
+                    paths = read_paths(name, sample, options['requests'], seed=options['seed'])
+                    for interface in options['interfaces']:
+                        result = run_interface(interface, paths, options['concurrency'], options['workers'])
+                        results[interface][name] = result
+                        self.stderr.write(
+                            f'{interface} {name}: {result["throughput_rps"]} з/с, '
+                            f'p95 {result["latency_ms"]["p95"]} мс, потоков {result["peak_threads"]}, '
+                            f'ошибок {result["errors"]}'
+                        )
+
+        report = json.dumps({'meta': self._meta(options), 'interfaces': results}, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Результат записан в {options["output"]}.'))
+        else:
+            self.stdout.write(report)
+
+    def _meta(self, options):
+        return {
+            **environment(),
+            'options': {
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'workers': options['workers'],
+                'io_delay_ms': options['io_delay'],
+                'page_cache': options['page_cache'],
+                'seed': options['seed'],
+            },
+        }
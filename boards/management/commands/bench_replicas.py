@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+from django.test import override_settings
+
+from boards.models import Board, Post
+from myfanboard_project.sqlite import database_config
+
+
+class Command(BaseCommand):
+    """
+    Измеряет пропускную способность чтения списка постов доски при разном количестве реплик.
+    Реплики — копии рабочей базы во временном каталоге; запросы распределяет PrimaryReplicaRouter.
+    Параллельно поток записи обновляет счетчик просмотров в основной базе, как на живом сайте:
+    без WAL его блокировки задерживают чтение с основной базы, но не с реплик.
+    """
+    help = 'Измеряет чтений в секунду через роутер реплик при 0..N репликах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replicas', type=int, default=3, help='Максимальное количество реплик.')
+        parser.add_argument('--threads', type=int, default=8, help='Количество параллельных потоков.')
+        parser.add_argument('--seconds', type=float, default=3, help='Длительность каждого замера.')
+        parser.add_argument('--no-writer', action='store_true', help='Не запускать поток записи.')
+
+    def handle(self, *args, **options):
+        board_id = Board.objects.values_list('pk', flat=True).first()
+        if board_id is None:
+            raise CommandError('Нет досок для измерения. Создайте хотя бы одну доску.')
+        source = settings.DATABASES['default']['NAME']
+
+        with tempfile.TemporaryDirectory() as directory:
+            aliases = []
+            for number in range(1, options['replicas'] + 1):
+                alias = f'bench_replica_{number}'
+                path = os.path.join(directory, f'{alias}.sqlite3')
+                shutil.copyfile(source, path)
+                connections.settings[alias] = connections.configure_settings({
+                    'default': settings.DATABASES['default'],
+                    alias: database_config(path, production=settings.SQLITE_PRODUCTION_MODE),
+                })[alias]
+                aliases.append(alias)
+            try:
+                for count in range(options['replicas'] + 1):
+                    with override_settings(DATABASE_ROUTING={'REPLICAS': aliases[:count]}):
+                        reads = self._run(
+                            board_id, options['threads'], options['seconds'], with_writer=not options['no_writer']
+                        )
+                    label = f'Реплик: {count}' if count else 'Только основная база'
+                    self.stdout.write(f'{label}: {reads / options["seconds"]:.0f} чтений/с')
+            finally:
+                for alias in aliases:
+                    del connections.settings[alias]
+
+    def _run(self, board_id, threads, seconds, with_writer):
+        counts = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads + with_writer)
+        post_id = Post.objects.filter(board_id=board_id).values_list('pk', flat=True).first()
+
+        def writer():
+            barrier.wait()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                try:
+                    with transaction.atomic():
+                        Post.objects.filter(pk=post_id).update(views=F('views') + 1)
+                        time.sleep(0.005)  # Транзакция записи, занимающая несколько миллисекунд.
+                except OperationalError:
+                    pass
+            connections.close_all()
+
+        def worker():
+            reads = 0
+            barrier.wait()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                # Тот же запрос, что и на странице доски; база выбирается роутером.
+                list(
+                    Post.objects.filter(board_id=board_id)
+                    .select_related('author')
+                    .only('id', 'title', 'excerpt', 'created_at', 'views', 'board_id', 'author__username')
+                    .order_by('-created_at', '-id')[:20]
+                )
+                reads += 1
+            connections.close_all()
+            with lock:
+                counts.append(reads)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        if with_writer:
+            workers.append(threading.Thread(target=writer))
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sum(counts)
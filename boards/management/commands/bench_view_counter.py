@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from boards.models import Post
+from boards.view_counter import view_counter
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает пропускную способность post_detail для одного «горячего» поста
+    с немедленной записью просмотров и с буфером отложенной записи.
+    """
+    help = 'Измеряет запросы в секунду к post_detail с буферизацией счетчика просмотров и без нее.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--post', type=int, help='ID поста (по умолчанию самый новый).')
+        parser.add_argument('--requests', type=int, default=500, help='Количество запросов в каждом режиме.')
+
+    def handle(self, *args, **options):
+        post = Post.objects.filter(pk=options['post']).first() if options['post'] else Post.objects.first()
+        if post is None:
+            raise CommandError('Нет постов для измерения. Создайте пост или укажите --post.')
+        url = reverse('boards:post_detail', args=[post.board_id, post.pk])
+        client = Client()
+
+        for label, enabled in (('Немедленная запись', False), ('Буфер отложенной записи', True)):
+            with override_settings(VIEW_COUNTER={'ENABLED': enabled, 'FLUSH_THRESHOLD': 10 ** 9},
+                                   PAGE_CACHE={'ENABLED': False}, ALLOWED_HOSTS=['testserver']):
+                client.get(url)  # Прогрев.
+                started = time.perf_counter()
+                for _ in range(options['requests']):
+                    client.get(url)
+                view_counter.flush()
+                elapsed = time.perf_counter() - started
+            self.stdout.write(f'{label}: {options["requests"] / elapsed:.1f} запросов/с ({elapsed:.2f} с)')
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django_ckeditor_5.storage_utils import get_django_storage
+
+from boards import uploads
+from boards.models import MediaBlob, UploadedImage
+from boards.storage import ContentAddressedStorage, recount_references
+
+
+class Command(BaseCommand):
+    """
+    Удаляет файлы хранилища с адресацией по содержимому, на которые не ссылается ни один пост
+    или отклик дольше UPLOADS['UNREFERENCED_TTL'] секунд: загрузки, так и не попавшие в содержимое,
+    и изображения удаленного или отредактированного содержимого. Вместе с файлом удаляются
+    его варианты и запись UploadedImage.
+    Отсрочка нужна, чтобы не удалить изображение, которое только что загружено в редактор,
+    но еще не сохранено в посте.
+    """
+    help = 'Удаляет файлы медиахранилища без ссылок из постов и откликов и выводит освобожденное место.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='Сначала пересчитать ссылки по image_refs всех постов и откликов.')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать файлы, ничего не удаляя.')
+
+    def handle(self, *args, **options):
+        storage = get_django_storage()
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('CKEDITOR_5_FILE_STORAGE должен указывать на boards.storage.ContentAddressedStorage.')
+        if options['recount']:
+            self.stdout.write(f'Исправлено счетчиков ссылок: {recount_references()}')
+
+        cutoff = timezone.now() - timedelta(seconds=uploads.get_config()['UNREFERENCED_TTL'])
+        candidates = MediaBlob.objects.filter(refcount=0, unreferenced_since__lt=cutoff).order_by('pk')
+        files = freed = 0
+        for blob in candidates.iterator():
+            if not options['dry_run'] and not self._collect(storage, blob, cutoff):
+                continue
+            files += 1
+            freed += blob.size
+            self.stdout.write(blob.path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if options["dry_run"] else "Удалено"} файлов: {files}, '
+            f'{freed / 1024:.0f} КиБ.'
+        ))
+
+    def _collect(self, storage, blob, cutoff):
+        """
+        Удаляет запись, файл и варианты, если ссылок по-прежнему нет. Возвращает True при удалении.
+        """
+        with transaction.atomic():
+            # Условие повторяется в DELETE: пост мог сослаться на файл после выборки.
+            deleted, _ = MediaBlob.objects.filter(pk=blob.pk, refcount=0, unreferenced_since__lt=cutoff).delete()
+            if not deleted:
+                return False
+            image = UploadedImage.objects.filter(path=blob.path).first()
+            if image is not None:
+                image.delete()
+        if image is not None:
+            for variant in image.variants:
+                default_storage.delete(variant['path'])
+        storage.delete(blob.path)
+        return True
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import shutil
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils.encoding import filepath_to_uri
+from django_ckeditor_5.storage_utils import get_django_storage
+
+from boards.images import get_config as get_image_config
+from boards.models import Post, Response, UploadedImage
+from boards.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    """
+    Переносит медиафайлы, загруженные до появления ContentAddressedStorage, в хранилище
+    с адресацией по содержимому: одинаковые файлы сливаются в один, ссылки на старые адреса
+    в постах, откликах и записях изображений заменяются на новые.
+
+    Старые файлы удаляются только после того, как файл по новому адресу создан и все ссылки
+    переписаны. Если команда прервется, повторный запуск найдет оставшиеся старые файлы
+    и доделает перенос.
+    """
+    help = 'Удаляет дубликаты в media/, перенося файлы в хранилище по хешу содержимого, и выводит экономию места.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать дубликаты, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        storage = get_django_storage()
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('CKEDITOR_5_FILE_STORAGE должен указывать на boards.storage.ContentAddressedStorage.')
+
+        groups = defaultdict(list)
+        for path in self._legacy_files(storage):
+            digest, size = self._hash(storage, path)
+            groups[storage.blob_name(digest, os.path.splitext(path)[1])].append((path, digest, size))
+        if not groups:
+            self.stdout.write('Нет файлов для переноса.')
+            return
+
+        files = bytes_before = bytes_after = 0
+        for blob, entries in groups.items():
+            files += len(entries)
+            bytes_before += sum(size for _, _, size in entries)
+            existed = storage.exists(blob)
+            bytes_after += 0 if existed else entries[0][2]
+            if options['dry_run']:
+                continue
+            if not existed:
+                self._place(storage, entries[0][0], blob)
+            # Ссылки на файл считает сохранение переписанного содержимого (см. storage.update_references).
+            storage.add_reference(blob, entries[0][1], entries[0][2], count=0)
+            for path, _, _ in entries:
+                self._relink(storage, path, blob)
+            for path, _, _ in entries:
+                os.remove(storage.path(path))
+            self.stdout.write(f'{blob}: {", ".join(path for path, _, _ in entries)}')
+
+        saved = bytes_before - bytes_after
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет перенесено" if options["dry_run"] else "Перенесено"} файлов: {files}, уникальных: {len(groups)}; '
+            f'{bytes_before / 1024:.0f} КиБ → {bytes_after / 1024:.0f} КиБ '
+            f'(экономия {saved / 1024:.0f} КиБ, {100 * saved / bytes_before if bytes_before else 0:.0f}%).'
+        ))
+
+    def _legacy_files(self, storage, directory=''):
+        """
+        Файлы хранилища, кроме уже перенесенных, временных и вариантов изображений.
+        """
+        skip = {get_image_config()['VARIANTS_DIR'].strip('/'), f'{storage.prefix}/tmp'.strip('/')}
+        blob_pattern = re.compile(
+            rf'^{re.escape(storage.prefix + "/" if storage.prefix else "")}[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.\w+)?$'
+        )
+        directories, files = storage.listdir(directory)
+        for name in files:
+            path = f'{directory}{name}'
+            if not blob_pattern.match(path):
+                yield path
+        for name in directories:
+            path = f'{directory}{name}'
+            if path not in skip:
+                yield from self._legacy_files(storage, f'{path}/')
+
+    def _place(self, storage, path, blob):
+        """
+        Создает файл по новому адресу, не трогая старый: жесткой ссылкой или копией.
+        """
+        target = storage.path(blob)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Временный каталог хранилища не считается старыми файлами при повторном запуске.
+        tmp = os.path.join(storage.temp_dir(), os.path.basename(target))
+        try:
+            os.link(storage.path(path), tmp)
+        except OSError:
+            shutil.copyfile(storage.path(path), tmp)
+        os.replace(tmp, target)
+
+    def _hash(self, storage, path):
+        digest = hashlib.sha256()
+        size = 0
+        with storage.open(path, 'rb') as source:
+            for chunk in source.chunks():
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _relink(self, storage, old, new):
+        """
+        Заменяет ссылки на старый путь: запись изображения и адреса в HTML постов и откликов.
+        """
+        duplicate = UploadedImage.objects.filter(path=old).first()
+        if duplicate is not None:
+            if UploadedImage.objects.filter(path=new).exists():
+                for variant in duplicate.variants:
+                    default_storage.delete(variant['path'])
+                duplicate.delete()
+            else:
+                UploadedImage.objects.filter(pk=duplicate.pk).update(path=new)
+
+        old_urls = {settings.MEDIA_URL + old, settings.MEDIA_URL + filepath_to_uri(old)}
+        pattern = re.compile('|'.join(re.escape(url) for url in old_urls) + r'''(?=["'?#\s)]|$)''')
+        condition = Q(content__contains=old) | Q(content__contains=filepath_to_uri(old))
+        for model in (Post, Response):
+            for obj in model.objects.filter(condition):
+                content = pattern.sub(storage.url(new), obj.content)
+                if content != obj.content:
+                    obj.content = content
+                    obj.save(update_fields=['content', 'updated_at'])
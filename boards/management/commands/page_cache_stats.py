@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from boards.page_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    """
+    Выводит статистику кеша страниц для анонимных пользователей.
+    Счетчики общие для всех рабочих процессов, только если PAGE_CACHE использует общий кеш.
+    """
+    help = 'Показывает количество попаданий, промахов и обходов кеша страниц.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        lookups = stats['hit'] + stats['miss']
+        ratio = stats['hit'] / lookups if lookups else 0
+        self.stdout.write(f"Попадания: {stats['hit']}")
+        self.stdout.write(f"Промахи: {stats['miss']}")
+        self.stdout.write(f"Обходы (авторизованные, сообщения, не GET): {stats['bypass']}")
+        self.stdout.write(f"Доля попаданий: {ratio:.1%}")
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boards import search
+from boards.models import Post, Response
+
+
+class Command(BaseCommand):
+    """
+    Перестраивает полнотекстовый индекс FTS5 по всем постам и откликам.
+    """
+    help = 'Перестраивает полнотекстовый индекс постов и откликов, читая строки порциями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество строк в одной порции.')
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Полнотекстовый поиск доступен только на SQLite с FTS5.')
+        posts = Post.objects.only('title', 'content', 'board_id')
+        responses = Response.objects.select_related('post').only('content', 'post_id', 'post__board_id')
+        total = 0
+        for indexed in search.rebuild_index(posts, responses, batch_size=options['batch_size']):
+            total += indexed
+            self.stdout.write(f'Проиндексировано: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен, объектов: {total}.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from boards.counters import reconcile_board_counters
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает денормализованные счетчики досок (посты, отклики, последняя активность).
+    Используется после сбоя или массового импорта данных в обход сигналов.
+    """
+    help = 'Пересчитывает счетчики post_count, response_count и last_activity_at для всех досок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Количество досок в одной порции.')
+
+    def handle(self, *args, **options):
+        total = 0
+        for processed in reconcile_board_counters(chunk_size=options['chunk_size']):
+            total += processed
+            self.stdout.write(f'Обработано досок: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Счетчики пересчитаны для {total} досок.'))
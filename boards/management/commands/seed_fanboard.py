@@ -0,0 +1,55 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from boards.seeding import Seeder, fast_sqlite
+
+
+class Command(BaseCommand):
+    """
+    Заполняет базу синтетическими данными для нагрузочного тестирования и замеров
+    (например, --users 100000 --boards 1000 --posts 1000000 --responses 10000000).
+    Данные добавляются к существующим; при одинаковом --seed содержимое воспроизводимо.
+    """
+    help = 'Быстро создает пользователей, доски, посты и отклики пакетными вставками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Количество пользователей.')
+        parser.add_argument('--boards', type=int, default=20, help='Количество досок.')
+        parser.add_argument('--posts', type=int, default=10000, help='Количество постов.')
+        parser.add_argument('--responses', type=int, default=100000, help='Количество откликов.')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней распределить даты.')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Количество строк в одной вставке.')
+        parser.add_argument('--index', action='store_true', help='Перестроить полнотекстовый индекс после заполнения.')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['boards'], options['posts']) < 1 or options['responses'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь, доска и пост.')
+        seeder = Seeder(seed=options['seed'], batch_size=options['batch_size'], days=options['days'])
+        started = time.perf_counter()
+        with fast_sqlite():
+            self._run('Пользователи', seeder.seed_users(options['users']), options['users'])
+            self._run('Доски', seeder.seed_boards(options['boards']), options['boards'])
+            self._run('Посты', seeder.seed_posts(options['posts'], options['responses']), options['posts'])
+            self._run('Отклики', seeder.seed_responses(), options['responses'])
+            seeder.update_board_counters()
+        self.stdout.write(self.style.SUCCESS(f'Данные созданы за {time.perf_counter() - started:.1f} с.'))
+        if options['index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+        else:
+            self.stdout.write('Полнотекстовый индекс не обновлялся: запустите rebuild_search_index или --index.')
+
+    def _run(self, label, batches, total):
+        started = time.perf_counter()
+        done = 0
+        reported = 0
+        for inserted in batches:
+            done += inserted
+            # Прогресс примерно каждые 10%.
+            if done - reported >= total / 10 or done == total:
+                reported = done
+                self.stdout.write(f'{label}: {done}/{total}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label}: {done} за {elapsed:.1f} с ({done / elapsed if elapsed else 0:.0f} строк/с)')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boards.models import Newsletter
+from boards.newsletter import send_newsletter, throughput
+
+
+class Command(BaseCommand):
+    """
+    Отправляет поставленные в очередь рассылки и продолжает прерванные.
+    Письма, которые уже отправляет другой процесс (например, фоновый поток админ-панели),
+    повторно не отправляются; письма с ошибкой повторяются, пока не исчерпаны попытки.
+    """
+    help = 'Отправляет рассылки в статусах «В очереди» и «Отправляется», продолжая с неотправленных писем.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--newsletter', type=int, help='ID конкретной рассылки (в очереди или отправляющейся).')
+        parser.add_argument('--workers', type=int, help='Количество параллельных SMTP-соединений.')
+        parser.add_argument('--batch-size', type=int, help='Писем на одно SMTP-соединение.')
+
+    def handle(self, *args, **options):
+        newsletters = Newsletter.objects.filter(status__in=[Newsletter.STATUS_QUEUED, Newsletter.STATUS_SENDING])
+        if options['newsletter']:
+            newsletters = newsletters.filter(pk=options['newsletter'])
+            if not newsletters.exists():
+                raise CommandError(
+                    f'Рассылка #{options["newsletter"]} не найдена или не поставлена в очередь '
+                    '(черновик ставится в очередь действием админ-панели).'
+                )
+        for newsletter in newsletters:
+            self.stdout.write(f'Отправка рассылки "{newsletter.subject}"...')
+            send_newsletter(newsletter, workers=options['workers'], batch_size=options['batch_size'])
+            newsletter.refresh_from_db()
+            self.stdout.write(self.style.SUCCESS(
+                f'Отправлено: {newsletter.sent_count}, ошибок: {newsletter.failed_count}, '
+                f'скорость: {throughput(newsletter):.1f} писем/с.'
+            ))
@@ -0,0 +1,118 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+
+from boards.models import Post, Response
+from myfanboard_project.sqlite import database_config, is_lock_error, retry_on_lock
+
+ALIAS = 'sqlite_stress'
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест SQLite: N потоков одновременно читают «горячий» пост и увеличивают
+    его счетчик просмотров. Тест выполняется на копии базы в обычном и производственном
+    режимах (см. myfanboard_project/sqlite.py), рабочая база не изменяется.
+    """
+    help = 'Сравнивает ошибки блокировки и задержки SQLite в обычном и производственном режимах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Количество параллельных потоков.')
+        parser.add_argument('--operations', type=int, default=300, help='Операций на один поток.')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Доля операций записи.')
+
+    def handle(self, *args, **options):
+        source = settings.DATABASES['default']['NAME']
+        post_id = Post.objects.values_list('pk', flat=True).first()
+        if post_id is None:
+            raise CommandError('Нет постов для измерения. Создайте хотя бы один пост.')
+
+        for label, production in (('Обычный режим', False), ('Производственный режим', True)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'stress.sqlite3')
+                self._copy(source, path)
+                connections.settings[ALIAS] = connections.configure_settings({
+                    'default': settings.DATABASES['default'],
+                    ALIAS: database_config(path, production=production),
+                })[ALIAS]
+                try:
+                    self._report(label, self._run(post_id, production, options))
+                finally:
+                    connections[ALIAS].close()
+                    del connections[ALIAS]
+                    del connections.settings[ALIAS]
+
+    def _copy(self, source, path):
+        """
+        Копирует базу через API резервного копирования SQLite: в копию попадают и страницы,
+        еще не перенесенные из журнала -wal, чего не дает копирование одного файла.
+        """
+        src, dst = sqlite3.connect(source), sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+
+    def _run(self, post_id, production, options):
+        def read():
+            post = Post.objects.using(ALIAS).select_related('author', 'board').get(pk=post_id)
+            Response.objects.using(ALIAS).filter(post_id=post.pk).count()
+
+        def write():
+            # Чтение и запись в одной транзакции, как при обновлении счетчиков поста.
+            with transaction.atomic(using=ALIAS):
+                Post.objects.using(ALIAS).filter(pk=post_id).values_list('views', flat=True).get()
+                Post.objects.using(ALIAS).filter(pk=post_id).update(views=F('views') + 1)
+
+        if production:
+            write = retry_on_lock(write, using=ALIAS)
+
+        barrier = threading.Barrier(options['threads'])
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def worker():
+            rng = random.Random()
+            local_latencies, local_errors = [], 0
+            barrier.wait()
+            for _ in range(options['operations']):
+                operation = write if rng.random() < options['write_ratio'] else read
+                started = time.perf_counter()
+                try:
+                    operation()
+                except OperationalError as e:
+                    if not is_lock_error(e):
+                        raise
+                    local_errors += 1
+                local_latencies.append((time.perf_counter() - started) * 1000)
+            connections[ALIAS].close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, sum(errors), time.perf_counter() - started
+
+    def _report(self, label, result):
+        latencies, errors, elapsed = result
+        latencies.sort()
+        p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+        self.stdout.write(
+            f'{label}: {len(latencies) / elapsed:.0f} операций/с, ошибок блокировки: {errors}, '
+            f'медиана {statistics.median(latencies):.2f} мс, p99 {p99:.2f} мс'
+        )
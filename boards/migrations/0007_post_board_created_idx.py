@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0006_newsletter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['board', '-created_at', '-id'], name='post_board_created_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:19
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def fill_board_counters(apps, schema_editor):
+    """
+    Заполняет счетчики досок для уже существующих постов и откликов.
+    """
+    Board = apps.get_model('boards', 'Board')
+    Post = apps.get_model('boards', 'Post')
+    Response = apps.get_model('boards', 'Response')
+
+    posts = Post.objects.filter(board_id=OuterRef('pk')).order_by().values('board_id')
+    responses = Response.objects.filter(post__board_id=OuterRef('pk')).order_by().values('post__board_id')
+
+    last_post = Subquery(posts.annotate(m=Max('created_at')).values('m'))
+    last_response = Subquery(responses.annotate(m=Max('created_at')).values('m'))
+
+    Board.objects.update(
+        post_count=Coalesce(Subquery(posts.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), 0),
+        response_count=Coalesce(Subquery(responses.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), 0),
+        # Greatest() в SQLite возвращает NULL, если хотя бы один аргумент NULL.
+        last_activity_at=Greatest(Coalesce(last_post, last_response), Coalesce(last_response, last_post)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0007_post_board_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последняя активность'),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество постов'),
+        ),
+        migrations.AddField(
+            model_name='board',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество откликов'),
+        ),
+        migrations.RunPython(fill_board_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_post_response_count(apps, schema_editor):
+    """
+    Заполняет счетчик откликов для уже существующих постов.
+    """
+    Post = apps.get_model('boards', 'Post')
+    Response = apps.get_model('boards', 'Response')
+    responses = Response.objects.filter(post_id=OuterRef('pk')).order_by().values('post_id')
+    Post.objects.update(response_count=Coalesce(
+        Subquery(responses.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0008_board_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество откликов'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='response_post_created_idx'),
+        ),
+        migrations.RunPython(fill_post_response_count, migrations.RunPython.noop),
+    ]
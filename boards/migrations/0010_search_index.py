@@ -0,0 +1,109 @@
+from html.parser import HTMLParser
+
+from django.db import migrations
+
+# Копия определения индекса и извлечения текста на момент создания миграции. Миграция не импортирует
+# boards.search и boards.content: их дальнейшие изменения не должны менять результат уже примененной миграции.
+SEARCH_TABLE = 'boards_search'
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "title, body, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED, board_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+DROP_TABLE_SQL = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+INSERT_SQL = (
+    f"INSERT INTO {SEARCH_TABLE} (title, body, kind, object_id, post_id, board_id) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+SKIPPED_TAGS = {'script', 'style', 'template'}
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'tr', 'td', 'th', 'figure', 'figcaption', 'pre', 'hr',
+}
+BATCH_SIZE = 500
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Собирает текстовое содержимое HTML-документа, пропуская скрипты и стили.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    if not html:
+        return ''
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return ' '.join(''.join(parser.parts).split())
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Создает таблицу FTS5 и индексирует уже существующие посты и отклики,
+    читая и вставляя строки порциями по BATCH_SIZE.
+    На других СУБД полнотекстовый индекс не создается.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('boards', 'Post')
+    Response = apps.get_model('boards', 'Response')
+    posts = (
+        [title, html_to_text(content), 'post', pk, pk, board_id]
+        for pk, title, content, board_id
+        in Post.objects.values_list('pk', 'title', 'content', 'board_id').iterator(chunk_size=BATCH_SIZE)
+    )
+    responses = (
+        ['', html_to_text(content), 'response', pk, post_id, board_id]
+        for pk, content, post_id, board_id
+        in Response.objects.values_list('pk', 'content', 'post_id', 'post__board_id').iterator(chunk_size=BATCH_SIZE)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+        for rows in (posts, responses):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    cursor.executemany(INSERT_SQL, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(INSERT_SQL, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(DROP_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0009_post_response_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
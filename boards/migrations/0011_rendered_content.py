@@ -0,0 +1,220 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:23
+
+import hashlib
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from django.db import migrations, models
+
+# Копия правил очистки на момент создания миграции. Миграция не импортирует boards.content:
+# дальнейшие изменения модуля не должны менять результат уже примененной миграции.
+# Записи, построенные этой копией, приводятся к текущим правилам командой backfill_rendered_content.
+SKIPPED_TAGS = {'script', 'style', 'template'}
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'tr', 'td', 'th', 'figure', 'figcaption', 'pre', 'hr',
+}
+ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'div', 'span', 'strong', 'b', 'em', 'i', 'u', 's', 'sub', 'sup', 'code', 'pre',
+    'a', 'ul', 'ol', 'li', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'figure', 'figcaption', 'img', 'oembed', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+VOID_TAGS = {'br', 'hr', 'img'}
+ALLOWED_ATTRIBUTES = {
+    '*': {'class', 'style'},
+    'a': {'href', 'title', 'target'},
+    'img': {'src', 'alt', 'title', 'width', 'height', 'srcset', 'sizes'},
+    'oembed': {'url'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+URL_ATTRIBUTES = {'href', 'src', 'url'}
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto'}
+STYLE_PROPERTIES = {
+    '*': {'text-align', 'color', 'background-color'},
+    'img': {'width', 'height'},
+    'figure': {'width'},
+}
+SAFE_STYLE_VALUE = re.compile(r'^[#a-zA-Z0-9.,%\s-]+$')
+EXCERPT_LENGTH = 300
+
+
+def _is_safe_url(value):
+    scheme, sep, _ = value.strip().partition(':')
+    if not sep or '/' in scheme or '?' in scheme or '#' in scheme:
+        return True
+    return scheme.lower() in ALLOWED_URL_SCHEMES
+
+
+def _clean_style(tag, value):
+    allowed = STYLE_PROPERTIES.get(tag, set()) | STYLE_PROPERTIES['*']
+    declarations = []
+    for declaration in value.split(';'):
+        prop, sep, prop_value = declaration.partition(':')
+        prop, prop_value = prop.strip().lower(), prop_value.strip()
+        if sep and prop in allowed and SAFE_STYLE_VALUE.match(prop_value):
+            declarations.append(f'{prop}: {prop_value}')
+    return '; '.join(declarations)
+
+
+class _Renderer(HTMLParser):
+    """
+    Одним проходом строит очищенный HTML, текст и список изображений.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.images = []
+        self._skip_depth = 0
+
+    def _attrs(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set()) | ALLOWED_ATTRIBUTES['*']
+        result = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and not _is_safe_url(value):
+                continue
+            if name == 'style':
+                value = _clean_style(tag, value)
+                if not value:
+                    continue
+            if name == 'target' and value != '_blank':
+                continue
+            result.append((name, value))
+        if tag == 'a' and any(name == 'target' for name, _ in result):
+            result.append(('rel', 'noopener noreferrer'))
+        if tag == 'img':
+            src = dict(result).get('src')
+            if src:
+                self.images.append(src)
+            result.append(('loading', 'lazy'))
+        return ''.join(f' {name}="{escape(value)}"' for name, value in result)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+        if not self._skip_depth and tag in ALLOWED_TAGS:
+            self.html.append(f'<{tag}{self._attrs(tag, attrs)}>')
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+        if not self._skip_depth and tag in ALLOWED_TAGS and tag not in VOID_TAGS:
+            self.html.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.html.append(escape(data))
+            self.text.append(data)
+
+
+def render_content(html):
+    parser = _Renderer()
+    parser.feed(html or '')
+    parser.close()
+    text = ' '.join(''.join(parser.text).split())
+    excerpt = text
+    if len(text) > EXCERPT_LENGTH:
+        excerpt = text[:EXCERPT_LENGTH].rsplit(' ', 1)[0] + '…'
+    return {
+        'content_html': ''.join(parser.html),
+        'excerpt': excerpt,
+        'word_count': len(text.split()),
+        'image_refs': parser.images,
+        # Хеш без версии правил: записи миграции всегда перестраиваются командой backfill_rendered_content.
+        'content_hash': hashlib.sha256((html or '').encode()).hexdigest(),
+    }
+
+
+def fill_rendered_content(apps, schema_editor):
+    """
+    Строит производные поля содержимого для уже существующих постов и откликов.
+    Для больших баз используйте команду backfill_rendered_content.
+    """
+    for model_name in ('Post', 'Response'):
+        model = apps.get_model('boards', model_name)
+        batch = []
+        for obj in model.objects.only('pk', 'content').iterator(chunk_size=500):
+            for field, value in render_content(obj.content).items():
+                setattr(obj, field, value)
+            batch.append(obj)
+            if len(batch) >= 500:
+                model.objects.bulk_update(batch, ['content_html', 'excerpt', 'word_count', 'image_refs', 'content_hash'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['content_html', 'excerpt', 'word_count', 'image_refs', 'content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Хеш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='content_html',
+            field=models.TextField(blank=True, default='', verbose_name='Очищенный HTML'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', max_length=320, verbose_name='Выдержка'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_refs',
+            field=models.JSONField(blank=True, default=list, verbose_name='Изображения'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество слов'),
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Хеш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='content_html',
+            field=models.TextField(blank=True, default='', verbose_name='Очищенный HTML'),
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', max_length=320, verbose_name='Выдержка'),
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='image_refs',
+            field=models.JSONField(blank=True, default=list, verbose_name='Изображения'),
+        ),
+        migrations.AddField(
+            model_name='response',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество слов'),
+        ),
+        migrations.RunPython(fill_rendered_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_sent_newsletters(apps, schema_editor):
+    """
+    Переводит уже отправленные рассылки в статус «Отправлено».
+    """
+    Newsletter = apps.get_model('boards', 'Newsletter')
+    Newsletter.objects.filter(is_sent=True).update(status='sent')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0011_rendered_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletter',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ошибок отправки'),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Отправлено писем'),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начало отправки'),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Черновик'), ('queued', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено')], default='draft', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddField(
+            model_name='newsletter',
+            name='total_recipients',
+            field=models.PositiveIntegerField(default=0, verbose_name='Всего получателей'),
+        ),
+        migrations.CreateModel(
+            name='NewsletterDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата отправки')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('newsletter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='boards.newsletter', verbose_name='Рассылка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='newsletter_deliveries', to=settings.AUTH_USER_MODEL, verbose_name='Получатель')),
+            ],
+            options={
+                'verbose_name': 'Доставка рассылки',
+                'verbose_name_plural': 'Доставки рассылок',
+                'indexes': [models.Index(fields=['newsletter', 'status', 'id'], name='newsletter_delivery_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('newsletter', 'user'), name='newsletter_delivery_unique_user')],
+            },
+        ),
+        migrations.RunPython(mark_sent_newsletters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_post_author(apps, schema_editor):
+    """
+    Заполняет автора объявления для уже существующих откликов.
+    """
+    Post = apps.get_model('boards', 'Post')
+    Response = apps.get_model('boards', 'Response')
+    Response.objects.update(
+        post_author=Subquery(Post.objects.filter(pk=OuterRef('post_id')).values('author_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0012_newsletter_delivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='post_author',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inbox_responses', to=settings.AUTH_USER_MODEL, verbose_name='Автор объявления'),
+        ),
+        migrations.RunPython(fill_post_author, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='response',
+            name='post_author',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='inbox_responses', to=settings.AUTH_USER_MODEL, verbose_name='Автор объявления'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at'], name='post_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['post_author', '-created_at', '-id'], name='response_inbox_idx'),
+        ),
+    ]
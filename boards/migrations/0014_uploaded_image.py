@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0013_response_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='Путь в хранилище')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Размер оригинала, байт')),
+                ('width', models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')),
+                ('variants', models.JSONField(blank=True, default=list, verbose_name='Варианты')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('ready', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата обработки')),
+            ],
+            options={
+                'verbose_name': 'Загруженное изображение',
+                'verbose_name_plural': 'Загруженные изображения',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='uploaded_image_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:49
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0015_media_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('content_type', models.CharField(blank=True, default='', max_length=100, verbose_name='Тип содержимого')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('received', models.PositiveBigIntegerField(default=0, verbose_name='Принято, байт')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата последней части')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Возобновляемая загрузка',
+                'verbose_name_plural': 'Возобновляемые загрузки',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0016_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsletterdelivery',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки'),
+        ),
+        migrations.AddField(
+            model_name='newsletterdelivery',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Взято в отправку'),
+        ),
+        migrations.AddField(
+            model_name='newsletterdelivery',
+            name='claimed_by',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='Отправитель'),
+        ),
+        migrations.AlterField(
+            model_name='newsletterdelivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает отправки'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:46
+
+from collections import Counter
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _path_from_url(url):
+    media_url = settings.MEDIA_URL if settings.MEDIA_URL.startswith('/') else '/' + settings.MEDIA_URL
+    path = unquote(urlsplit(url).path if '://' in url else url.split('?', 1)[0])
+    if not path.startswith(media_url):
+        return None
+    return path[len(media_url):] or None
+
+
+def count_references(apps, schema_editor):
+    """
+    Раньше refcount считал загрузки; теперь это число постов и откликов, ссылающихся на файл.
+    """
+    counts = Counter()
+    for model_name in ('Post', 'Response'):
+        model = apps.get_model('boards', model_name)
+        for refs in model.objects.exclude(image_refs=[]).values_list('image_refs', flat=True).iterator(chunk_size=500):
+            counts.update({path for path in map(_path_from_url, refs) if path})
+    MediaBlob = apps.get_model('boards', 'MediaBlob')
+    now = timezone.now()
+    for blob in MediaBlob.objects.iterator(chunk_size=500):
+        blob.refcount = counts.get(blob.path, 0)
+        blob.unreferenced_since = None if blob.refcount else now
+        blob.save(update_fields=['refcount', 'unreferenced_since'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0017_newsletter_delivery_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='unreferenced_since',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Без ссылок с'),
+        ),
+        migrations.AddIndex(
+            model_name='mediablob',
+            index=models.Index(fields=['unreferenced_since'], name='media_blob_unreferenced_idx'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
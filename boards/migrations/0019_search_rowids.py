@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# Копия определения индекса на момент создания миграции (см. boards/search.py).
+SEARCH_TABLE = 'boards_search'
+REKEY_TABLE = 'boards_search_rekey'
+COLUMNS = 'title, body, kind, object_id, post_id, board_id'
+
+
+def rekey_search_index(apps, schema_editor):
+    """
+    Переписывает строки полнотекстового индекса с rowid = 2 * id объекта (+1 для откликов):
+    изменение и удаление строки по rowid не просматривает всю таблицу.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {REKEY_TABLE}")
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {REKEY_TABLE} USING fts5("
+            "title, body, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED, board_id UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {REKEY_TABLE} (rowid, {COLUMNS}) "
+            f"SELECT 2 * object_id + (kind = 'response'), {COLUMNS} FROM {SEARCH_TABLE}"
+        )
+        cursor.execute(f"DROP TABLE {SEARCH_TABLE}")
+        cursor.execute(f"ALTER TABLE {REKEY_TABLE} RENAME TO {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boards', '0018_media_blob_references'),
+    ]
+
+    operations = [
+        # Обратная операция не нужна: прежний код находит строки по kind и object_id при любом rowid.
+        migrations.RunPython(rekey_search_index, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,79 @@
+import uuid
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from django_ckeditor_5.fields import CKEditor5Field
 
+from .content import render_content, content_hash, image_sources
+
 # Получение текущей активной модели пользователя.
 User = get_user_model()
 
+class RenderedContentModel(models.Model):
+    """
+    Абстрактная модель с производными полями содержимого CKEditor.
+    Очищенный HTML, текстовая выдержка и метаданные вычисляются один раз при сохранении,
+    поэтому страницы и письма не обрабатывают HTML на каждый запрос.
+    """
+    content_html = models.TextField(blank=True, default='', verbose_name="Очищенный HTML")
+    excerpt = models.CharField(max_length=320, blank=True, default='', verbose_name="Выдержка")
+    word_count = models.PositiveIntegerField(default=0, verbose_name="Количество слов")
+    image_refs = models.JSONField(default=list, blank=True, verbose_name="Изображения")
+    content_hash = models.CharField(max_length=64, blank=True, default='', verbose_name="Хеш содержимого")
+
+    # Поля, которые пересчитываются из content.
+    RENDERED_FIELDS = ('content_html', 'excerpt', 'word_count', 'image_refs', 'content_hash')
+
+    class Meta:
+        abstract = True
+
+    def render_content(self, force=False):
+        """
+        Пересчитывает производные поля, если исходный HTML изменился (или force=True,
+        например, когда для изображений содержимого появились уменьшенные варианты).
+        Возвращает True, если поля были обновлены.
+        """
+        if not force and self.content_hash and self.content_hash == content_hash(self.content):
+            return False
+        previous_refs = self._stored_image_refs()
+        image_variants = UploadedImage.variants_for(image_sources(self.content))
+        for field, value in render_content(self.content, image_variants).items():
+            setattr(self, field, value)
+        if set(previous_refs) != set(self.image_refs):
+            # Изменение ссылок на файлы учитывается в MediaBlob после сохранения (см. signals.py).
+            self._image_refs_change = (previous_refs, self.image_refs)
+        return True
+
+    def _stored_image_refs(self):
+        """
+        image_refs, сохраненные в базе до текущего изменения содержимого.
+        """
+        if self._state.adding:
+            return []
+        if 'image_refs' in self.get_deferred_fields():
+            stored = type(self).objects.filter(pk=self.pk).values_list('image_refs', flat=True).first()
+            return stored or []
+        return self.image_refs
+
+    def pop_image_refs_change(self):
+        """
+        Возвращает и сбрасывает пару (image_refs до, image_refs после) последнего
+        пересчета или None, если ссылки на изображения не менялись.
+        """
+        return self.__dict__.pop('_image_refs_change', None)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.render_content()
+        elif 'content' in update_fields and self.render_content():
+            kwargs['update_fields'] = {*update_fields, *self.RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+
 class Board(models.Model):
     """
     Модель доски объявлений или категории.
@@ -14,6 +82,10 @@ class Board(models.Model):
     description = models.TextField(blank=True, verbose_name="Описание доски")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата последнего обновления")
+    # Денормализованные счетчики, поддерживаемые сигналами (см. boards/signals.py).
+    post_count = models.PositiveIntegerField(default=0, verbose_name="Количество постов")
+    response_count = models.PositiveIntegerField(default=0, verbose_name="Количество откликов")
+    last_activity_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
 
     class Meta:
         verbose_name = "Доска"
@@ -23,7 +95,7 @@ class Board(models.Model):
     def __str__(self):
         return self.name
 
-class Post(models.Model):
+class Post(RenderedContentModel):
     """
     Модель поста или темы на доске.
     """
@@ -34,16 +106,33 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts', verbose_name="Автор")
     board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='posts', verbose_name="Доска")
     views = models.PositiveIntegerField(default=0, verbose_name="Количество просмотров")
+    # Денормализованный счетчик откликов, поддерживаемый сигналами (см. boards/signals.py).
+    response_count = models.PositiveIntegerField(default=0, verbose_name="Количество откликов")
 
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
         ordering = ['-created_at']
+        indexes = [
+            # Составной индекс для курсорной пагинации постов доски по (created_at, id).
+            models.Index(fields=['board', '-created_at', '-id'], name='post_board_created_idx'),
+            # Список постов автора (фильтр на странице откликов) по дате создания.
+            models.Index(fields=['author', '-created_at'], name='post_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.title[:50] + ('...' if len(self.title) > 50 else '')
 
-class Response(models.Model):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Автор и доска на момент загрузки: по ним сигналы (signals.py) видят смену автора
+        # и перенос поста на другую доску.
+        instance._loaded_author_id = instance.__dict__.get('author_id')
+        instance._loaded_board_id = instance.__dict__.get('board_id')
+        return instance
+
+class Response(RenderedContentModel):
     """
     Модель откликов на посты.
     """
@@ -53,15 +142,36 @@ class Response(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     is_accepted = models.BooleanField(default=False, verbose_name="Принят ли отклик")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата последнего обновления")
+    # Денормализованный автор поста: входящие отклики пользователя выбираются
+    # по индексу response_inbox_idx без соединения с таблицей постов.
+    post_author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='inbox_responses',
+        editable=False,
+        db_index=False,
+        verbose_name="Автор объявления",
+    )
 
     class Meta:
         verbose_name = "Отклик"
         verbose_name_plural = "Отклики"
         ordering = ['created_at']
+        indexes = [
+            # Составной индекс для курсорной пагинации откликов поста по (created_at, id).
+            models.Index(fields=['post', 'created_at', 'id'], name='response_post_created_idx'),
+            # Отклики на посты автора X от новых к старым (страница «Отклики на мои объявления»).
+            models.Index(fields=['post_author', '-created_at', '-id'], name='response_inbox_idx'),
+        ]
 
     def __str__(self):
         return f"Отклик от {self.author.username} на '{self.post.title[:30]}...'"
 
+    def save(self, *args, **kwargs):
+        if self.post_author_id is None and self.post_id is not None:
+            self.post_author_id = self.post.author_id
+        super().save(*args, **kwargs)
+
 class Newsletter(models.Model):
     """
     Модель для новостных рассылок.
@@ -71,6 +181,22 @@ class Newsletter(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
     is_sent = models.BooleanField(default=False, verbose_name="Отправлено?")
+    # Состояние фоновой отправки (см. boards/newsletter.py).
+    STATUS_DRAFT = 'draft'
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUSES = [
+        (STATUS_DRAFT, 'Черновик'),
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+    ]
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_DRAFT, verbose_name="Статус")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало отправки")
+    total_recipients = models.PositiveIntegerField(default=0, verbose_name="Всего получателей")
+    sent_count = models.PositiveIntegerField(default=0, verbose_name="Отправлено писем")
+    failed_count = models.PositiveIntegerField(default=0, verbose_name="Ошибок отправки")
 
     class Meta:
         verbose_name = "Новостная рассылка"
@@ -78,4 +204,192 @@ class Newsletter(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return self.subject
\ No newline at end of file
+        return self.subject
+
+class NewsletterDelivery(models.Model):
+    """
+    Состояние доставки рассылки одному получателю.
+    Позволяет продолжить прерванную отправку, не отправляя письмо повторно.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='deliveries', verbose_name="Рассылка")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='newsletter_deliveries', verbose_name="Получатель")
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING, verbose_name="Статус")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+    error = models.TextField(blank=True, default='', verbose_name="Ошибка")
+    # Захват письма отправителем (см. boards/newsletter.py): кто и когда взял его в отправку.
+    claimed_by = models.CharField(max_length=32, blank=True, default='', verbose_name="Отправитель")
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name="Взято в отправку")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток отправки")
+
+    class Meta:
+        verbose_name = "Доставка рассылки"
+        verbose_name_plural = "Доставки рассылок"
+        constraints = [
+            models.UniqueConstraint(fields=['newsletter', 'user'], name='newsletter_delivery_unique_user'),
+        ]
+        indexes = [
+            # Выборка следующей порции неотправленных писем рассылки.
+            models.Index(fields=['newsletter', 'status', 'id'], name='newsletter_delivery_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.newsletter} → {self.user.email} ({self.get_status_display()})"
+
+class UploadedImage(models.Model):
+    """
+    Изображение, загруженное через CKEditor, и его уменьшенные варианты (см. boards/images.py).
+    Варианты создаются фоновым пулом после ответа на загрузку; до этого страницы
+    показывают оригинал.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'Ожидает обработки'),
+        (STATUS_READY, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    path = models.CharField(max_length=500, unique=True, verbose_name="Путь в хранилище")
+    size = models.PositiveIntegerField(default=0, verbose_name="Размер оригинала, байт")
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name="Ширина")
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name="Высота")
+    # Варианты: [{"name": ..., "path": ..., "width": ..., "height": ..., "format": ..., "size": ...}].
+    variants = models.JSONField(default=list, blank=True, verbose_name="Варианты")
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING, verbose_name="Статус")
+    error = models.TextField(blank=True, default='', verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата обработки")
+
+    class Meta:
+        verbose_name = "Загруженное изображение"
+        verbose_name_plural = "Загруженные изображения"
+        ordering = ['-created_at']
+        indexes = [
+            # Выборка следующей порции необработанных изображений.
+            models.Index(fields=['status', 'id'], name='uploaded_image_status_idx'),
+        ]
+
+    def __str__(self):
+        return self.path
+
+    @property
+    def url(self):
+        return default_storage.url(self.path)
+
+    @staticmethod
+    def path_from_url(url):
+        """
+        Возвращает путь в хранилище для адреса медиафайла или None для внешних адресов.
+        Абсолютные адреса своего сайта (http://host/media/...) тоже распознаются.
+        """
+        media_url = settings.MEDIA_URL
+        path = unquote(urlsplit(url).path if '://' in url else url.split('?', 1)[0])
+        if not media_url.startswith('/'):
+            media_url = '/' + media_url
+        if not path.startswith(media_url):
+            return None
+        return path[len(media_url):] or None
+
+    def img_attrs(self):
+        """
+        Атрибуты <img> для готового изображения: src (перекодированный оригинал),
+        srcset из WebP-вариантов, sizes и размеры, чтобы страница не прыгала при загрузке.
+        """
+        by_name = {variant['name']: variant for variant in self.variants}
+        fallback = by_name.get('fallback')
+        webp = sorted((v for v in self.variants if v['format'] == 'WEBP'), key=lambda v: v['width'])
+        if not fallback or not webp:
+            return None
+        largest = webp[-1]['width']
+        return {
+            'src': default_storage.url(fallback['path']),
+            'srcset': ', '.join(f"{default_storage.url(v['path'])} {v['width']}w" for v in webp),
+            'sizes': f'(max-width: {largest}px) 100vw, {largest}px',
+            'width': fallback['width'],
+            'height': fallback['height'],
+        }
+
+    @classmethod
+    def variants_for(cls, urls):
+        """
+        Возвращает словарь {адрес: атрибуты <img>} для готовых изображений из списка адресов
+        одним запросом. Для содержимого без загруженных изображений запрос не выполняется.
+        """
+        paths = {}
+        for url in urls:
+            path = cls.path_from_url(url)
+            if path:
+                paths.setdefault(path, []).append(url)
+        if not paths:
+            return {}
+        result = {}
+        ready = cls.objects.filter(path__in=paths, status=cls.STATUS_READY).only('path', 'variants')
+        for image in ready:
+            attrs = image.img_attrs()
+            if attrs:
+                for url in paths[image.path]:
+                    result[url] = attrs
+        return result
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище с адресацией по содержимому (см. boards/storage.py) и число постов
+    и откликов, ссылающихся на него. Одинаковые загрузки хранятся одним файлом; файл без ссылок
+    удаляет команда collect_media после отсрочки.
+    """
+    sha256 = models.CharField(max_length=64, verbose_name="SHA-256")
+    path = models.CharField(max_length=500, unique=True, verbose_name="Путь в хранилище")
+    size = models.PositiveBigIntegerField(default=0, verbose_name="Размер, байт")
+    refcount = models.PositiveIntegerField(default=0, verbose_name="Количество ссылок")
+    unreferenced_since = models.DateTimeField(null=True, blank=True, verbose_name="Без ссылок с")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Файл хранилища"
+        verbose_name_plural = "Файлы хранилища"
+        indexes = [
+            models.Index(fields=['sha256'], name='media_blob_sha256_idx'),
+            # Выборка файлов без ссылок командой collect_media.
+            models.Index(fields=['unreferenced_since'], name='media_blob_unreferenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.refcount})"
+
+class UploadSession(models.Model):
+    """
+    Незавершенная возобновляемая загрузка изображения (см. boards/uploads.py).
+    Данные дописываются во временный файл по частям; received — сколько байт уже принято,
+    с этого смещения клиент продолжает загрузку после обрыва соединения.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions', verbose_name="Пользователь")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    content_type = models.CharField(max_length=100, blank=True, default='', verbose_name="Тип содержимого")
+    size = models.PositiveBigIntegerField(verbose_name="Размер, байт")
+    received = models.PositiveBigIntegerField(default=0, verbose_name="Принято, байт")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата последней части")
+
+    class Meta:
+        verbose_name = "Возобновляемая загрузка"
+        verbose_name_plural = "Возобновляемые загрузки"
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+    @property
+    def is_complete(self):
+        return self.received >= self.size
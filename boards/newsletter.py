@@ -0,0 +1,251 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from main import metrics
+from .content import html_to_text
+from .models import Newsletter, NewsletterDelivery
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Настройки по умолчанию; переопределяются словарем NEWSLETTER в settings.py.
+DEFAULTS = {
+    'CHUNK_SIZE': 1000,   # Получателей, читаемых из базы за один раз.
+    'BATCH_SIZE': 100,    # Писем, отправляемых через одно SMTP-соединение.
+    'WORKERS': 4,         # Параллельных SMTP-соединений.
+    'LEASE_SECONDS': 600, # Через сколько секунд взятое в отправку письмо считается брошенным.
+    'MAX_ATTEMPTS': 3,    # Сколько раз пробовать отправить письмо с ошибкой.
+}
+
+
+def get_config():
+    """
+    Возвращает настройки отправки рассылок с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'NEWSLETTER', {})}
+
+
+def prepare_deliveries(newsletter, chunk_size=None):
+    """
+    Создает записи доставки для всех активных подписчиков, потоково читая пользователей порциями.
+    Уже существующие записи не трогаются, поэтому повторный вызов безопасен.
+    Возвращает общее количество получателей рассылки.
+    """
+    chunk_size = chunk_size or get_config()['CHUNK_SIZE']
+    recipients = (
+        User.objects.filter(is_active=True, profile__is_subscribed_to_newsletter=True)
+        .select_related('profile')
+        .only('pk', 'profile__is_subscribed_to_newsletter')
+        .order_by('pk')
+    )
+    batch = []
+    for user in recipients.iterator(chunk_size=chunk_size):
+        batch.append(NewsletterDelivery(newsletter=newsletter, user_id=user.pk))
+        if len(batch) >= chunk_size:
+            NewsletterDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        NewsletterDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+    return newsletter.deliveries.count()
+
+
+class _MailMerge:
+    """
+    Готовит персональные письма рассылки из один раз скомпилированного шаблона.
+    """
+    template_name = 'emails/newsletter_email.html'
+
+    def __init__(self, newsletter):
+        self.template = get_template(self.template_name)
+        self.newsletter = newsletter
+        self.plain_content = html_to_text(newsletter.content)
+        self.base_context = {
+            'subject': newsletter.subject,
+            'newsletter_content': newsletter.content,
+            'unsubscribe_url': settings.SITE_URL + reverse('boards:unsubscribe_newsletter'),
+            'current_year': timezone.now().year,
+        }
+
+    def message(self, user, connection):
+        username = user.username if user.username else user.email
+        html_message = self.template.render({**self.base_context, 'recipient_username': username})
+        plain_message = f"Здравствуйте, {username}!\n\n{self.plain_content}\n\nС уважением,\nКоманда MyFanBoard."
+        email = EmailMultiAlternatives(
+            self.newsletter.subject, plain_message, settings.DEFAULT_FROM_EMAIL, [user.email], connection=connection
+        )
+        email.attach_alternative(html_message, 'text/html')
+        return email
+
+
+def _send_batch(merge, deliveries):
+    """
+    Отправляет порцию писем через одно SMTP-соединение.
+    Выполняется в рабочем потоке и не обращается к базе данных.
+    Возвращает список пар (delivery, текст ошибки или '').
+    """
+    results = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        return [(delivery, str(e)) for delivery in deliveries]
+    try:
+        for delivery in deliveries:
+            try:
+                merge.message(delivery.user, connection).send(fail_silently=False)
+            except Exception as e:
+                results.append((delivery, str(e)))
+            else:
+                results.append((delivery, ''))
+    finally:
+        connection.close()
+    return results
+
+
+def claim_chunk(newsletter, owner, limit, lease_seconds=None):
+    """
+    Берет в отправку до limit писем рассылки и возвращает их.
+
+    Письмо захватывается условным UPDATE ... WHERE status = 'pending': из нескольких отправителей
+    (фоновый поток админ-панели, команда send_newsletters) его получает только один.
+    Письма, взятые отправителем, который не закончил их за LEASE_SECONDS (процесс упал),
+    снова доступны для захвата.
+    """
+    lease_seconds = lease_seconds or get_config()['LEASE_SECONDS']
+    now = timezone.now()
+    available = Q(status=NewsletterDelivery.STATUS_PENDING) | Q(
+        status=NewsletterDelivery.STATUS_SENDING, claimed_at__lt=now - timedelta(seconds=lease_seconds)
+    )
+    deliveries = newsletter.deliveries.filter(available)
+    candidates = list(deliveries.order_by('pk').values_list('pk', flat=True)[:limit])
+    if not candidates:
+        return []
+    deliveries.filter(pk__in=candidates).update(
+        status=NewsletterDelivery.STATUS_SENDING, claimed_by=owner, claimed_at=now, attempts=F('attempts') + 1
+    )
+    return list(
+        newsletter.deliveries.filter(pk__in=candidates, status=NewsletterDelivery.STATUS_SENDING, claimed_by=owner)
+        .select_related('user')
+        .only('pk', 'user__username', 'user__email')
+        .order_by('pk')
+    )
+
+
+def retry_failed(newsletter, max_attempts=None):
+    """
+    Возвращает в очередь письма с ошибкой, у которых остались попытки.
+    Возвращает количество таких писем.
+    """
+    max_attempts = max_attempts or get_config()['MAX_ATTEMPTS']
+    retried = newsletter.deliveries.filter(
+        status=NewsletterDelivery.STATUS_FAILED, attempts__lt=max_attempts
+    ).update(status=NewsletterDelivery.STATUS_PENDING, error='')
+    if retried:
+        Newsletter.objects.filter(pk=newsletter.pk).update(failed_count=F('failed_count') - retried)
+    return retried
+
+
+def _save_results(newsletter, results):
+    now = timezone.now()
+    sent = [delivery.pk for delivery, error in results if not error]
+    failed = [(delivery, error) for delivery, error in results if error]
+    NewsletterDelivery.objects.filter(pk__in=sent).update(
+        status=NewsletterDelivery.STATUS_SENT, sent_at=now, claimed_by=''
+    )
+    for delivery, error in failed:
+        delivery.status = NewsletterDelivery.STATUS_FAILED
+        delivery.error = error
+        delivery.claimed_by = ''
+    NewsletterDelivery.objects.bulk_update([delivery for delivery, _ in failed], ['status', 'error', 'claimed_by'])
+    Newsletter.objects.filter(pk=newsletter.pk).update(
+        sent_count=F('sent_count') + len(sent), failed_count=F('failed_count') + len(failed)
+    )
+    metrics.MAIL_DELIVERIES.inc(len(sent), kind='newsletter', result='sent')
+    metrics.MAIL_DELIVERIES.inc(len(failed), kind='newsletter', result='failed')
+
+
+def send_newsletter(newsletter, workers=None, batch_size=None):
+    """
+    Отправляет рассылку всем получателям, для которых письмо еще не отправлено.
+
+    Письма захватываются порциями (claim_chunk) и уходят пачками через пул SMTP-соединений,
+    а результат каждой пачки сразу фиксируется в базе. Одну рассылку могут отправлять
+    несколько отправителей одновременно: каждое письмо уходит один раз. После сбоя повторный
+    вызов продолжит с неотправленных писем и повторит письма с ошибкой (до MAX_ATTEMPTS попыток).
+    """
+    config = get_config()
+    workers = workers or config['WORKERS']
+    batch_size = batch_size or config['BATCH_SIZE']
+    owner = uuid.uuid4().hex
+
+    Newsletter.objects.filter(pk=newsletter.pk).update(
+        status=Newsletter.STATUS_SENDING, started_at=newsletter.started_at or timezone.now()
+    )
+    total = prepare_deliveries(newsletter)
+    Newsletter.objects.filter(pk=newsletter.pk).update(total_recipients=total)
+    retry_failed(newsletter)
+
+    merge = _MailMerge(newsletter)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            # Одна порция обеспечивает работой все соединения пула.
+            chunk = claim_chunk(newsletter, owner, batch_size * workers)
+            if not chunk:
+                break
+            batches = [chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size)]
+            for results in executor.map(lambda batch: _send_batch(merge, batch), batches):
+                _save_results(newsletter, results)
+
+    # Рассылка завершена, когда ни одно письмо не ждет отправки, не отправляется другим отправителем
+    # и не ждет повторной попытки. Иначе она остается «Отправляется» и ее продолжит send_newsletters.
+    unfinished = newsletter.deliveries.filter(
+        Q(status__in=[NewsletterDelivery.STATUS_PENDING, NewsletterDelivery.STATUS_SENDING])
+        | Q(status=NewsletterDelivery.STATUS_FAILED, attempts__lt=config['MAX_ATTEMPTS'])
+    )
+    if not unfinished.exists():
+        Newsletter.objects.filter(pk=newsletter.pk).update(
+            status=Newsletter.STATUS_SENT, is_sent=True, sent_at=timezone.now()
+        )
+
+
+def send_newsletter_in_background(newsletter):
+    """
+    Запускает отправку рассылки в фоновом потоке, не блокируя запрос админ-панели.
+    Если процесс завершится раньше, рассылку доставит команда send_newsletters.
+    """
+    def run():
+        try:
+            send_newsletter(newsletter)
+        except Exception:
+            logger.exception("Отправка рассылки '%s' прервана", newsletter.subject)
+        finally:
+            close_old_connections()
+
+    thread = threading.Thread(target=run, name=f'newsletter-{newsletter.pk}', daemon=True)
+    thread.start()
+    return thread
+
+
+def throughput(newsletter, now=None):
+    """
+    Скорость отправки рассылки в письмах в секунду.
+    """
+    if not newsletter.started_at:
+        return 0.0
+    end = newsletter.sent_at if newsletter.status == Newsletter.STATUS_SENT and newsletter.sent_at else (now or timezone.now())
+    elapsed = (end - newsletter.started_at).total_seconds()
+    processed = newsletter.sent_count + newsletter.failed_count
+    return processed / elapsed if elapsed > 0 else 0.0
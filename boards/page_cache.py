@@ -0,0 +1,187 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import escape_uri_path
+
+from main import metrics
+from main.asynchronous import load_request
+
+# Настройки по умолчанию; переопределяются словарем PAGE_CACHE в settings.py.
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',  # Алиас из CACHES, в котором хранятся страницы.
+    'TIMEOUT': 60,             # Секунды жизни страницы в кеше.
+    'KEY_PREFIX': 'pagecache',
+}
+
+
+def get_config():
+    """
+    Возвращает настройки кеша страниц с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'PAGE_CACHE', {})}
+
+
+def _cache():
+    return caches[get_config()['CACHE_ALIAS']]
+
+
+def _key(*parts):
+    return ':'.join([get_config()['KEY_PREFIX'], *map(str, parts)])
+
+
+def bump_versions(*scopes):
+    """
+    Инвалидирует все закешированные страницы, зависящие от перечисленных областей
+    ('boards', 'board:<id>', 'post:<id>'), увеличивая их версии.
+    Старые записи не удаляются: их ключи просто перестают совпадать и истекают сами.
+    """
+    cache = _cache()
+    for scope in scopes:
+        key = _key('v', scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Версии еще нет в кеше (или она вытеснена) — начинаем с 1.
+            cache.set(key, 1, None)
+
+
+def _page_key(request, scopes, params):
+    """
+    Ключ страницы: версии областей, путь и только те GET-параметры, которые читает представление.
+    Прочие параметры (?utm_source=..., ?x=1) не меняют ключ: ими нельзя ни обойти кеш, ни засорить его.
+    """
+    cache = _cache()
+    version_keys = [_key('v', scope) for scope in scopes]
+    versions = cache.get_many(version_keys)
+    version = '.'.join(str(versions.get(key, 0)) for key in version_keys)
+    query = urlencode([(name, request.GET[name]) for name in params if name in request.GET])
+    url = f'{escape_uri_path(request.path)}?{query}'
+    return _key('page', version, hashlib.md5(url.encode(), usedforsecurity=False).hexdigest())
+
+
+def record_stat(name):
+    """
+    Увеличивает счетчик статистики кеша: 'hit', 'miss' или 'bypass'.
+    """
+    metrics.PAGE_CACHE.inc(result=name)
+    cache = _cache()
+    key = _key('stats', name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    """
+    Возвращает счетчики попаданий, промахов и обходов кеша.
+    """
+    names = ('hit', 'miss', 'bypass')
+    values = _cache().get_many([_key('stats', name) for name in names])
+    return {name: values.get(_key('stats', name), 0) for name in names}
+
+
+def reset_stats():
+    """
+    Обнуляет счетчики статистики кеша.
+    """
+    _cache().delete_many([_key('stats', name) for name in ('hit', 'miss', 'bypass')])
+
+
+def _is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Страница с flash-сообщениями персональна: сообщение должно показаться один раз.
+    return not len(get_messages(request))
+
+
+def _cached_response(cached):
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Page-Cache'] = 'HIT'
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _lookup(request, scopes, params, kwargs):
+    """
+    Ключ страницы и закешированное содержимое (или None); учитывает попадание или промах.
+    """
+    key = _page_key(request, scopes(**kwargs), params)
+    cached = _cache().get(key)
+    record_stat('miss' if cached is None else 'hit')
+    return key, cached
+
+
+def _store(request, key, response):
+    # Ответы, устанавливающие cookie (в том числе CSRF-токен), персональны и не кешируются.
+    personal = response.cookies or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    if response.status_code == 200 and not response.streaming and not personal:
+        _cache().set(key, (response.content, response['Content-Type']), get_config()['TIMEOUT'])
+        response['X-Page-Cache'] = 'MISS'
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def anonymous_page_cache(scopes, params=(), on_hit=None):
+    """
+    Кеширует страницу целиком для анонимных пользователей.
+
+    scopes — функция, получающая аргументы URL представления и возвращающая список областей,
+    от которых зависит страница. Изменение Board, Post или Response увеличивает версии
+    соответствующих областей (см. boards/signals.py), и закешированные страницы сразу устаревают.
+
+    params — имена GET-параметров, от которых зависит страница; остальные параметры в ключ не входят.
+
+    on_hit — необязательная функция, вызываемая с аргументами URL при попадании в кеш
+    вместо представления (например, чтобы учесть просмотр поста).
+
+    Для асинхронного представления on_hit тоже должна быть асинхронной. Встроенные бэкенды
+    кеша не имеют собственного асинхронного API, поэтому обращения к кешу при поиске
+    и сохранении страницы выполняются в потоке одним вызовом sync_to_async каждое.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                await load_request(request)
+                if not get_config()['ENABLED'] or not _is_cacheable_request(request):
+                    await sync_to_async(record_stat)('bypass')
+                    return await view_func(request, *args, **kwargs)
+
+                key, cached = await sync_to_async(_lookup)(request, scopes, params, kwargs)
+                if cached is not None:
+                    if on_hit is not None:
+                        await on_hit(**kwargs)
+                    return _cached_response(cached)
+                response = await view_func(request, *args, **kwargs)
+                return await sync_to_async(_store)(request, key, response)
+
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not get_config()['ENABLED'] or not _is_cacheable_request(request):
+                record_stat('bypass')
+                return view_func(request, *args, **kwargs)
+
+            key, cached = _lookup(request, scopes, params, kwargs)
+            if cached is not None:
+                if on_hit is not None:
+                    on_hit(**kwargs)
+                return _cached_response(cached)
+            return _store(request, key, view_func(request, *args, **kwargs))
+
+        return wrapper
+    return decorator
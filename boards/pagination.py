@@ -0,0 +1,117 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """
+    Ошибка разбора курсора пагинации (поврежденный или подделанный токен).
+    """
+
+
+def encode_cursor(value, pk):
+    """
+    Кодирует пару (значение поля сортировки, id) в компактный токен для URL.
+    """
+    raw = f"{value.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Декодирует токен курсора обратно в пару (datetime, id).
+    При USE_TZ курсор без часового пояса отклоняется: encode_cursor такой не выдает,
+    а наивное время сравнивалось бы с датами в базе со сдвигом.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        value, pk = datetime.fromisoformat(value), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e)) from e
+    if settings.USE_TZ and value.tzinfo is None:
+        raise InvalidCursor('Курсор без часового пояса.')
+    return value, pk
+
+
+class KeysetPage:
+    """
+    Страница результатов курсорной (keyset) пагинации.
+    """
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _keyset_query(queryset, after, before, field, descending):
+    """
+    Упорядоченный queryset страницы и параметры для сборки KeysetPage: (queryset, backwards, cursor).
+    """
+    backwards = before is not None and after is None
+    cursor = decode_cursor(before if backwards else after) if (after or before) else None
+
+    # Направление обхода индекса: при движении назад порядок инвертируется,
+    # а затем страница переворачивается обратно в памяти.
+    forward_descending = descending != backwards
+    if cursor is not None:
+        value, pk = cursor
+        op = 'lt' if forward_descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk})
+        )
+    prefix = '-' if forward_descending else ''
+    return queryset.order_by(f'{prefix}{field}', f'{prefix}pk'), backwards, cursor
+
+
+def _keyset_page(rows, per_page, field, backwards, cursor):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, cursor is not None
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_next:
+            next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+        if has_previous:
+            previous_cursor = encode_cursor(getattr(rows[0], field), rows[0].pk)
+    return KeysetPage(rows, has_next, has_previous, next_cursor, previous_cursor)
+
+
+def keyset_paginate(queryset, after=None, before=None, per_page=20, field='created_at', descending=True):
+    """
+    Возвращает страницу queryset, упорядоченного по (field, id), начиная после курсора `after`
+    или заканчивая перед курсором `before`.
+
+    В отличие от OFFSET, условие по курсору обслуживается составным индексом (…, field, id),
+    поэтому стоимость любой страницы одинакова, как бы глубоко ни листал пользователь.
+    """
+    queryset, backwards, cursor = _keyset_query(queryset, after, before, field, descending)
+    rows = list(queryset[:per_page + 1])
+    return _keyset_page(rows, per_page, field, backwards, cursor)
+
+
+async def akeyset_paginate(queryset, after=None, before=None, per_page=20, field='created_at', descending=True):
+    """
+    Асинхронный вариант keyset_paginate для асинхронных представлений.
+    """
+    queryset, backwards, cursor = _keyset_query(queryset, after, before, field, descending)
+    rows = [row async for row in queryset[:per_page + 1]]
+    return _keyset_page(rows, per_page, field, backwards, cursor)
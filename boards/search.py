@@ -0,0 +1,249 @@
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.html import escape
+
+from .content import html_to_text
+
+# Виртуальная таблица полнотекстового индекса SQLite FTS5.
+# kind — 'post' или 'response'; для откликов title пустой, а post_id указывает на пост.
+# rowid строки вычисляется из вида и id объекта (см. _rowid): колонки UNINDEXED не индексируются,
+# и только условие по rowid находит строку без просмотра всей таблицы.
+SEARCH_TABLE = 'boards_search'
+# Таблица, в которой rebuild_index строит новый индекс перед подменой основного.
+REBUILD_TABLE = 'boards_search_rebuild'
+
+
+def _create_table_sql(table):
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        "title, body, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED, board_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def _insert_sql(table):
+    return (
+        f"INSERT INTO {table} (rowid, title, body, kind, object_id, post_id, board_id) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)"
+    )
+
+
+def _rowid(kind, object_id):
+    """
+    rowid строки индекса: посты занимают четные значения, отклики — нечетные.
+    """
+    return 2 * object_id + (kind == 'response')
+
+
+def _row(title, body, kind, object_id, post_id, board_id):
+    return [_rowid(kind, object_id), title, body, kind, object_id, post_id, board_id]
+
+
+def _responses_rowids_sql(response_table):
+    # Отклики поста находятся по индексу таблицы откликов, строки индекса — по rowid.
+    return f"SELECT 2 * id + 1 FROM {response_table} WHERE post_id = %s"
+
+
+# Служебные символы, которыми FTS5 помечает совпадения; заменяются на <mark> после экранирования.
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def is_available():
+    """
+    Полнотекстовый индекс поддерживается только на SQLite с расширением FTS5.
+    """
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(query, column=None):
+    """
+    Превращает пользовательский запрос в безопасное выражение MATCH:
+    каждое слово берется в кавычки, последнее ищется по префиксу.
+    column — искать только в этом столбце индекса ('title' или 'body').
+    """
+    terms = ['"%s"' % term.replace('"', '""') for term in query.split()]
+    if not terms:
+        return ''
+    terms[-1] += '*'
+    if column is not None:
+        return f'{column} : ({" ".join(terms)})'
+    return ' '.join(terms)
+
+
+def _replace(kind, object_id, post_id, board_id, title, html):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [_rowid(kind, object_id)])
+        cursor.execute(_insert_sql(SEARCH_TABLE), _row(title, html_to_text(html), kind, object_id, post_id, board_id))
+
+
+def index_post(post, board_changed=False):
+    """
+    Добавляет или обновляет пост в полнотекстовом индексе.
+    board_changed — пост перенесен на другую доску: board_id его откликов в индексе тоже обновляется.
+    """
+    if not is_available():
+        return
+    _replace('post', post.pk, post.pk, post.board_id, post.title, post.content)
+    if board_changed:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {SEARCH_TABLE} SET board_id = %s "
+                f"WHERE rowid IN ({_responses_rowids_sql(post.responses.model._meta.db_table)})",
+                [post.board_id, post.pk],
+            )
+
+
+def index_response(response, board_id):
+    """
+    Добавляет или обновляет отклик в полнотекстовом индексе.
+    """
+    if not is_available():
+        return
+    _replace('response', response.pk, response.post_id, board_id, '', response.content)
+
+
+def remove_from_index(kind, object_id):
+    """
+    Удаляет пост или отклик из полнотекстового индекса.
+    """
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [_rowid(kind, object_id)])
+
+
+def matching_ids(kind, query, column=None):
+    """
+    Подзапрос с id объектов данного вида, совпадающих с запросом (во всех столбцах или в column).
+    Используется в админ-панели вместо LIKE '%q%' по HTML.
+    """
+    return RawSQL(
+        f"SELECT object_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND kind = %s",
+        [build_match_query(query, column), kind],
+    )
+
+
+def _highlight(text):
+    return escape(text).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+class SearchResults:
+    """
+    Ленивый набор результатов поиска, совместимый с django.core.paginator.Paginator:
+    count() выполняет COUNT по индексу, срез — запрос страницы с LIMIT/OFFSET.
+    Результаты упорядочены по релевантности bm25 (совпадения в заголовке весят больше).
+    """
+    def __init__(self, query, board_id=None):
+        self.match = build_match_query(query)
+        self.board_id = board_id
+
+    def _where(self):
+        sql = f"{SEARCH_TABLE} MATCH %s"
+        params = [self.match]
+        if self.board_id:
+            sql += " AND board_id = %s"
+            params.append(self.board_id)
+        return sql, params
+
+    def count(self):
+        if not self.match or not is_available():
+            return 0
+        where, params = self._where()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {where}", params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('SearchResults поддерживает только срезы.')
+        if not self.match or not is_available():
+            return []
+        where, params = self._where()
+        limit = item.stop - (item.start or 0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT kind, object_id, post_id, board_id, "
+                f"highlight({SEARCH_TABLE}, 0, %s, %s), "
+                f"snippet({SEARCH_TABLE}, 1, %s, %s, '…', 24) "
+                f"FROM {SEARCH_TABLE} WHERE {where} "
+                f"ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s",
+                [_MARK_START, _MARK_END, _MARK_START, _MARK_END, *params, limit, item.start or 0],
+            )
+            rows = cursor.fetchall()
+        return [
+            {
+                'kind': kind,
+                'object_id': object_id,
+                'post_id': post_id,
+                'board_id': board_id,
+                'title': _highlight(title),
+                'snippet': _highlight(snippet),
+            }
+            for kind, object_id, post_id, board_id, title, snippet in rows
+        ]
+
+
+def _index_rows(posts, responses, batch_size):
+    """
+    Строки индекса для постов и откликов порциями по batch_size, без загрузки всех объектов в память.
+    """
+    batch = []
+    for post in posts.iterator(chunk_size=batch_size):
+        batch.append(_row(post.title, html_to_text(post.content), 'post', post.pk, post.pk, post.board_id))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    for response in responses.iterator(chunk_size=batch_size):
+        batch.append(_row('', html_to_text(response.content), 'response', response.pk, response.post_id,
+                          response.post.board_id))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuild_index(posts, responses, batch_size=500):
+    """
+    Перестраивает индекс с нуля, потоково читая посты и отклики порциями.
+    Генерирует количество проиндексированных объектов после каждой порции.
+
+    Новый индекс строится в таблице REBUILD_TABLE, а основной все это время продолжает
+    обслуживать поиск. Перед подменой объекты, измененные или удаленные за время перестройки,
+    переносятся в новый индекс; подмена выполняется одной транзакцией.
+    """
+    started = timezone.now()
+    with connection.cursor() as cursor:
+        # Остаток прерванной перестройки.
+        cursor.execute(f"DROP TABLE IF EXISTS {REBUILD_TABLE}")
+        cursor.execute(_create_table_sql(REBUILD_TABLE))
+
+    for rows in _index_rows(posts, responses, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(_insert_sql(REBUILD_TABLE), rows)
+        yield len(rows)
+
+    changed_posts = posts.filter(updated_at__gte=started)
+    changed_responses = responses.filter(updated_at__gte=started)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for rows in _index_rows(changed_posts, changed_responses, batch_size):
+            cursor.executemany(f"DELETE FROM {REBUILD_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(_insert_sql(REBUILD_TABLE), rows)
+            # Пост мог быть перенесен на другую доску вместе с уже проиндексированными откликами.
+            cursor.executemany(
+                f"UPDATE {REBUILD_TABLE} SET board_id = %s "
+                f"WHERE rowid IN ({_responses_rowids_sql(responses.model._meta.db_table)})",
+                [(board_id, post_id) for _, _, _, kind, _, post_id, board_id in rows if kind == 'post'],
+            )
+        for kind, model in (('post', posts.model), ('response', responses.model)):
+            cursor.execute(
+                f"DELETE FROM {REBUILD_TABLE} WHERE kind = %s "
+                f"AND object_id NOT IN (SELECT id FROM {model._meta.db_table})",
+                [kind],
+            )
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+        cursor.execute(f"ALTER TABLE {REBUILD_TABLE} RENAME TO {SEARCH_TABLE}")
@@ -0,0 +1,271 @@
+import bisect
+import json
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import UserProfile
+from .content import render_content
+from .models import Board, Post, Response
+
+User = get_user_model()
+
+# Слова для синтетического текста постов и откликов.
+WORDS = (
+    'фанаты обсуждают новый сезон сериала персонажи сюжет концовка теория автор арт косплей '
+    'встреча клуб билеты концерт альбом песня клип обложка мерч фигурка коллекция редкий обмен '
+    'продам куплю ищу команда турнир стрим игра персонаж гайд билд патч обновление событие'
+).split()
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Временно отключает auto_now и auto_now_add, чтобы bulk_create сохранил заданные даты,
+    а не текущее время.
+    """
+    changed = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            for attr in ('auto_now', 'auto_now_add'):
+                if getattr(field, attr, False):
+                    setattr(field, attr, False)
+                    changed.append((field, attr))
+    try:
+        yield
+    finally:
+        for field, attr in changed:
+            setattr(field, attr, True)
+
+
+@contextmanager
+def fast_sqlite():
+    """
+    На время заполнения отключает синхронную запись SQLite и увеличивает кеш страниц:
+    данные синтетические, а вставка миллионов строк с обновлением индексов ускоряется в разы.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    pragmas = {'synchronous': 'OFF', 'cache_size': -256000}
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}')
+            previous[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name}={value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+
+
+# Показатели распределения Ципфа: чем больше, тем сильнее перекос к самым популярным.
+SKEW = {
+    'boards': 1.0,   # Несколько больших досок и длинный хвост маленьких.
+    'users': 0.8,    # Активные авторы пишут заметно больше остальных.
+    'posts': 0.5,    # Отклики сосредоточены на популярных постах, но не на одном.
+}
+
+
+class Seeder:
+    """
+    Генератор синтетических данных фанборда: пользователи, доски, посты и отклики.
+
+    Пользователи и доски вставляются через bulk_create, посты и отклики — через executemany
+    (см. _insert). Ни то, ни другое не отправляет сигналы сохранения, поэтому все, что обычно
+    поддерживают сигналы и save() (денормализованные счетчики, автор поста у отклика,
+    очищенный HTML), вычисляется здесь заранее. Полнотекстовый индекс
+    строится отдельно командой rebuild_search_index.
+
+    Популярность досок, постов и активность пользователей распределены неравномерно
+    (по закону Ципфа с показателями из SKEW),
+    даты постов растут от старых к новым, отклики приходят после поста.
+    Каждый метод seed_* — генератор, возвращающий количество вставленных строк после каждой порции.
+    """
+    def __init__(self, seed=0, batch_size=5000, days=365):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=days)
+        self.user_ids = array('q')
+        self.board_ids = array('q')
+        self.post_ids = array('q')
+        self.post_authors = array('q')
+        self.post_boards = array('l')
+        self.post_times = array('d')
+        self.contents = [self._content(number) for number in range(64)]
+
+    def _content(self, number):
+        words = self.random.choices(WORDS, k=self.random.randint(20, 120))
+        paragraphs = [' '.join(words[i:i + 25]).capitalize() + '.' for i in range(0, len(words), 25)]
+        html = ''.join(f'<p>{paragraph}</p>' for paragraph in paragraphs)
+        # Производные поля вычисляются один раз на шаблон, а не на каждую строку.
+        return html, render_content(html)
+
+    def _weights(self, count, kind):
+        return list(accumulate(1 / (rank + 1) ** SKEW[kind] for rank in range(count)))
+
+    def _pick(self, cum_weights, count):
+        total = cum_weights[-1]
+        return [bisect.bisect(cum_weights, self.random.random() * total) for _ in range(count)]
+
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def seed_users(self, count):
+        password = make_password(None)
+        offset = User.objects.count()
+        for start, size in self._batches(count):
+            users = [
+                User(username=f'seed{offset + number}', email=f'seed{offset + number}@example.com',
+                     password=password, is_active=True, date_joined=self.start)
+                for number in range(start, start + size)
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                UserProfile.objects.bulk_create(UserProfile(user_id=user.pk) for user in users)
+            self.user_ids.extend(user.pk for user in users)
+            yield size
+
+    def seed_boards(self, count):
+        offset = Board.objects.count()
+        for start, size in self._batches(count):
+            boards = [
+                Board(name=f'Доска {offset + number}', description=f'Синтетическая доска №{offset + number}',
+                      created_at=self.start, updated_at=self.start)
+                for number in range(start, start + size)
+            ]
+            with explicit_timestamps(Board), transaction.atomic():
+                Board.objects.bulk_create(boards)
+            self.board_ids.extend(board.pk for board in boards)
+            yield size
+
+    def _db_datetime(self, timestamp):
+        value = datetime.fromtimestamp(timestamp, dt_timezone.utc)
+        if connection.vendor == 'sqlite':
+            # Так же, как SQLite-бэкенд Django сохраняет даты при USE_TZ: строка в UTC без зоны.
+            return str(value.replace(tzinfo=None))
+        return value
+
+    def _rendered(self, index):
+        html, rendered = self.contents[index]
+        return (html, rendered['content_html'], rendered['excerpt'], rendered['word_count'],
+                json.dumps(rendered['image_refs']), rendered['content_hash'])
+
+    def _insert(self, model, fields, rows, return_ids=False):
+        """
+        Вставляет строки одним executemany. Для миллионов строк подготовка значений
+        в bulk_create стоит дороже самой вставки, поэтому значения готовятся здесь заранее.
+        С return_ids=True возвращает id вставленных строк по возрастанию.
+        """
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        with transaction.atomic(), connection.cursor() as cursor:
+            last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0 if return_ids else 0
+            cursor.executemany(f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows)
+            if return_ids:
+                return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+    def seed_posts(self, count, responses):
+        """
+        Создает посты и заранее распределяет между ними responses откликов,
+        чтобы сразу записать response_count.
+        """
+        self.response_counts = array('l', [0]) * count
+        self.board_activity = array('d', [0]) * len(self.board_ids)
+        post_weights = self._weights(count, 'posts')
+        # Популярны случайные посты, а не первые по порядку.
+        popular = array('l', range(count))
+        self.random.shuffle(popular)
+        for _, size in self._batches(responses):
+            for index in self._pick(post_weights, size):
+                self.response_counts[popular[index]] += 1
+
+        fields = ('content', *Post.RENDERED_FIELDS, 'title', 'created_at', 'updated_at',
+                  'author', 'board', 'views', 'response_count')
+        board_weights = self._weights(len(self.board_ids), 'boards')
+        user_weights = self._weights(len(self.user_ids), 'users')
+        start_ts = self.start.timestamp()
+        span = self.end.timestamp() - start_ts
+        for start, size in self._batches(count):
+            boards = self._pick(board_weights, size)
+            authors = self._pick(user_weights, size)
+            rows = []
+            for offset in range(size):
+                number = start + offset
+                board, author = boards[offset], self.user_ids[authors[offset]]
+                timestamp = start_ts + span * number / count
+                created = self._db_datetime(timestamp)
+                rows.append((
+                    *self._rendered(number % len(self.contents)),
+                    ' '.join(self.random.choices(WORDS, k=5)).capitalize(), created, created,
+                    author, self.board_ids[board], 0, self.response_counts[number],
+                ))
+                self.post_boards.append(board)
+                self.post_authors.append(author)
+                self.post_times.append(timestamp)
+                self.board_activity[board] = max(self.board_activity[board], timestamp)
+            self.post_ids.extend(self._insert(Post, fields, rows, return_ids=True))
+            yield size
+
+    def seed_responses(self):
+        fields = ('content', *Response.RENDERED_FIELDS, 'post', 'author', 'post_author',
+                  'created_at', 'updated_at', 'is_accepted')
+        user_weights = self._weights(len(self.user_ids), 'users')
+        end = self.end.timestamp()
+        rendered = [self._rendered(index) for index in range(len(self.contents))]
+        rows = []
+        for index, post_id in enumerate(self.post_ids):
+            posted = self.post_times[index]
+            board = self.post_boards[index]
+            responses = self.response_counts[index]
+            authors = self._pick(user_weights, responses)
+            for number in range(responses):
+                timestamp = self.random.uniform(posted, end)
+                self.board_activity[board] = max(self.board_activity[board], timestamp)
+                created = self._db_datetime(timestamp)
+                rows.append((
+                    *rendered[self.random.randrange(len(rendered))],
+                    post_id, self.user_ids[authors[number]], self.post_authors[index],
+                    created, created, self.random.random() < 0.1,
+                ))
+                if len(rows) >= self.batch_size:
+                    self._insert(Response, fields, rows)
+                    yield len(rows)
+                    rows = []
+        if rows:
+            self._insert(Response, fields, rows)
+            yield len(rows)
+
+    def update_board_counters(self):
+        """
+        Записывает денормализованные счетчики и время последней активности досок.
+        """
+        post_counts = [0] * len(self.board_ids)
+        response_counts = [0] * len(self.board_ids)
+        for index, board in enumerate(self.post_boards):
+            post_counts[board] += 1
+            response_counts[board] += self.response_counts[index]
+        boards = [
+            Board(
+                pk=pk, post_count=post_counts[index], response_count=response_counts[index],
+                last_activity_at=datetime.fromtimestamp(self.board_activity[index], self.end.tzinfo)
+                if self.board_activity[index] else None,
+            )
+            for index, pk in enumerate(self.board_ids)
+        ]
+        with transaction.atomic():
+            Board.objects.bulk_update(boards, ['post_count', 'response_count', 'last_activity_at'],
+                                      batch_size=self.batch_size)
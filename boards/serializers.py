@@ -0,0 +1,89 @@
+from rest_framework import serializers
+
+from .models import Board, Post, Response
+
+
+class SparseFieldsetSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор с поддержкой параметра ?fields=a,b,c: в ответ попадают только запрошенные поля.
+
+    default_fields — поля, которые отдаются без параметра ?fields.
+    field_sources — поля модели, нужные для каждого поля сериализатора; по ним
+    представление строит .only(), чтобы не загружать лишние колонки.
+    """
+    default_fields = None
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.requested_fields(self.context.get('request'))
+        for name in list(self.fields):
+            if name not in requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        """
+        Возвращает множество полей, которые нужно отдать: пересечение ?fields с полями сериализатора.
+        Неизвестные имена полей игнорируются.
+        """
+        available = set(cls.Meta.fields)
+        param = request.query_params.get('fields') if request is not None else None
+        if not param:
+            return set(cls.default_fields or available)
+        return {name.strip() for name in param.split(',')} & available
+
+    @classmethod
+    def model_fields(cls, request):
+        """
+        Возвращает поля модели для .only() с учетом запрошенных полей.
+        """
+        fields = {'pk'}
+        for name in cls.requested_fields(request):
+            fields.update(cls.field_sources.get(name, (name,)))
+        return sorted(fields)
+
+
+class BoardSerializer(SparseFieldsetSerializer):
+    class Meta:
+        model = Board
+        fields = ['id', 'name', 'description', 'post_count', 'response_count', 'last_activity_at']
+
+
+class PostListSerializer(SparseFieldsetSerializer):
+    """
+    Пост в списке: без содержимого, только выдержка.
+    """
+    author = serializers.CharField(source='author.username', read_only=True)
+    board = serializers.IntegerField(source='board_id', read_only=True)
+
+    field_sources = {
+        'author': ('author__username',),
+        'board': ('board_id',),
+    }
+
+    class Meta:
+        model = Post
+        fields = ['id', 'title', 'author', 'board', 'created_at', 'views', 'response_count', 'excerpt', 'word_count']
+
+
+class PostDetailSerializer(PostListSerializer):
+    """
+    Пост целиком: очищенный HTML вместо исходного содержимого CKEditor.
+    """
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ['updated_at', 'content_html', 'image_refs']
+
+
+class ResponseSerializer(SparseFieldsetSerializer):
+    author = serializers.CharField(source='author.username', read_only=True)
+    post = serializers.IntegerField(source='post_id', read_only=True)
+
+    field_sources = {
+        'author': ('author__username',),
+        'post': ('post_id',),
+    }
+
+    class Meta:
+        model = Response
+        fields = ['id', 'post', 'author', 'created_at', 'is_accepted', 'content_html']
@@ -1,15 +1,21 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.urls import reverse
-from .models import Response
+from django.utils import timezone
+from main.outbox import enqueue_mail
+
+from .models import Board, Post, Response
+from .counters import increment_board_counters, increment_post_response_count
+from . import search
+from .page_cache import bump_versions
+from .storage import update_references
 
 @receiver(post_save, sender=Response)
 def send_response_notification_email(sender, instance, created, **kwargs):
     """
-    Отправляет email-уведомление автору поста при создании нового отклика.
+    Ставит в очередь email-уведомление автору поста при создании нового отклика.
     Уведомление отправляется только при создании отклика, не при его обновлении.
     """
     if created:
@@ -34,7 +40,7 @@ def send_response_notification_email(sender, instance, created, **kwargs):
             'post_title': post.title,
             'response_author_username': response_author.username,
             'response_author_email': response_author.email,
-            'response_content': response.content,
+            'response_content': response.content_html,
             'post_url': post_url,
         }
 
@@ -44,20 +50,183 @@ def send_response_notification_email(sender, instance, created, **kwargs):
             f"Здравствуйте, {post_author.username if post_author.username else post_author.email}!\n\n"
             f"На ваш пост \"{post.title}\" был оставлен новый отклик.\n\n"
             f"Автор отклика: {response_author.username if response_author.username else response_author.email}\n"
-            f"Содержание отклика: {response.content}\n\n"
+            f"Содержание отклика: {response.excerpt}\n\n"
             f"Перейти к посту: {post_url}\n\n"
             f"С уважением,\nКоманда фан-ресурса."
         )
 
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [post_author.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            print(f"DEBUG: Отправлено уведомление о новом отклике на пост '{post.title}' автору {post_author.email}")
-        except Exception as e:
-            print(f"ERROR: Не удалось отправить уведомление о новом отклике на пост '{post.title}' автору {post_author.email}: {e}")
\ No newline at end of file
+        # Письмо ставится в исходящую очередь и отправляется фоновым процессом run_mail_worker.
+        enqueue_mail(
+            subject,
+            plain_message,
+            [post_author.email],
+            html_message=html_message,
+        )
+
+
+@receiver(post_save, sender=Post)
+def increment_counters_on_post_create(sender, instance, created, **kwargs):
+    """
+    Увеличивает счетчик постов доски и обновляет время последней активности.
+    """
+    if created:
+        increment_board_counters({'pk': instance.board_id}, posts=1, activity_at=instance.created_at)
+
+
+@receiver(post_save, sender=Post)
+def sync_response_post_author(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Обновляет денормализованного автора объявления в откликах, если автор поста сменился
+    (например, в админ-панели). Обычное редактирование поста автора не меняет и запроса не делает.
+    """
+    if update_fields and not {'author', 'author_id'} & set(update_fields):
+        return
+    loaded_author_id = getattr(instance, '_loaded_author_id', None)
+    instance._loaded_author_id = instance.author_id
+    if created or loaded_author_id == instance.author_id:
+        return
+    Response.objects.filter(post=instance).exclude(post_author_id=instance.author_id).update(
+        post_author_id=instance.author_id
+    )
+
+
+@receiver(post_save, sender=Post)
+def touch_board_on_post_change(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Сдвигает время изменения доски при редактировании поста: состояние страницы доски
+    читает только строку доски (см. conditional.py). Если пост перенесен, сдвигается и прежняя доска.
+    Сохранения, не меняющие заголовок, автора или доску (например, перерисовка HTML), доску не трогают.
+    Должен быть подключен раньше update_search_index_on_post_save, который сбрасывает _loaded_board_id.
+    """
+    if created or update_fields and not {'title', 'author', 'author_id', 'board', 'board_id'} & set(update_fields):
+        return
+    board_ids = {instance.board_id, getattr(instance, '_loaded_board_id', None)} - {None}
+    increment_board_counters({'pk__in': board_ids}, touched_at=instance.updated_at)
+
+
+@receiver(post_delete, sender=Post)
+def decrement_counters_on_post_delete(sender, instance, **kwargs):
+    """
+    Уменьшает счетчик постов доски при удалении поста.
+    Время изменения доски сдвигается: иначе Last-Modified страниц не заметил бы удаления
+    и клиент с одним If-Modified-Since получал бы 304 (см. conditional.py).
+    """
+    increment_board_counters({'pk': instance.board_id}, posts=-1, touched_at=timezone.now())
+
+
+@receiver(post_save, sender=Response)
+def increment_counters_on_response_create(sender, instance, created, **kwargs):
+    """
+    Увеличивает счетчики откликов поста и доски и обновляет время последней активности.
+    Время изменения поста сдвигается: состояние страницы поста читает только строку поста.
+    """
+    if created:
+        increment_post_response_count(instance.post_id, 1, touched_at=instance.created_at)
+        increment_board_counters({'posts': instance.post_id}, responses=1, activity_at=instance.created_at)
+
+
+@receiver(post_save, sender=Response)
+def touch_post_on_response_change(sender, instance, created, **kwargs):
+    """
+    Сдвигает время изменения поста при редактировании отклика (текст, принятие, перерисовка HTML),
+    чтобы страница поста получила новый Last-Modified и ETag.
+    """
+    if not created:
+        increment_post_response_count(instance.post_id, 0, touched_at=instance.updated_at)
+
+
+@receiver(post_delete, sender=Response)
+def decrement_counters_on_response_delete(sender, instance, **kwargs):
+    """
+    Уменьшает счетчики откликов поста и доски при удалении отклика.
+    Доска находится подзапросом по post_id, чтобы не загружать пост для каждого удаляемого отклика.
+    Время изменения поста и доски сдвигается, чтобы удаление меняло Last-Modified их страниц.
+    """
+    now = timezone.now()
+    increment_post_response_count(instance.post_id, -1, touched_at=now)
+    increment_board_counters({'posts': instance.post_id}, responses=-1, touched_at=now)
+
+
+@receiver(post_save, sender=Post)
+def update_search_index_on_post_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Обновляет пост в полнотекстовом индексе при создании и редактировании.
+    Отклики в индексе переписываются, только если пост перенесен на другую доску.
+    """
+    if update_fields and not {'title', 'content', 'board', 'board_id'} & set(update_fields):
+        return
+    loaded_board_id = getattr(instance, '_loaded_board_id', None)
+    instance._loaded_board_id = instance.board_id
+    search.index_post(instance, board_changed=not created and loaded_board_id != instance.board_id)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_search_index(sender, instance, **kwargs):
+    """
+    Удаляет пост из полнотекстового индекса.
+    """
+    search.remove_from_index('post', instance.pk)
+
+
+@receiver(post_save, sender=Response)
+def update_search_index_on_response_save(sender, instance, update_fields=None, **kwargs):
+    """
+    Обновляет отклик в полнотекстовом индексе при создании и редактировании.
+    """
+    if update_fields and 'content' not in update_fields:
+        return
+    search.index_response(instance, instance.post.board_id)
+
+
+@receiver(post_delete, sender=Response)
+def remove_response_from_search_index(sender, instance, **kwargs):
+    """
+    Удаляет отклик из полнотекстового индекса.
+    """
+    search.remove_from_index('response', instance.pk)
+
+
+
+@receiver([post_save, post_delete], sender=Board)
+def invalidate_page_cache_on_board_change(sender, instance, **kwargs):
+    """
+    Сбрасывает закешированные страницы списка досок и самой доски.
+    """
+    bump_versions('boards', f'board:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_page_cache_on_post_change(sender, instance, **kwargs):
+    """
+    Сбрасывает закешированные страницы поста, его доски и список досок (там выводятся счетчики).
+    """
+    bump_versions('boards', f'board:{instance.board_id}', f'post:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Response)
+def invalidate_page_cache_on_response_change(sender, instance, **kwargs):
+    """
+    Сбрасывает закешированную страницу поста и список досок (там выводятся счетчики).
+    """
+    bump_versions('boards', f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Response)
+def update_media_references_on_save(sender, instance, **kwargs):
+    """
+    Учитывает в MediaBlob добавленные и убранные из содержимого изображения.
+    """
+    change = instance.pop_image_refs_change()
+    if change is not None:
+        update_references(*change)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Response)
+def release_media_references_on_delete(sender, instance, **kwargs):
+    """
+    Снимает ссылки удаленного поста или отклика с файлов его изображений.
+    """
+    if 'image_refs' not in instance.get_deferred_fields():
+        update_references(instance.image_refs, [])
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище загрузок CKEditor с адресацией по содержимому (CKEDITOR_5_FILE_STORAGE).
+
+    Файл сохраняется как <prefix>/ab/cd/<sha256><расширение>: хеш считается при потоковом
+    копировании во временный файл, поэтому загрузка не читается в память целиком.
+    Повторная загрузка того же содержимого не записывает файл, а возвращает имеющийся адрес.
+
+    MediaBlob хранит число постов и откликов, содержимое которых ссылается на файл
+    (image_refs, см. update_references). Загрузка сама ссылкой не считается: файл, на который
+    так и не сослались или ссылки на который удалены, удаляет команда collect_media после
+    отсрочки UPLOADS['UNREFERENCED_TTL'].
+    """
+    def __init__(self, prefix=None, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = (settings.CKEDITOR_5_UPLOAD_PATH if prefix is None else prefix).strip('/')
+
+    def blob_name(self, digest, extension):
+        """
+        Имя файла в хранилище для хеша: два уровня каталогов по первым символам хеша,
+        чтобы в одном каталоге не скапливались тысячи файлов.
+        """
+        name = f'{digest[:2]}/{digest[2:4]}/{digest}{extension.lower()}'
+        return f'{self.prefix}/{name}' if self.prefix else name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save(); суффиксы Django не нужны.
+        return name
+
+    def temp_dir(self):
+        """
+        Каталог временных файлов внутри хранилища: готовый файл переносится на место
+        переименованием в пределах одной файловой системы.
+        """
+        path = self.path(f'{self.prefix}/tmp' if self.prefix else 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _move_into_place(self, source, blob):
+        if self.exists(blob):
+            return
+        os.makedirs(os.path.dirname(self.path(blob)), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(source, self.file_permissions_mode)
+        file_move_safe(source, self.path(blob), allow_overwrite=True)
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1]
+        if getattr(content, 'sha256', None) and hasattr(content, 'temporary_file_path'):
+            # Загрузка уже записана на диск и захеширована потоковым обработчиком (см. boards/uploads.py).
+            blob = self.blob_name(content.sha256, extension)
+            self._move_into_place(content.temporary_file_path(), blob)
+            self.add_reference(blob, content.sha256, content.size, count=0)
+            return blob
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.temp_dir())
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            blob = self.blob_name(digest.hexdigest(), extension)
+            self._move_into_place(tmp_path, blob)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.add_reference(blob, digest.hexdigest(), size, count=0)
+        return blob
+
+    def add_reference(self, name, digest, size, count=1):
+        """
+        Добавляет count ссылок на файл, создавая запись MediaBlob при первой загрузке.
+        count=0 только регистрирует загруженный файл; если ссылок на него нет,
+        отсрочка удаления отсчитывается заново.
+        """
+        # Импорт внутри метода: хранилище создается раньше, чем загружаются модели.
+        from .models import MediaBlob
+
+        for _ in range(2):
+            if count:
+                found = MediaBlob.objects.filter(path=name).update(
+                    refcount=F('refcount') + count, unreferenced_since=None
+                )
+            else:
+                MediaBlob.objects.filter(path=name, refcount=0).update(unreferenced_since=timezone.now())
+                found = MediaBlob.objects.filter(path=name).exists()
+            if found:
+                return
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(
+                        sha256=digest, path=name, size=size, refcount=count,
+                        unreferenced_since=None if count else timezone.now(),
+                    )
+                return
+            except IntegrityError:
+                # Ту же запись одновременно создала параллельная загрузка; повторяем обновление.
+                continue
+
+    def delete(self, name):
+        """
+        Удаляет файл с диска вместе с записью MediaBlob, если на него нет ссылок.
+        Файл, на который ссылается содержимое, не удаляется. Файлы, не учтенные в MediaBlob,
+        удаляются сразу.
+        """
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            if MediaBlob.objects.filter(path=name, refcount__gt=0).exists():
+                return
+            MediaBlob.objects.filter(path=name).delete()
+        super().delete(name)
+
+
+def _blob_paths(urls):
+    from .models import UploadedImage
+
+    return {path for path in map(UploadedImage.path_from_url, urls) if path}
+
+
+def update_references(old_urls, new_urls):
+    """
+    Учитывает в MediaBlob изменение ссылок одного поста или отклика на изображения:
+    old_urls и new_urls — его image_refs до и после сохранения (после удаления — пустой список).
+    Повторы одного адреса в содержимом считаются одной ссылкой.
+    """
+    from .models import MediaBlob
+
+    old_paths, new_paths = _blob_paths(old_urls), _blob_paths(new_urls)
+    added, removed = new_paths - old_paths, old_paths - new_paths
+    if added:
+        MediaBlob.objects.filter(path__in=added).update(refcount=F('refcount') + 1, unreferenced_since=None)
+    if removed:
+        MediaBlob.objects.filter(path__in=removed, refcount__gt=0).update(refcount=F('refcount') - 1)
+        # С последней ссылкой начинается отсрочка удаления файла (см. collect_media).
+        MediaBlob.objects.filter(path__in=removed, refcount=0, unreferenced_since__isnull=True).update(
+            unreferenced_since=timezone.now()
+        )
+
+
+def recount_references(chunk_size=500):
+    """
+    Пересчитывает ссылки всех файлов по image_refs постов и откликов, например после
+    изменения содержимого в обход save() (bulk_update, update()).
+    Возвращает количество исправленных записей MediaBlob.
+    """
+    from .models import MediaBlob, Post, Response
+
+    counts = Counter()
+    for model in (Post, Response):
+        for refs in model.objects.exclude(image_refs=[]).values_list('image_refs', flat=True).iterator(chunk_size):
+            counts.update(_blob_paths(refs))
+
+    fixed = 0
+    now = timezone.now()
+    for blob in MediaBlob.objects.only('pk', 'path', 'refcount', 'unreferenced_since').iterator(chunk_size):
+        refcount = counts.get(blob.path, 0)
+        if blob.refcount == refcount:
+            continue
+        blob.refcount = refcount
+        # Отсрочка удаления файла, потерявшего последнюю ссылку, отсчитывается от пересчета.
+        blob.unreferenced_since = None if refcount else now
+        blob.save(update_fields=['refcount', 'unreferenced_since'])
+        fixed += 1
+    return fixed
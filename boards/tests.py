@@ -1,3 +1,1487 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import os
+import shutil
+import struct
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from inspect import iscoroutinefunction
+from unittest import mock
 
-# Здесь будут расположены ваши тесты.
\ No newline at end of file
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection
+from django.apps import apps
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse, set_urlconf
+from django.utils import timezone
+from django_ckeditor_5.storage_utils import get_django_storage
+from PIL import Image
+
+from main.asynchronous import ASGIHandler
+from main.testing import QueryBudgetMixin
+from . import images, search, uploads, view_counter
+from .admin import ResponseAdmin
+from .conditional import board_state, post_state
+from .content import render_content, sanitize_html
+from .images import make_variants, process_image, rerender_referencing
+from .models import (
+    Board, MediaBlob, Newsletter, NewsletterDelivery, Post, Response, UploadedImage, UploadSession,
+)
+from .newsletter import claim_chunk, prepare_deliveries, send_newsletter
+from .page_cache import get_stats
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate
+from . import views
+from .views import upload_image
+
+User = get_user_model()
+
+MB = 1024 * 1024
+
+
+class _MultipartStream:
+    """
+    Тело multipart-запроса с одним файлом, которое генерируется при чтении,
+    чтобы тест не держал в памяти сам загружаемый файл.
+    """
+    boundary = 'uploadboundary'
+
+    def __init__(self, filename, head, size):
+        self.parts = [
+            (f'--{self.boundary}\r\nContent-Disposition: form-data; name="upload"; filename="{filename}"\r\n'
+             f'Content-Type: application/octet-stream\r\n\r\n').encode() + head,
+            None,
+            f'\r\n--{self.boundary}--\r\n'.encode(),
+        ]
+        self.padding = size - len(head)
+        self.length = len(self.parts[0]) + self.padding + len(self.parts[2])
+        self.position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self.position
+        chunks = []
+        offset = self.position
+        for part in self.parts:
+            part_length = self.padding if part is None else len(part)
+            if size and offset < part_length:
+                take = min(size, part_length - offset)
+                chunks.append(bytes(take) if part is None else part[offset:offset + take])
+                size -= take
+                self.position += take
+                offset = 0
+            else:
+                offset -= min(offset, part_length)
+        return b''.join(chunks)
+
+    def readline(self, size=-1):
+        line = b''
+        while not line.endswith(b'\n') and len(line) != size:
+            byte = self.read(1)
+            if not byte:
+                break
+            line += byte
+        return line
+
+
+def _bmp_header(width, height):
+    row = width * 3
+    data = row * height
+    return b'BM' + struct.pack('<IHHI', 54 + data, 0, 0, 54) + struct.pack(
+        '<IiiHHIIiiII', 40, width, height, 1, 24, 0, data, 2835, 2835, 0, 0
+    )
+
+
+@override_settings(CKEDITOR_5_FILE_UPLOAD_PERMISSION='authenticated', ALLOWED_HOSTS=['testserver'])
+class StreamingUploadTests(TestCase):
+    """
+    Тесты потокового приема загрузок CKEditor (boards/uploads.py).
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        self.user = User.objects.create_user('uploader', 'uploader@example.com')
+
+    def _post(self, stream):
+        environ = RequestFactory()._base_environ(
+            PATH_INFO='/ckeditor5/image_upload/',
+            REQUEST_METHOD='POST',
+            CONTENT_TYPE=f'multipart/form-data; boundary={stream.boundary}',
+            CONTENT_LENGTH=str(stream.length),
+            **{'wsgi.input': stream},
+        )
+        request = WSGIRequest(environ)
+        request.user = self.user
+        request._dont_enforce_csrf_checks = True
+        return upload_image(request)
+
+    def test_200mb_upload_is_streamed_with_bounded_memory(self):
+        width, height = 8192, 8150
+        size = 54 + width * 3 * height
+        stream = _MultipartStream('big.bmp', _bmp_header(width, height), size)
+        self.assertGreater(size, 200 * 1000 * 1000)
+
+        tracemalloc.start()
+        try:
+            response = self._post(stream)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        # Пиковая память определяется порцией чтения (1 МБ), а не размером файла.
+        self.assertLess(peak, 8 * MB)
+        blob = MediaBlob.objects.get()
+        self.assertEqual(blob.size, size)
+        self.assertEqual(os.path.getsize(os.path.join(self.media_root, blob.path)), size)
+        self.assertTrue(UploadedImage.objects.filter(path=blob.path).exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'tmp')), [])
+
+    @override_settings(UPLOADS={'MAX_FILE_SIZE': 10 * MB, 'CHUNK_SIZE': 64 * 1024})
+    def test_oversized_upload_is_rejected_without_reading_body(self):
+        stream = _MultipartStream('big.bmp', _bmp_header(8192, 8150), 200 * MB)
+        response = self._post(stream)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(stream.position, 0)
+        self.assertFalse(MediaBlob.objects.exists())
+
+    @override_settings(UPLOADS={'CHUNK_SIZE': 64 * 1024})
+    def test_upload_without_image_signature_is_aborted_early(self):
+        stream = _MultipartStream('fake.png', b'not an image at all', 50 * MB)
+        response = self._post(stream)
+        self.assertEqual(response.status_code, 400)
+        self.assertLess(stream.position, 1 * MB)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads', 'tmp')), [])
+
+    @override_settings(UPLOADS={'USER_BYTES_PER_HOUR': 5 * MB, 'CHUNK_SIZE': 64 * 1024})
+    def test_user_byte_quota_aborts_upload_while_streaming(self):
+        stream = _MultipartStream('big.bmp', _bmp_header(2048, 2048), 12 * MB)
+        response = self._post(stream)
+        self.assertEqual(response.status_code, 429)
+        self.assertLess(stream.position, 6 * MB)
+
+    @override_settings(UPLOADS={'USER_UPLOADS_PER_MINUTE': 1})
+    def test_resumable_upload_continues_from_last_offset(self):
+        self.client.force_login(self.user)
+        content = _bmp_header(64, 64) + bytes(64 * 64 * 3)
+        response = self.client.post('/ckeditor5/uploads/', {'filename': 'pic.bmp', 'size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        url = f"/ckeditor5/uploads/{response.json()['id']}/"
+
+        response = self.client.put(url, content[:5000], content_type='application/octet-stream',
+                                   headers={'Upload-Offset': '0'})
+        self.assertEqual(response.json(), {'offset': 5000, 'size': len(content)})
+        # Повтор уже принятой части после обрыва соединения отклоняется с текущим смещением.
+        response = self.client.put(url, content[:5000], content_type='application/octet-stream',
+                                   headers={'Upload-Offset': '0'})
+        self.assertEqual(response.status_code, 409)
+        offset = self.client.get(url).json()['offset']
+        response = self.client.put(url, content[offset:], content_type='application/octet-stream',
+                                   headers={'Upload-Offset': str(offset)})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()['url'].endswith('.bmp'))
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(MediaBlob.objects.get().size, len(content))
+
+        # Лимит начатых загрузок в минуту.
+        response = self.client.post('/ckeditor5/uploads/', {'filename': 'pic.bmp', 'size': len(content)})
+        self.assertEqual(response.status_code, 429)
+
+    def _start_resumable(self, content):
+        self.client.force_login(self.user)
+        response = self.client.post('/ckeditor5/uploads/', {'filename': 'pic.bmp', 'size': len(content)})
+        return UploadSession.objects.get(pk=response.json()['id']), f"/ckeditor5/uploads/{response.json()['id']}/"
+
+    def test_concurrent_part_with_same_offset_does_not_overwrite_winner(self):
+        content = _bmp_header(64, 64) + bytes(64 * 64 * 3)
+        session, url = self._start_resumable(content)
+        winner = content[:4000]
+        receive_part = uploads.receive_part
+        raced = []
+
+        def racing_receive_part(*args, **kwargs):
+            # Пока часть читается, параллельный запрос с тем же смещением успевает ее принять.
+            part = receive_part(*args, **kwargs)
+            if not raced:
+                raced.append(True)
+                response = self.client.put(url, winner, content_type='application/octet-stream',
+                                           headers={'Upload-Offset': '0'})
+                self.assertEqual(response.status_code, 200)
+            return part
+
+        with mock.patch.object(uploads, 'receive_part', racing_receive_part):
+            response = self.client.put(url, content[:5000], content_type='application/octet-stream',
+                                       headers={'Upload-Offset': '0'})
+
+        self.assertEqual(response.status_code, 409)
+        storage = get_django_storage()
+        with open(uploads.part_path(storage, session), 'rb') as part:
+            self.assertEqual(part.read(), winner)
+
+    def test_rejected_first_part_leaves_no_files(self):
+        content = _bmp_header(64, 64) + bytes(64 * 64 * 3)
+        session, url = self._start_resumable(content)
+
+        response = self.client.put(url, b'not an image' * 10, content_type='application/octet-stream',
+                                   headers={'Upload-Offset': '0'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(os.listdir(uploads.temp_dir(get_django_storage())), [])
+        self.assertEqual(self.client.get(url).json()['offset'], 0)
+
+
+@override_settings(UPLOADS={'UNREFERENCED_TTL': 60})
+class MediaReferenceTests(TestCase):
+    """
+    Учет ссылок на файлы хранилища с адресацией по содержимому и команды collect_media и dedupe_media.
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.storage = get_django_storage()
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+
+    def upload(self, data=b'picture'):
+        return self.storage.save('picture.png', ContentFile(data))
+
+    def post(self, *names):
+        content = ''.join(f'<p><img src="{self.storage.url(name)}"></p>' for name in names) or '<p>Текст</p>'
+        return Post.objects.create(title='Пост', content=content, author=self.author, board=self.board)
+
+    def blob(self, name):
+        return MediaBlob.objects.get(path=name)
+
+    def age(self, seconds=3600):
+        MediaBlob.objects.exclude(unreferenced_since=None).update(
+            unreferenced_since=timezone.now() - timedelta(seconds=seconds)
+        )
+
+    def test_upload_is_stored_once_without_references(self):
+        name = self.upload()
+        self.assertEqual(self.upload(), name)
+        blob = self.blob(name)
+        self.assertEqual(blob.refcount, 0)
+        self.assertIsNotNone(blob.unreferenced_since)
+        self.assertTrue(self.storage.exists(name))
+
+    def test_references_follow_content_changes_and_deletes(self):
+        name = self.upload()
+        first = self.post(name, name)
+        # Повтор изображения в одном посте — одна ссылка.
+        self.assertEqual(self.blob(name).refcount, 1)
+        second = self.post(name)
+        response = Response.objects.create(post=second, author=self.author,
+                                           content=f'<img src="{self.storage.url(name)}">')
+        self.assertEqual(self.blob(name).refcount, 3)
+
+        first.content = '<p>Без картинки</p>'
+        first.save()
+        self.assertEqual(self.blob(name).refcount, 2)
+        response.delete()
+        self.assertEqual(self.blob(name).refcount, 1)
+        self.assertIsNone(self.blob(name).unreferenced_since)
+        # Удаление поста снимает и ссылки его откликов (каскад), и его собственную.
+        second.delete()
+        blob = self.blob(name)
+        self.assertEqual(blob.refcount, 0)
+        self.assertIsNotNone(blob.unreferenced_since)
+
+    def test_collect_media_deletes_only_old_unreferenced_files(self):
+        referenced, orphan, recent = self.upload(b'used'), self.upload(b'orphan'), self.upload(b'recent')
+        self.post(referenced)
+        self.age()
+        MediaBlob.objects.filter(path=recent).update(unreferenced_since=timezone.now())
+
+        call_command('collect_media', stdout=io.StringIO())
+
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertFalse(MediaBlob.objects.filter(path=orphan).exists())
+        self.assertTrue(self.storage.exists(referenced))
+        self.assertTrue(self.storage.exists(recent))
+
+    def test_collect_media_recount_fixes_references_changed_behind_save(self):
+        name = self.upload()
+        post = self.post(name)
+        Post.objects.filter(pk=post.pk).update(image_refs=[])
+
+        call_command('collect_media', stdout=io.StringIO())
+        # Без пересчета файл все еще числится используемым.
+        self.assertTrue(self.storage.exists(name))
+
+        call_command('collect_media', recount=True, stdout=io.StringIO())
+        self.assertEqual(self.blob(name).refcount, 0)
+        self.age()
+        call_command('collect_media', stdout=io.StringIO())
+        self.assertFalse(self.storage.exists(name))
+
+    def write_legacy(self, name, data):
+        path = os.path.join(self.media_root, 'uploads', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as legacy:
+            legacy.write(data)
+        return path
+
+    def test_dedupe_media_merges_duplicates_and_rewrites_content(self):
+        first = self.write_legacy('one.png', b'same')
+        second = self.write_legacy('old/two.png', b'same')
+        post = self.post('uploads/one.png', 'uploads/old/two.png')
+
+        call_command('dedupe_media', stdout=io.StringIO())
+
+        blob = MediaBlob.objects.get()
+        post.refresh_from_db()
+        self.assertEqual(post.image_refs, [self.storage.url(blob.path)] * 2)
+        self.assertEqual(blob.refcount, 1)
+        self.assertTrue(self.storage.exists(blob.path))
+        self.assertFalse(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+
+    def test_dedupe_media_keeps_old_files_until_content_is_rewritten(self):
+        legacy = self.write_legacy('one.png', b'same')
+        post = self.post('uploads/one.png')
+
+        with mock.patch('boards.management.commands.dedupe_media.Command._relink', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('dedupe_media', stdout=io.StringIO())
+        # Содержимое ссылается на старый адрес, и файл по нему на месте.
+        self.assertTrue(os.path.exists(legacy))
+
+        call_command('dedupe_media', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image_refs, [self.storage.url(MediaBlob.objects.get().path)])
+        self.assertFalse(os.path.exists(legacy))
+
+
+@override_settings(IMAGE_PIPELINE={'WIDTHS': {'thumbnail': 320, 'medium': 960, 'large': 1600},
+                                   'FALLBACK_WIDTH': 960, 'MAX_PIXELS': 20_000_000})
+class ImageVariantTests(TestCase):
+    """
+    Тесты создания вариантов изображений и подстановки srcset в содержимое.
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+
+    def image(self, size, fmt='JPEG', mode='RGB', name='pic.jpg', **save_kwargs):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 100, 50, 128)[:len(mode)]).save(buffer, fmt, **save_kwargs)
+        path = default_storage.save(f'uploads/{name}', ContentFile(buffer.getvalue()))
+        return UploadedImage.objects.create(path=path, size=len(buffer.getvalue()))
+
+    def test_variants_for_each_width_and_fallback(self):
+        image = self.image((2000, 1000))
+        width, height, variants = make_variants(image)
+
+        self.assertEqual((width, height), (2000, 1000))
+        self.assertEqual(
+            [(v['name'], v['format'], v['width'], v['height']) for v in variants],
+            [('thumbnail', 'WEBP', 320, 160), ('medium', 'WEBP', 960, 480), ('large', 'WEBP', 1600, 800),
+             ('fallback', 'JPEG', 960, 480)],
+        )
+        for variant in variants:
+            self.assertEqual(default_storage.size(variant['path']), variant['size'])
+
+    def test_small_image_is_not_upscaled(self):
+        _, _, variants = make_variants(self.image((500, 250)))
+        self.assertEqual([(v['name'], v['width']) for v in variants],
+                         [('thumbnail', 320), ('medium', 500), ('fallback', 500)])
+
+    def test_transparent_png_falls_back_to_png(self):
+        _, _, variants = make_variants(self.image((400, 400), fmt='PNG', mode='RGBA', name='pic.png'))
+        self.assertEqual(variants[-1]['format'], 'PNG')
+
+    def test_exif_rotation_swaps_dimensions(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        width, height, variants = make_variants(self.image((400, 200), exif=exif))
+        self.assertEqual((width, height), (200, 400))
+        self.assertEqual((variants[0]['width'], variants[0]['height']), (200, 400))
+
+    def test_large_jpeg_is_decoded_at_reduced_scale(self):
+        image = self.image((4000, 3000))
+        with default_storage.open(image.path, 'rb') as source:
+            picture, width, height = images._open(source, images.get_config())
+            picture.load()
+        self.assertEqual((width, height), (4000, 3000))
+        # Самый широкий вариант — 1600: достаточно декодировать в масштабе 1/2.
+        self.assertEqual(picture.size, (2000, 1500))
+
+    def test_image_above_pixel_limit_is_rejected(self):
+        image = self.image((2000, 1000))
+        with override_settings(IMAGE_PIPELINE={'MAX_PIXELS': 1_000_000}), self.assertLogs('boards.images', 'ERROR'):
+            self.assertFalse(process_image(image))
+        image.refresh_from_db()
+        self.assertEqual(image.status, UploadedImage.STATUS_FAILED)
+        self.assertIn('2000×1000', image.error)
+        self.assertFalse(default_storage.exists(f"{images.get_config()['VARIANTS_DIR']}uploads"))
+
+    def test_img_attrs_builds_srcset(self):
+        image = self.image((2000, 1000))
+        self.assertIsNone(image.img_attrs())
+        image.variants = make_variants(image)[2]
+        attrs = image.img_attrs()
+
+        self.assertTrue(attrs['src'].endswith('-fallback.jpg'))
+        self.assertEqual([item.rsplit(' ', 1)[1] for item in attrs['srcset'].split(', ')], ['320w', '960w', '1600w'])
+        self.assertEqual(attrs['sizes'], '(max-width: 1600px) 100vw, 1600px')
+        self.assertEqual((attrs['width'], attrs['height']), (960, 480))
+
+    def test_processing_rewrites_referencing_content(self):
+        image = self.image((2000, 1000))
+        post = Post.objects.create(title='Пост', content=f'<p><img src="{image.url}" alt="кадр"></p>',
+                                   author=self.author, board=self.board)
+        response = Response.objects.create(post=post, author=self.author, content=f'<img src="{image.url}">')
+        Post.objects.filter(pk=post.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertNotIn('srcset', post.content_html)
+
+        self.assertTrue(process_image(image))
+
+        post.refresh_from_db()
+        response.refresh_from_db()
+        for html in (post.content_html, response.content_html):
+            self.assertIn('srcset="', html)
+            self.assertIn('-fallback.jpg"', html)
+            self.assertIn('width="960"', html)
+        self.assertIn('alt="кадр"', post.content_html)
+        # Адреса в image_refs остаются адресами оригинала.
+        self.assertEqual(post.image_refs, [image.url])
+        self.assertGreater(post.updated_at, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(rerender_referencing(image), 2)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    PAGE_CACHE={'ENABLED': False},
+    # Просмотры пишутся сразу, без буфера со сбросом по времени, чтобы число запросов не плавало.
+    VIEW_COUNTER={'ENABLED': False},
+)
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджеты SQL-запросов и прочитанных строк для каждого URL из boards/urls.py.
+    Каждый бюджет проверяется на двух объемах данных: число запросов не должно расти вместе
+    с количеством досок, постов и откликов. Бюджет строк задан по большему объему.
+    """
+    DATA_SIZES = (3, 45)
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.board = Board.objects.create(name='Доска 0')
+        self.post = Post.objects.create(title='Пост 0', content='<p>Первый пост о сериале</p>',
+                                        author=self.author, board=self.board)
+
+    def grow_data(self, size):
+        """
+        Доводит число досок до size // 3, постов на доске и откликов на первый пост — до size.
+        Все отклики адресованы автору, поэтому растет и страница «Отклики на мои объявления».
+        """
+        for number in range(Board.objects.count(), max(size // 3, 1)):
+            Board.objects.create(name=f'Доска {number}')
+        for number in range(self.board.posts.count(), size):
+            Post.objects.create(title=f'Пост {number}', content=f'<p>Пост о сериале {number}</p>',
+                                author=self.author, board=self.board)
+        for number in range(self.post.responses.count(), size):
+            Response.objects.create(post=self.post, author=self.reader, content=f'<p>Отклик {number}</p>')
+
+    def _response(self, author=None):
+        return Response.objects.create(post=self.post, author=author or self.reader, content='<p>Отклик</p>')
+
+    def test_board_list(self):
+        # Список досок не разбит на страницы: строки — все 15 досок и состояние для ETag.
+        for size, budget in self.budget_at_sizes(queries=2, rows=16):
+            with budget:
+                response = self.client.get(reverse('boards:list'))
+            self.assertEqual(response.status_code, 200)
+        for size, budget in self.budget_at_sizes(queries=2, rows=16):
+            with budget:
+                response = self.client.get(reverse('boards:list'), {'sort': 'activity'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_search(self):
+        for size, budget in self.budget_at_sizes(queries=3, rows=36):
+            with budget:
+                response = self.client.get(reverse('boards:search'), {'q': 'сериал'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_posts_by_board(self):
+        for size, budget in self.budget_at_sizes(queries=3, rows=23):
+            with budget:
+                response = self.client.get(reverse('boards:posts_by_board', args=[self.board.pk]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_create_post(self):
+        self.client.force_login(self.author)
+        url = reverse('boards:create_post', args=[self.board.pk])
+        for size, budget in self.budget_at_sizes(queries=3, rows=3):
+            with budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        for size, budget in self.budget_at_sizes(queries=8, rows=4):
+            with budget:
+                response = self.client.post(url, {'title': f'Новый {size}', 'content': '<p>Текст</p>'})
+            self.assertEqual(response.status_code, 302)
+
+    def test_post_detail(self):
+        url = reverse('boards:post_detail', args=[self.board.pk, self.post.pk])
+        for size, budget in self.budget_at_sizes(queries=4, rows=23):
+            with budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_post_responses(self):
+        url = reverse('boards:post_responses', args=[self.board.pk, self.post.pk])
+        for size, budget in self.budget_at_sizes(queries=2, rows=22):
+            with budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_add_response(self):
+        self.client.force_login(self.reader)
+        url = reverse('boards:add_response', args=[self.board.pk, self.post.pk])
+        for size, budget in self.budget_at_sizes(queries=11, rows=7):
+            with budget:
+                response = self.client.post(url, {'content': f'<p>Отклик {size}</p>'})
+            self.assertEqual(response.status_code, 302)
+
+    def test_edit_post(self):
+        self.client.force_login(self.author)
+        url = reverse('boards:edit_post', args=[self.board.pk, self.post.pk])
+        for size, budget in self.budget_at_sizes(queries=5, rows=5):
+            with budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        for size, budget in self.budget_at_sizes(queries=9, rows=4):
+            with budget:
+                response = self.client.post(url, {'title': f'Пост {size}', 'content': f'<p>Правка {size}</p>'})
+            self.assertEqual(response.status_code, 302)
+
+    def test_my_posts_responses(self):
+        self.client.force_login(self.author)
+        url = reverse('boards:my_posts_responses')
+        # Фильтр выводит последние 30 постов автора (и один лишний для признака «есть еще»),
+        # отклики — страницей из 20.
+        for size, budget in self.budget_at_sizes(queries=4, rows=54):
+            with budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        # Выбранный пост загружается отдельным запросом: он может быть старше постов в фильтре.
+        for size, budget in self.budget_at_sizes(queries=5, rows=55):
+            with budget:
+                response = self.client.get(url, {'post': self.post.pk})
+            self.assertEqual(response.status_code, 200)
+
+    def test_accept_response(self):
+        self.client.force_login(self.author)
+        # Включая UPDATE времени изменения поста, от которого зависит ETag его страницы.
+        for size, budget in self.budget_at_sizes(queries=12, rows=8):
+            target = self._response()
+            with budget:
+                response = self.client.post(reverse('boards:accept_response', args=[target.pk]))
+            self.assertEqual(response.status_code, 302)
+
+    def test_delete_response(self):
+        self.client.force_login(self.author)
+        for size, budget in self.budget_at_sizes(queries=9, rows=5):
+            target = self._response()
+            with budget:
+                response = self.client.post(reverse('boards:delete_response', args=[target.pk]))
+            self.assertEqual(response.status_code, 302)
+
+    def test_unsubscribe_newsletter(self):
+        self.client.force_login(self.author)
+        url = reverse('boards:unsubscribe_newsletter')
+        for size, budget in self.budget_at_sizes(queries=2, rows=2):
+            with budget:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        for size, budget in self.budget_at_sizes(queries=3, rows=2):
+            with budget:
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, 302)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Курсорная пагинация (boards/pagination.py).
+    """
+    def setUp(self):
+        author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+        base = timezone.now() - timedelta(days=1)
+        for number in range(7):
+            Post.objects.create(title=f'Пост {number}', content='<p>1</p>', author=author, board=self.board)
+        # Посты 2 и 3 созданы в одну и ту же секунду: порядок между ними задает id.
+        for number, post in enumerate(Post.objects.order_by('pk')):
+            created_at = base + timedelta(minutes=min(number, 2) if number <= 3 else number)
+            Post.objects.filter(pk=post.pk).update(created_at=created_at)
+        self.expected = [post.pk for post in Post.objects.order_by('-created_at', '-pk')]
+
+    def page(self, **kwargs):
+        return keyset_paginate(Post.objects.filter(board=self.board), per_page=3, **kwargs)
+
+    def test_cursor_round_trip(self):
+        value = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(value, 42)), (value, 42))
+        self.assertIsNotNone(decode_cursor(encode_cursor(value, 42))[0].tzinfo)
+
+    def test_tampered_cursors_are_rejected(self):
+        naive = encode_cursor(datetime(2026, 1, 1, 12, 0), 1)
+        tampered = [
+            '!!!', 'не-base64', encode_cursor(timezone.now(), 1)[:-4],
+            base64.urlsafe_b64encode(b'2026-01-01T00:00:00+00:00|abc').decode(),
+            base64.urlsafe_b64encode(b'2026-01-01T00:00:00+00:00').decode(),
+            base64.urlsafe_b64encode(b'\xff\xfe|1').decode(),
+            naive,
+        ]
+        for token in tampered:
+            with self.subTest(token=token), self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+        self.assertEqual(self.client.get(reverse('boards:posts_by_board', args=[self.board.pk]),
+                                         {'after': naive}).status_code, 404)
+
+    def test_forward_and_backward_paging(self):
+        pages = [self.page()]
+        while pages[-1].has_next:
+            pages.append(self.page(after=pages[-1].next_cursor))
+        self.assertEqual([post.pk for page in pages for post in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous)
+
+        # Обратно от последней страницы — те же страницы в том же порядке.
+        back = self.page(before=pages[2].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertTrue(back.has_next and back.has_previous)
+        first = self.page(before=back.previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous)
+
+    def test_ascending_paging(self):
+        first = keyset_paginate(Post.objects.all(), per_page=4, descending=False)
+        second = keyset_paginate(Post.objects.all(), after=first.next_cursor, per_page=4, descending=False)
+        self.assertEqual([post.pk for post in [*first, *second]], self.expected[::-1])
+        self.assertFalse(second.has_next)
+
+
+class CounterTests(TestCase):
+    """
+    Денормализованные счетчики досок и постов, поддерживаемые сигналами (boards/signals.py).
+    """
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.other_board = Board.objects.create(name='Другая доска')
+
+    def create_post(self, board=None):
+        return Post.objects.create(title='Пост', content='<p>Пост</p>', author=self.author, board=board or self.board)
+
+    def create_response(self, post):
+        return Response.objects.create(post=post, author=self.author, content='<p>Отклик</p>')
+
+    def assertCounters(self, board, posts, responses):
+        board.refresh_from_db()
+        self.assertEqual((board.post_count, board.response_count), (posts, responses))
+
+    def test_create_updates_counters_and_activity(self):
+        post = self.create_post()
+        self.assertCounters(self.board, 1, 0)
+        self.assertEqual(self.board.last_activity_at, post.created_at)
+
+        self.create_response(post)
+        latest = self.create_response(post)
+        self.assertCounters(self.board, 1, 2)
+        self.assertEqual(self.board.last_activity_at, latest.created_at)
+        post.refresh_from_db()
+        self.assertEqual(post.response_count, 2)
+        self.assertCounters(self.other_board, 0, 0)
+
+    def test_delete_updates_counters_and_modification_time(self):
+        post = self.create_post()
+        response = self.create_response(post)
+        self.create_response(post)
+        old = timezone.now() - timedelta(hours=1)
+        Board.objects.update(updated_at=old)
+        Post.objects.update(updated_at=old)
+
+        response.delete()
+        self.assertCounters(self.board, 1, 1)
+        self.assertGreater(self.board.updated_at, old)
+        post.refresh_from_db()
+        self.assertEqual(post.response_count, 1)
+        self.assertGreater(post.updated_at, old)
+
+        # Удаление поста каскадом удаляет его отклики: уменьшаются оба счетчика доски.
+        self.create_post()
+        post.delete()
+        self.assertCounters(self.board, 1, 0)
+
+    def test_edit_does_not_change_counters(self):
+        post = self.create_post()
+        self.create_response(post)
+        post.title = 'Исправлено'
+        post.save()
+        self.assertCounters(self.board, 1, 1)
+
+    def test_counters_never_go_below_zero(self):
+        post = self.create_post()
+        Board.objects.update(post_count=0, response_count=0)
+        self.create_response(post).delete()
+        post.delete()
+        self.assertCounters(self.board, 0, 0)
+
+    def test_reconcile_fixes_drifted_counters(self):
+        post = self.create_post()
+        self.create_response(post)
+        Board.objects.update(post_count=10, response_count=10, last_activity_at=None)
+        call_command('reconcile_board_counters', chunk_size=1, stdout=io.StringIO())
+        self.assertCounters(self.board, 1, 1)
+        self.assertIsNotNone(self.board.last_activity_at)
+        self.assertCounters(self.other_board, 0, 0)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ResponseInboxTests(TestCase):
+    """
+    Страница «Отклики на мои объявления» и денормализованный автор объявления в откликах.
+    """
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.post = Post.objects.create(title='Старое объявление', content='<p>Пост</p>',
+                                        author=self.author, board=self.board)
+        self.response = Response.objects.create(post=self.post, author=self.reader, content='<p>Отклик</p>')
+
+    def test_filter_lists_latest_posts_and_keeps_selected_one(self):
+        for number in range(views.INBOX_FILTER_POSTS):
+            Post.objects.create(title=f'Пост {number}', content='<p>1</p>', author=self.author, board=self.board)
+        Post.objects.filter(pk=self.post.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.client.force_login(self.author)
+        url = reverse('boards:my_posts_responses')
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['user_posts']), views.INBOX_FILTER_POSTS)
+        self.assertTrue(response.context['has_more_posts'])
+        self.assertNotContains(response, 'Старое объявление (')
+
+        response = self.client.get(url, {'post': self.post.pk})
+        self.assertContains(response, f'<option value="{self.post.pk}" selected>', html=False)
+        self.assertEqual(list(response.context['responses']), [self.response])
+
+    def test_foreign_post_cannot_be_selected(self):
+        other = Post.objects.create(title='Чужое', content='<p>1</p>', author=self.reader, board=self.board)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('boards:my_posts_responses'), {'post': other.pk}, follow=True)
+        self.assertContains(response, 'Выбранный пост не существует или не принадлежит вам.')
+        self.assertEqual(list(response.context['responses']), [self.response])
+
+    def test_post_author_is_synced_only_when_author_changes(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Исправлено'
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        self.assertFalse([query for query in queries if 'UPDATE "boards_response"' in query['sql']])
+
+        post.author = self.reader
+        post.save()
+        self.response.refresh_from_db()
+        self.assertEqual(self.response.post_author_id, self.reader.pk)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], VIEW_COUNTER={'ENABLED': False},
+                   ROOT_URLCONF='myfanboard_project.urls_asgi')
+class AsyncViewTests(TestCase):
+    """
+    Асинхронные страницы для чтения (список досок, доска, пост) в асинхронной цепочке
+    middleware, как под ASGI.
+    """
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.post = Post.objects.create(title='Пост', content='<p>Пост о сериале</p>', author=self.author,
+                                        board=self.board)
+        Response.objects.create(post=self.post, author=self.author, content='<p>Отклик</p>')
+        self.urls = [
+            reverse('boards:list'),
+            reverse('boards:posts_by_board', args=[self.board.pk]),
+            reverse('boards:post_detail', args=[self.board.pk, self.post.pk]),
+        ]
+
+    async def test_pages_render_for_logged_in_user(self):
+        await self.async_client.aforce_login(self.author)
+        for url in self.urls:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, 'Привет, author!')
+            # Запросы ORM из потоков sync_to_async учитываются в замерах запроса.
+            self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    def test_only_asgi_handler_routes_to_async_views(self):
+        expected = [views.aboard_list, views.aposts_by_board, views.apost_detail]
+        handler = ASGIHandler()
+        self.addCleanup(set_urlconf, None)
+        for url, async_view in zip(self.urls, expected):
+            self.assertIs(handler.resolve_request(RequestFactory().get(url)).func, async_view)
+            sync_view = resolve(url, urlconf='myfanboard_project.urls').func
+            self.assertFalse(iscoroutinefunction(sync_view), url)
+        # Остальные маршруты досок под ASGI те же.
+        self.assertIs(resolve('/boards/1/new/', urlconf='myfanboard_project.urls_asgi').func, views.create_post)
+
+    async def test_missing_post_is_404(self):
+        response = await self.async_client.get(reverse('boards:post_detail', args=[self.board.pk, 0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_page_cache_and_conditional_get_count_views(self):
+        url = self.urls[2]
+        first = await self.async_client.get(url)
+        cached = await self.async_client.get(url)
+        not_modified = await self.async_client.get(url, headers={'If-None-Match': first['ETag']})
+
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertEqual(cached['X-Page-Cache'], 'HIT')
+        self.assertEqual(not_modified.status_code, 304)
+        # Просмотр учитывается и при генерации страницы, и при попадании в кеш, и при ответе 304.
+        post = await Post.objects.aget(pk=self.post.pk)
+        self.assertEqual(post.views, 3)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], VIEW_COUNTER={'ENABLED': False})
+class PageCacheTests(TestCase):
+    """
+    Кеш страниц для анонимных пользователей (boards/page_cache.py).
+    """
+    def setUp(self):
+        caches[settings.PAGE_CACHE['CACHE_ALIAS']].clear()
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.post = Post.objects.create(title='Пост', content='<p>Пост</p>', author=self.author, board=self.board)
+        self.post_url = reverse('boards:post_detail', args=[self.board.pk, self.post.pk])
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(self.post_url)
+        cached = self.client.get(self.post_url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertEqual(cached['X-Page-Cache'], 'HIT')
+        self.assertEqual(cached.content, first.content)
+        self.assertIn('Cookie', cached['Vary'])
+
+    def test_key_includes_only_parameters_read_by_view(self):
+        url = reverse('boards:list')
+        self.client.get(url)
+        self.assertEqual(self.client.get(url, {'utm_source': 'mail', 'x': '1'})['X-Page-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url, {'sort': 'activity'})['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, {'sort': 'activity', 'x': '2'})['X-Page-Cache'], 'HIT')
+
+    def test_save_invalidates_dependent_pages(self):
+        board_url = reverse('boards:posts_by_board', args=[self.board.pk])
+        for url in (self.post_url, board_url, reverse('boards:list')):
+            self.client.get(url)
+        self.post.title = 'Исправлено'
+        self.post.save()
+        for url in (self.post_url, board_url, reverse('boards:list')):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        response = self.client.get(self.post_url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'Исправлено')
+
+    def test_logged_in_user_bypasses_cache(self):
+        self.client.get(self.post_url)
+        before = get_stats()['bypass']
+        self.client.force_login(self.author)
+        response = self.client.get(self.post_url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Привет, author!')
+        self.assertEqual(get_stats()['bypass'], before + 1)
+
+    def test_pending_messages_bypass_cache(self):
+        self.client.get(self.post_url)
+        request = RequestFactory().get(self.post_url)
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        messages.info(request, 'Сообщение для анонимного посетителя')
+
+        response = views.post_detail(request, board_pk=self.board.pk, post_pk=self.post.pk)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Сообщение для анонимного посетителя')
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], VIEW_COUNTER={'ENABLED': False})
+class ApiTests(TestCase):
+    """
+    JSON API /api/v1/ (boards/api.py): пагинация, выбор полей и условные GET-запросы.
+    """
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.post = Post.objects.create(title='Пост', content='<p>Пост</p>', author=self.author, board=self.board)
+        Response.objects.create(post=self.post, author=self.author, content='<p>Отклик</p>')
+        self.urls = [
+            reverse('api:board_list'),
+            reverse('api:board_posts', args=[self.board.pk]),
+            reverse('api:post_detail', args=[self.post.pk]),
+            reverse('api:post_responses', args=[self.post.pk]),
+        ]
+
+    def test_board_list_is_paginated(self):
+        for number in range(4):
+            Board.objects.create(name=f'Доска {number}')
+        first = self.client.get(self.urls[0], {'page_size': 3}).json()
+        self.assertEqual([board['name'] for board in first['results']], ['Доска', 'Доска 0', 'Доска 1'])
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(first['next']).json()
+        self.assertEqual([board['name'] for board in second['results']], ['Доска 2', 'Доска 3'])
+        self.assertIsNone(second['next'])
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_page_size_is_capped(self):
+        for number in range(3):
+            Post.objects.create(title=f'Пост {number}', content='<p>1</p>', author=self.author, board=self.board)
+        data = self.client.get(self.urls[1], {'page_size': 10000}).json()
+        self.assertEqual(len(data['results']), 4)
+        self.assertEqual([post['title'] for post in data['results']][:2], ['Пост 2', 'Пост 1'])
+
+    def test_sparse_fieldsets(self):
+        data = self.client.get(self.urls[2], {'fields': 'id,title,unknown'}).json()
+        self.assertEqual(data, {'id': self.post.pk, 'title': 'Пост'})
+        detail = self.client.get(self.urls[2]).json()
+        self.assertEqual(detail['author'], 'author')
+        self.assertEqual(detail['content_html'], '<p>Пост</p>')
+        self.assertNotIn('content', detail)
+
+    def test_invalid_cursor_and_missing_objects_are_404(self):
+        self.assertEqual(self.client.get(self.urls[1], {'after': '!!!'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api:post_detail', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api:post_responses', args=[0])).status_code, 404)
+
+    def test_not_modified_without_building_response(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                # Один запрос состояния: ни выборки объектов, ни сериализации.
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, headers={'If-None-Match': first['ETag']})
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_parameters_and_state(self):
+        url = self.urls[3]
+        self.assertNotEqual(self.client.get(url, {'fields': 'id'})['ETag'], self.client.get(url)['ETag'])
+
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Response.objects.create(post=self.post, author=self.author, content='<p>Еще</p>')
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(len(self.client.get(self.urls[3]).json()['results']), 2)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], VIEW_COUNTER={'ENABLED': False}, PAGE_CACHE={'ENABLED': False})
+class ConditionalPageTests(TestCase):
+    """
+    Условные GET-запросы страниц досок и постов: 304 при неизменном состоянии,
+    200 после создания, изменения и удаления.
+    """
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.reader = User.objects.create_user('reader', 'reader@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.post = Post.objects.create(title='Пост', content='<p>Пост</p>', author=self.author, board=self.board)
+        self.response = Response.objects.create(post=self.post, author=self.reader, content='<p>Отклик</p>')
+        self.age()
+        self.board_url = reverse('boards:posts_by_board', args=[self.board.pk])
+        self.post_url = reverse('boards:post_detail', args=[self.board.pk, self.post.pk])
+
+    def age(self):
+        # Состояние «час назад», чтобы изменения в тесте давали более позднее время в секундах.
+        old = timezone.now() - timedelta(hours=1)
+        Board.objects.update(updated_at=old, last_activity_at=old)
+        Post.objects.update(updated_at=old, created_at=old)
+        Response.objects.update(updated_at=old, created_at=old)
+
+    def assertModified(self, url, first, modified=True):
+        expected = 200 if modified else 304
+        by_etag = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        by_date = self.client.get(url, headers={'If-Modified-Since': first['Last-Modified']})
+        self.assertEqual(by_etag.status_code, expected)
+        self.assertEqual(by_date.status_code, expected)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in (self.board_url, self.post_url):
+            with self.subTest(url=url):
+                self.assertModified(url, self.client.get(url), modified=False)
+
+    def test_new_response_modifies_post_and_board(self):
+        first_post, first_board = self.client.get(self.post_url), self.client.get(self.board_url)
+        Response.objects.create(post=self.post, author=self.reader, content='<p>Еще</p>')
+        self.assertModified(self.post_url, first_post)
+        self.assertModified(self.board_url, first_board)
+
+    def test_edit_modifies_post_page(self):
+        first = self.client.get(self.post_url)
+        self.post.content = '<p>Исправлено</p>'
+        self.post.save()
+        self.assertModified(self.post_url, first)
+
+    def test_post_edit_modifies_board_page(self):
+        first = self.client.get(self.board_url)
+        self.post.title = 'Новый заголовок'
+        self.post.save()
+        self.assertModified(self.board_url, first)
+
+    def test_post_move_modifies_both_boards(self):
+        other = Board.objects.create(name='Другая')
+        self.age()
+        other_url = reverse('boards:posts_by_board', args=[other.pk])
+        first, first_other = self.client.get(self.board_url), self.client.get(other_url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.board = other
+        post.save()
+        self.assertModified(self.board_url, first)
+        self.assertModified(other_url, first_other)
+
+    def test_response_edit_modifies_post_page(self):
+        first = self.client.get(self.post_url)
+        self.response.is_accepted = True
+        self.response.save()
+        self.assertModified(self.post_url, first)
+
+    def test_state_reads_only_the_page_row(self):
+        for state, args in ((board_state, (self.board.pk,)), (post_state, (self.board.pk, self.post.pk))):
+            with self.subTest(state=state.__name__), CaptureQueriesContext(connection) as queries:
+                state(*args)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('SELECT', queries[0]['sql'].upper().split('FROM', 1)[1])
+
+    def test_response_delete_modifies_post_page(self):
+        first = self.client.get(self.post_url)
+        self.response.delete()
+        self.assertModified(self.post_url, first)
+
+    def test_post_delete_modifies_board_page(self):
+        other = Post.objects.create(title='Второй', content='<p>2</p>', author=self.author, board=self.board)
+        self.age()
+        first = self.client.get(self.board_url)
+        other.delete()
+        self.assertModified(self.board_url, first)
+
+    def test_board_list_uses_etag_only(self):
+        url = reverse('boards:list')
+        Board.objects.create(name='Пустая')
+        first = self.client.get(url)
+        self.assertNotIn('Last-Modified', first)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+        Board.objects.filter(name='Пустая').delete()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': first['ETag']}).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        anonymous = self.client.get(self.post_url)
+        self.client.force_login(self.author)
+        author = self.client.get(self.post_url)
+        self.client.force_login(self.reader)
+        reader = self.client.get(self.post_url)
+
+        self.assertEqual(len({anonymous['ETag'], author['ETag'], reader['ETag']}), 3)
+        self.assertNotIn('Last-Modified', reader)
+        self.assertEqual(self.client.get(self.post_url, headers={'If-None-Match': author['ETag']}).status_code, 200)
+        self.assertEqual(self.client.get(self.post_url, headers={'If-None-Match': reader['ETag']}).status_code, 304)
+
+    def test_pending_messages_bypass_not_modified(self):
+        self.client.force_login(self.reader)
+        first = self.client.get(self.post_url)
+        # Чужой пост: редактирование добавляет сообщение об ошибке и перенаправляет на пост.
+        self.client.get(reverse('boards:edit_post', args=[self.board.pk, self.post.pk]))
+
+        response = self.client.get(self.post_url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'У вас нет прав для редактирования этого поста.')
+        self.assertEqual(self.client.get(self.post_url, headers={'If-None-Match': first['ETag']}).status_code, 304)
+
+
+@override_settings(NEWSLETTER={'BATCH_SIZE': 2, 'WORKERS': 1, 'MAX_ATTEMPTS': 2})
+class NewsletterSendingTests(TestCase):
+    """
+    Отправка рассылок: захват писем отправителем, продолжение после сбоя и повтор ошибок.
+    """
+    def setUp(self):
+        # Новые пользователи подписаны на рассылку по умолчанию.
+        for number in range(5):
+            User.objects.create_user(f'reader{number}', f'reader{number}@example.com')
+        self.newsletter = Newsletter.objects.create(
+            subject='Новости', content='<p>Новости</p>', status=Newsletter.STATUS_QUEUED
+        )
+
+    def recipients(self):
+        return sorted(address for message in mail.outbox for address in message.to)
+
+    def test_sends_each_subscriber_once(self):
+        send_newsletter(self.newsletter)
+
+        self.assertEqual(self.recipients(), [f'reader{number}@example.com' for number in range(5)])
+        self.newsletter.refresh_from_db()
+        self.assertEqual((self.newsletter.status, self.newsletter.sent_count), (Newsletter.STATUS_SENT, 5))
+
+    def test_deliveries_claimed_by_another_sender_are_skipped(self):
+        prepare_deliveries(self.newsletter)
+        claimed = claim_chunk(self.newsletter, 'other-sender', 2)
+
+        send_newsletter(self.newsletter)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse({delivery.user.email for delivery in claimed} & set(self.recipients()))
+        # Чужие письма еще отправляются — рассылка не завершена.
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.status, Newsletter.STATUS_SENDING)
+
+    def test_expired_claim_is_taken_over(self):
+        prepare_deliveries(self.newsletter)
+        claim_chunk(self.newsletter, 'crashed-sender', 2)
+        self.newsletter.deliveries.update(claimed_at=timezone.now() - timedelta(hours=1))
+
+        send_newsletter(self.newsletter)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.status, Newsletter.STATUS_SENT)
+
+    def test_failed_deliveries_are_retried_until_attempts_run_out(self):
+        with mock.patch('boards.newsletter._MailMerge.message', side_effect=OSError('SMTP недоступен')):
+            send_newsletter(self.newsletter)
+        self.newsletter.refresh_from_db()
+        self.assertEqual((self.newsletter.status, self.newsletter.failed_count), (Newsletter.STATUS_SENDING, 5))
+
+        call_command('send_newsletters', stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.newsletter.refresh_from_db()
+        self.assertEqual((self.newsletter.status, self.newsletter.failed_count), (Newsletter.STATUS_SENT, 0))
+        self.assertEqual(set(self.newsletter.deliveries.values_list('attempts', flat=True)), {2})
+
+    def test_command_does_not_send_drafts(self):
+        draft = Newsletter.objects.create(subject='Черновик', content='<p>Черновик</p>')
+
+        with self.assertRaises(CommandError):
+            call_command('send_newsletters', newsletter=draft.pk)
+        self.assertEqual(mail.outbox, [])
+
+
+@override_settings(VIEW_COUNTER={'FLUSH_THRESHOLD': 3, 'FLUSH_INTERVAL': 7})
+class ViewCountBufferTests(TestCase):
+    """
+    Буфер отложенной записи просмотров (boards/view_counter.py).
+    """
+    def setUp(self):
+        author = User.objects.create_user('author', 'author@example.com')
+        board = Board.objects.create(name='Доска')
+        self.post = Post.objects.create(title='Пост', content='<p>Пост</p>', author=author, board=board)
+        self.buffer = view_counter.ViewCountBuffer()
+        # Фоновый поток не запускается: сброс по таймеру проверяется вызовом _run.
+        # Сброс при выходе тоже отключен: он писал бы в рабочую базу после удаления тестовой.
+        thread = mock.patch.object(view_counter.threading, 'Thread')
+        self.thread = thread.start()
+        self.addCleanup(thread.stop)
+        exit_hook = mock.patch.object(view_counter.atexit, 'register')
+        exit_hook.start()
+        self.addCleanup(exit_hook.stop)
+
+    def views(self):
+        return Post.objects.values_list('views', flat=True).get(pk=self.post.pk)
+
+    def test_flush_by_threshold(self):
+        self.assertEqual(self.buffer.record(self.post.pk), 1)
+        self.assertEqual(self.buffer.record(self.post.pk), 2)
+        self.assertEqual(self.views(), 0)
+        self.assertEqual(self.buffer.pending_for(self.post.pk), 2)
+
+        self.buffer.record(self.post.pk)
+        self.assertEqual(self.views(), 3)
+        self.assertEqual(self.buffer.pending_for(self.post.pk), 0)
+
+    def test_flush_by_interval(self):
+        self.buffer.record(self.post.pk)
+        self.assertEqual(self.thread.call_args.kwargs['args'], (7,))
+
+        # Первый «сон» заканчивается сбросом буфера, второй прерывает цикл потока.
+        sleep = mock.patch.object(view_counter.time, 'sleep', side_effect=[None, InterruptedError])
+        with sleep as mocked, mock.patch.object(view_counter, 'close_old_connections'):
+            with self.assertRaises(InterruptedError):
+                self.buffer._run(7)
+        mocked.assert_called_with(7)
+        self.assertEqual(self.views(), 1)
+        self.assertEqual(self.buffer.pending_for(self.post.pk), 0)
+
+    def test_pending_for_counts_only_unwritten_views(self):
+        other = Post.objects.create(title='Другой', content='<p>2</p>', author=self.post.author, board=self.post.board)
+        self.buffer.record(self.post.pk, count=2)
+        self.assertEqual(self.buffer.pending_for(self.post.pk), 2)
+        self.assertEqual(self.buffer.pending_for(other.pk), 0)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.buffer.record(self.post.pk)
+        self.assertEqual(self.buffer.pending_for(self.post.pk), 1)
+        self.assertEqual(self.views(), 2)
+
+    def test_failed_flush_keeps_views(self):
+        self.buffer.record(self.post.pk, count=2)
+        with mock.patch.object(view_counter, '_add_views', side_effect=RuntimeError('база недоступна')), \
+                self.assertLogs('boards.view_counter', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending_for(self.post.pk), 2)
+        self.buffer.flush()
+        self.assertEqual(self.views(), 2)
+
+
+class SearchTests(TestCase):
+    """
+    Полнотекстовый поиск (boards/search.py): индексация сигналами, страница поиска,
+    перестройка индекса и заполнение индекса миграцией.
+    """
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com')
+        self.board = Board.objects.create(name='Доска')
+        self.other_board = Board.objects.create(name='Другая доска')
+        self.post = Post.objects.create(title='Сериал о драконах', content='<p>Обсуждаем <b>финал</b> сезона</p>',
+                                        author=self.author, board=self.board)
+        self.response = Response.objects.create(post=self.post, author=self.author,
+                                                content='<p>Финал слишком поспешный</p><script>скрипт</script>')
+        Post.objects.create(title='Книги', content='<p>Новый роман</p>', author=self.author, board=self.other_board)
+
+    def found(self, query, board_id=None):
+        return sorted((row['kind'], row['object_id']) for row in search.SearchResults(query, board_id)[0:100])
+
+    def test_signals_keep_index_in_sync(self):
+        self.assertEqual(self.found('финал'), [('post', self.post.pk), ('response', self.response.pk)])
+        self.assertEqual(self.found('скрипт'), [])
+
+        self.post.content = '<p>Обсуждаем актеров</p>'
+        self.post.save()
+        self.assertEqual(self.found('финал'), [('response', self.response.pk)])
+        self.response.delete()
+        self.assertEqual(self.found('финал'), [])
+
+    def test_prefix_board_filter_and_syntax_characters(self):
+        # По префиксу ищется только последнее слово запроса.
+        self.assertEqual(self.found('драк'), [('post', self.post.pk)])
+        self.assertEqual(self.found('драк финал'), [])
+        self.assertEqual(self.found('финал', board_id=self.other_board.pk), [])
+        self.assertEqual(self.found('"финал" OR NEAR(*'), [])
+        self.assertEqual(search.SearchResults('   ').count(), 0)
+
+    def test_admin_response_search_matches_post_title_only(self):
+        model_admin = ResponseAdmin(Response, admin.site)
+
+        def admin_found(term):
+            queryset, _ = model_admin.get_search_results(None, Response.objects.all(), term)
+            return list(queryset.values_list('pk', flat=True))
+
+        self.assertEqual(admin_found('драконах'), [self.response.pk])
+        # Текст поста, в отличие от заголовка, отклики не находит.
+        self.assertEqual(admin_found('обсуждаем'), [])
+        self.assertEqual(admin_found('поспешный'), [self.response.pk])
+
+    def test_moved_post_moves_its_responses(self):
+        self.post.board = self.other_board
+        self.post.save()
+        self.assertEqual(len(self.found('финал', board_id=self.other_board.pk)), 2)
+
+    def index_writes(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return [query['sql'] for query in queries
+                if search.SEARCH_TABLE in query['sql'] and not query['sql'].startswith('SELECT')]
+
+    def test_index_writes_use_rowid(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Сериал о драконах, обновлено'
+        writes = self.index_writes(post.save) + self.index_writes(post.delete)
+        lookups = [sql for sql in writes if not sql.startswith('INSERT')]
+        self.assertTrue(lookups)
+        with connection.cursor() as cursor:
+            for sql in lookups:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                # «INDEX 0:» без ограничений — полный просмотр виртуальной таблицы.
+                self.assertRegex(plan, r'VIRTUAL TABLE INDEX 0:=', sql)
+
+    def test_responses_are_rewritten_only_when_board_changes(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Обновлено'
+        self.assertFalse([sql for sql in self.index_writes(post.save) if sql.startswith('UPDATE')])
+        post.board = self.other_board
+        self.assertTrue([sql for sql in self.index_writes(post.save) if sql.startswith('UPDATE')])
+
+    def test_rowid_migration_rekeys_existing_rows(self):
+        migration = importlib.import_module('boards.migrations.0019_search_rowids')
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {search.SEARCH_TABLE} (rowid, title, body, kind, object_id, post_id, board_id) "
+                "VALUES (1, %s, %s, 'post', %s, %s, %s), (2, '', %s, 'response', %s, %s, %s)",
+                ['Сериал', 'финал', self.post.pk, self.post.pk, self.board.pk,
+                 'финал', self.response.pk, self.post.pk, self.board.pk],
+            )
+            migration.rekey_search_index(apps, SimpleNamespace(connection=connection))
+            cursor.execute(f"SELECT rowid, kind, object_id FROM {search.SEARCH_TABLE} ORDER BY rowid")
+            rows = cursor.fetchall()
+        self.assertEqual(rows, sorted([(2 * self.post.pk, 'post', self.post.pk),
+                                       (2 * self.response.pk + 1, 'response', self.response.pk)]))
+        self.response.delete()
+        self.assertEqual(self.found('финал'), [('post', self.post.pk)])
+
+    def test_search_page_highlights_matches(self):
+        response = self.client.get(reverse('boards:search'), {'q': 'драконах'})
+        self.assertContains(response, 'Сериал о <mark>драконах</mark>', html=True)
+        self.assertContains(response, reverse('boards:post_detail', args=[self.board.pk, self.post.pk]))
+
+    def test_rebuild_command_recreates_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE}")
+        output = io.StringIO()
+        call_command('rebuild_search_index', batch_size=2, stdout=output)
+        self.assertIn('объектов: 3', output.getvalue())
+        self.assertEqual(self.found('финал'), [('post', self.post.pk), ('response', self.response.pk)])
+
+    def test_changes_during_rebuild_are_carried_over(self):
+        posts = Post.objects.only('title', 'content', 'board_id')
+        responses = Response.objects.select_related('post').only('content', 'post_id', 'post__board_id')
+        rebuild = search.rebuild_index(posts, responses, batch_size=1)
+        next(rebuild)
+        # Пока строится новый индекс, поиск работает по старому.
+        self.assertEqual(len(self.found('финал')), 2)
+        self.post.content = '<p>Обсуждаем актеров</p>'
+        self.post.save()
+        self.response.delete()
+        list(rebuild)
+
+        self.assertEqual(self.found('финал'), [])
+        self.assertEqual(self.found('актеров'), [('post', self.post.pk)])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {search.SEARCH_TABLE}")
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_migration_indexes_existing_rows(self):
+        migration = importlib.import_module('boards.migrations.0010_search_index')
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE}")
+        schema_editor = SimpleNamespace(connection=connection)
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.create_search_index(apps, schema_editor)
+        self.assertEqual(self.found('финал'), [('post', self.post.pk), ('response', self.response.pk)])
+        self.assertEqual(self.found('роман'), [('post', Post.objects.get(title='Книги').pk)])
+
+
+class ContentSanitizerTests(SimpleTestCase):
+    """
+    Очистка HTML перед выводом без экранирования.
+    """
+    def clean(self, html):
+        return sanitize_html(html)[0]
+
+    def test_scripts_and_styles_are_dropped_with_content(self):
+        html = self.clean('<p>до</p><script>alert(1)</script><style>p{}</style><p>после</p>')
+        self.assertEqual(html, '<p>до</p><p>после</p>')
+
+    def test_unknown_tags_are_dropped_and_text_escaped(self):
+        html = self.clean('<iframe src="https://evil.test"></iframe><p>&lt;b&gt;</p>')
+        self.assertEqual(html, '<p>&lt;b&gt;</p>')
+
+    def test_event_handlers_are_dropped(self):
+        html = self.clean('<p onclick="alert(1)">x</p><img src="/a.png" onerror="alert(1)">')
+        self.assertNotIn('onclick', html)
+        self.assertNotIn('onerror', html)
+        self.assertIn('src="/a.png"', html)
+
+    def test_javascript_urls_are_dropped(self):
+        for href in ('javascript:alert(1)', ' JavaScript:alert(1)', 'data:text/html,<script>'):
+            with self.subTest(href=href):
+                self.assertEqual(self.clean(f'<a href="{href}">x</a>'), '<a>x</a>')
+
+    def test_entity_obfuscated_urls_are_dropped(self):
+        for href in ('&#106;avascript:alert(1)', 'javascript&colon;alert(1)', '&#x6A;avascript&#58;alert(1)'):
+            with self.subTest(href=href):
+                self.assertEqual(self.clean(f'<a href="{href}">x</a>'), '<a>x</a>')
+
+    def test_safe_urls_are_kept(self):
+        for href in ('https://example.com/', '/boards/1/', '#top', 'mailto:a@example.com'):
+            with self.subTest(href=href):
+                self.assertIn(f'href="{href}"', self.clean(f'<a href="{href}">x</a>'))
+
+    def test_srcset_urls_are_checked(self):
+        for srcset in ('/a.png 1x, javascript:alert(1) 2x', 'data:image/png;base64,AAAA 1x', ' JavaScript:x'):
+            with self.subTest(srcset=srcset):
+                self.assertNotIn('srcset', self.clean(f'<img src="/a.png" srcset="{srcset}">'))
+        self.assertIn(
+            'srcset="/a.png 1x, https://example.com/b.png 2x"',
+            self.clean('<img src="/a.png" srcset="/a.png 1x, https://example.com/b.png 2x">'),
+        )
+
+    def test_oembed_url_is_checked(self):
+        self.assertEqual(self.clean('<oembed url="javascript:alert(1)"></oembed>'), '<oembed></oembed>')
+        self.assertEqual(
+            self.clean('<oembed url="https://www.youtube.com/watch?v=1"></oembed>'),
+            '<oembed url="https://www.youtube.com/watch?v=1"></oembed>',
+        )
+
+    def test_overlay_styles_are_dropped(self):
+        html = self.clean(
+            '<div style="position: fixed; top: 0; left: 0; width: 100%; height: 100%; '
+            'z-index: 9999; text-align: center">x</div>'
+        )
+        self.assertEqual(html, '<div style="text-align: center">x</div>')
+
+    def test_style_values_with_functions_are_dropped(self):
+        html = self.clean('<p style="color: red; background-color: url(https://evil.test/a.png)">x</p>')
+        self.assertEqual(html, '<p style="color: red">x</p>')
+        self.assertEqual(self.clean('<p style="color: expression(alert(1))">x</p>'), '<p>x</p>')
+
+    def test_image_sizes_are_allowed_only_on_images(self):
+        self.assertIn('style="width: 50%"', self.clean('<img src="/a.png" style="width: 50%">'))
+        self.assertEqual(self.clean('<p style="width: 100%">x</p>'), '<p>x</p>')
+
+    def test_target_forces_noopener(self):
+        html = self.clean('<a href="https://example.com/" target="_blank" rel="opener">x</a>')
+        self.assertEqual(
+            html, '<a href="https://example.com/" target="_blank" rel="noopener noreferrer">x</a>',
+        )
+
+    def test_only_blank_target_is_allowed(self):
+        html = self.clean('<a href="/" target="_top">x</a>')
+        self.assertEqual(html, '<a href="/">x</a>')
+
+    def test_render_content_builds_derived_fields(self):
+        rendered = render_content('<p>Один <b>два</b></p><script>три</script><img src="/a.png">')
+        self.assertEqual(rendered['excerpt'], 'Один два')
+        self.assertEqual(rendered['word_count'], 2)
+        self.assertEqual(rendered['image_refs'], ['/a.png'])
+        self.assertEqual(len(rendered['content_hash']), 64)
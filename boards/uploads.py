@@ -0,0 +1,289 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки файла части нет, остается только сравнение смещения в базе.
+    fcntl = None
+
+# Настройки по умолчанию; переопределяются словарем UPLOADS в settings.py.
+DEFAULTS = {
+    'CHUNK_SIZE': 1024 * 1024,                  # Порция чтения тела запроса; определяет пиковую память загрузки.
+    'MAX_FILE_SIZE': 256 * 1024 * 1024,         # Максимальный размер одного файла.
+    'USER_UPLOADS_PER_MINUTE': 20,              # Начатых загрузок пользователя в минуту.
+    'USER_BYTES_PER_HOUR': 1024 * 1024 * 1024,  # Принятых байт от пользователя в час.
+    'RESUMABLE_CHUNK_SIZE': 8 * 1024 * 1024,    # Максимальный размер одной части возобновляемой загрузки.
+    'SESSION_TTL': 24 * 60 * 60,                # Время жизни незавершенной возобновляемой загрузки, секунд.
+    'UNREFERENCED_TTL': 24 * 60 * 60,           # Сколько секунд хранится файл без ссылок до удаления collect_media.
+    'CACHE_ALIAS': 'default',                   # Кеш счетчиков лимитов (общий для всех процессов сайта).
+}
+
+# Сигнатуры форматов изображений, разрешенных к загрузке.
+MAGIC_NUMBERS = (
+    b'\xff\xd8\xff',          # JPEG
+    b'\x89PNG\r\n\x1a\n',     # PNG
+    b'GIF87a', b'GIF89a',     # GIF
+    b'BM',                    # BMP
+    b'II*\x00', b'MM\x00*',   # TIFF
+)
+# Байт заголовка, достаточных для проверки сигнатуры (RIFF....WEBP).
+MAGIC_LENGTH = 12
+
+
+def get_config():
+    """
+    Возвращает настройки приема загрузок с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'UPLOADS', {})}
+
+
+class UploadRejected(Exception):
+    """
+    Загрузка отклонена: превышен лимит или файл не является изображением.
+    status — HTTP-код ответа.
+    """
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def is_image_header(head):
+    """
+    Проверяет сигнатуру изображения по первым байтам файла.
+    """
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    return head.startswith(MAGIC_NUMBERS)
+
+
+def check_file_size(size):
+    limit = get_config()['MAX_FILE_SIZE']
+    if size > limit:
+        raise UploadRejected(f'Файл больше {limit // (1024 * 1024)} МБ.', status=413)
+
+
+def temp_dir(storage):
+    """
+    Каталог временных файлов загрузки. Для хранилища с адресацией по содержимому это каталог
+    внутри хранилища, чтобы готовый файл переносился переименованием, без копирования.
+    """
+    if hasattr(storage, 'temp_dir'):
+        return storage.temp_dir()
+    return settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+
+
+class UploadQuota:
+    """
+    Лимиты загрузок пользователя: количество начатых загрузок в минуту и объем в час.
+    Счетчики хранятся в кеше CACHE_ALIAS; объем учитывается по мере чтения данных,
+    поэтому превышение обрывает загрузку, не дожидаясь ее конца.
+    """
+    def __init__(self, user, remote_addr=None):
+        self.config = get_config()
+        self.cache = caches[self.config['CACHE_ALIAS']]
+        # Анонимные загрузки (CKEDITOR_5_FILE_UPLOAD_PERMISSION = "any") учитываются по адресу.
+        self.user_key = user.pk if user.is_authenticated else f'ip:{remote_addr}'
+
+    def _incr(self, name, window, amount):
+        key = f'upload:{self.user_key}:{name}:{int(time.time() // window)}'
+        self.cache.add(key, 0, window)
+        try:
+            return self.cache.incr(key, amount)
+        except ValueError:
+            # Ключ истек между add() и incr().
+            self.cache.set(key, amount, window)
+            return amount
+
+    def start(self):
+        if self._incr('count', 60, 1) > self.config['USER_UPLOADS_PER_MINUTE']:
+            raise UploadRejected('Слишком много загрузок, попробуйте через минуту.', status=429)
+
+    def consume(self, size):
+        if self._incr('bytes', 3600, size) > self.config['USER_BYTES_PER_HOUR']:
+            raise UploadRejected('Превышен объем загрузок за час.', status=429)
+
+
+class StreamedUploadedFile(TemporaryUploadedFile):
+    """
+    Загруженный файл, уже записанный во временный файл рядом с хранилищем, с посчитанным
+    SHA-256: ContentAddressedStorage переносит его на место без повторного чтения.
+    """
+    def __init__(self, file, name, content_type, size, charset=None, content_type_extra=None, sha256=None):
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Обработчик загрузки, записывающий файл порциями CHUNK_SIZE во временный каталог хранилища
+    и считающий его хеш по ходу записи. Память на загрузку не зависит от размера файла.
+
+    Загрузка обрывается (без дочитывания тела запроса), если объявленный или фактический
+    размер больше MAX_FILE_SIZE, превышен лимит пользователя или первые байты файла
+    не похожи на изображение. Причина сохраняется в request.upload_error.
+    """
+    def __init__(self, request, storage):
+        super().__init__(request)
+        self.config = get_config()
+        self.chunk_size = self.config['CHUNK_SIZE']
+        self.storage = storage
+        self.quota = UploadQuota(request.user, request.META.get('REMOTE_ADDR'))
+
+    def _reject(self, error):
+        self.request.upload_error = error
+        self._discard()
+        raise StopUpload(connection_reset=True)
+
+    def _discard(self):
+        # MultiPartParser закрывает handler.file при обрыве загрузки, поэтому атрибут удаляется.
+        file = self.__dict__.pop('file', None)
+        if file is not None:
+            file.close()
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        try:
+            # Тело запроса включает заголовки частей формы; запас на них — одна порция.
+            check_file_size(max(content_length - self.chunk_size, 0))
+        except UploadRejected as error:
+            self.request.upload_error = error
+            return QueryDict(mutable=True), MultiValueDict()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        try:
+            if self.content_length is not None:
+                check_file_size(self.content_length)
+            self.quota.start()
+        except UploadRejected as error:
+            self._reject(error)
+        self.file = tempfile.NamedTemporaryFile(suffix='.upload', dir=temp_dir(self.storage))
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            if len(self.head) < MAGIC_LENGTH:
+                self.head += raw_data[:MAGIC_LENGTH]
+                if len(self.head) >= MAGIC_LENGTH and not is_image_header(self.head):
+                    raise UploadRejected('Файл не является изображением.')
+            check_file_size(self.size + len(raw_data))
+            self.quota.consume(len(raw_data))
+        except UploadRejected as error:
+            self._reject(error)
+        self.file.write(raw_data)
+        self.hash.update(raw_data)
+        self.size += len(raw_data)
+
+    def file_complete(self, file_size):
+        if not is_image_header(self.head):
+            self._reject(UploadRejected('Файл не является изображением.'))
+        file = self.__dict__.pop('file')
+        file.flush()
+        file.seek(0)
+        return StreamedUploadedFile(
+            file, self.file_name, self.content_type, file_size, self.charset,
+            self.content_type_extra, sha256=self.hash.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        self._discard()
+
+
+def part_path(storage, session):
+    """
+    Путь временного файла возобновляемой загрузки.
+    """
+    return os.path.join(temp_dir(storage), f'{session.pk}.part')
+
+
+def discard_part(storage, session):
+    """
+    Удаляет временный файл возобновляемой загрузки, если он есть.
+    """
+    path = part_path(storage, session)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def receive_part(storage, session, stream, length):
+    """
+    Читает часть возобновляемой загрузки из потока тела запроса порциями CHUNK_SIZE в отдельный
+    временный файл. Первая часть проверяется по сигнатуре изображения. Файл загрузки не меняется:
+    часть переносится в него только после сдвига смещения сессии (write_part), поэтому параллельные
+    запросы с одним смещением не портят данные друг друга, а отклоненная часть не оставляет файлов.
+    """
+    config = get_config()
+    if length > config['RESUMABLE_CHUNK_SIZE']:
+        raise UploadRejected('Часть загрузки слишком велика.', status=413)
+    if session.received + length > session.size:
+        raise UploadRejected('Данных больше объявленного размера файла.', status=413)
+
+    quota = UploadQuota(session.user)
+    part = tempfile.NamedTemporaryFile(suffix='.upload', dir=temp_dir(storage))
+    try:
+        remaining = length
+        while remaining:
+            chunk = stream.read(min(config['CHUNK_SIZE'], remaining))
+            if not chunk:
+                raise UploadRejected('Тело запроса короче заголовка Content-Length.')
+            if session.received == 0 and part.tell() == 0 and not is_image_header(chunk[:MAGIC_LENGTH]):
+                raise UploadRejected('Файл не является изображением.')
+            quota.consume(len(chunk))
+            part.write(chunk)
+            remaining -= len(chunk)
+    except BaseException:
+        part.close()
+        raise
+    part.seek(0)
+    return part
+
+
+@contextmanager
+def locked_part(storage, session):
+    """
+    Открывает файл возобновляемой загрузки для записи под исключительной блокировкой.
+    Сдвиг смещения сессии и запись части выполняются внутри нее: запрос, завершающий загрузку,
+    читает файл только после того, как все предыдущие части записаны целиком.
+    """
+    descriptor = os.open(part_path(storage, session), os.O_RDWR | os.O_CREAT, 0o600)
+    with open(descriptor, 'r+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        yield file
+
+
+def write_part(file, offset, part):
+    """
+    Записывает принятую часть в файл загрузки с позиции offset, отбрасывая данные за ней.
+    """
+    file.seek(offset)
+    file.truncate()
+    shutil.copyfileobj(part, file, get_config()['CHUNK_SIZE'])
+    file.flush()
+
+
+def completed_part(storage, session, content_type):
+    """
+    Возвращает завершенную возобновляемую загрузку как StreamedUploadedFile, посчитав хеш
+    чтением файла порциями.
+    """
+    digest = hashlib.sha256()
+    part = open(part_path(storage, session), 'rb')
+    for chunk in iter(lambda: part.read(get_config()['CHUNK_SIZE']), b''):
+        digest.update(chunk)
+    part.seek(0)
+    return StreamedUploadedFile(part, session.filename, content_type, session.size, sha256=digest.hexdigest())
@@ -7,12 +7,16 @@ app_name = 'boards'
 urlpatterns = [
     # Список всех досок.
     path('', views.board_list, name='list'),
+    # Полнотекстовый поиск по постам и откликам.
+    path('search/', views.search, name='search'),
     # Посты по выбранной доске.
     path('<int:pk>/', views.posts_by_board, name='posts_by_board'),
     # Создание нового поста на доске.
     path('<int:pk>/new/', views.create_post, name='create_post'),
     # Детали конкретного поста.
     path('<int:board_pk>/post/<int:post_pk>/', views.post_detail, name='post_detail'),
+    # Следующая порция откликов поста (HTML-фрагмент).
+    path('<int:board_pk>/post/<int:post_pk>/responses/', views.post_responses, name='post_responses'),
     # Добавление отклика к посту.
     path('<int:board_pk>/post/<int:post_pk>/add_response/', views.add_response, name='add_response'),
     # Редактирование поста.
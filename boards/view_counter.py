@@ -0,0 +1,173 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+from myfanboard_project.sqlite import retry_on_lock
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Настройки по умолчанию; переопределяются словарем VIEW_COUNTER в settings.py.
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5,      # Секунды между фоновыми сбросами буфера.
+    'FLUSH_THRESHOLD': 500,   # Сброс вне очереди, когда накопилось столько просмотров.
+    'BATCH_SIZE': 500,        # Максимум постов в одном UPDATE ... CASE.
+}
+
+
+def get_config():
+    """
+    Возвращает настройки счетчика просмотров с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'VIEW_COUNTER', {})}
+
+
+@retry_on_lock
+def _add_views(batch):
+    """
+    Прибавляет просмотры порции постов одним UPDATE ... CASE.
+    batch — список пар (id поста, количество просмотров).
+    """
+    Post.objects.filter(pk__in=[post_id for post_id, _ in batch]).update(
+        views=F('views') + Case(
+            *[When(pk=post_id, then=Value(count)) for post_id, count in batch],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        )
+    )
+
+
+class ViewCountBuffer:
+    """
+    Буфер отложенной записи просмотров постов (write-behind).
+
+    Просмотры накапливаются в памяти процесса и записываются в базу пачкой —
+    одним UPDATE ... SET views = views + CASE id WHEN ... END на порцию постов —
+    по таймеру фонового потока или при превышении порога.
+    """
+    def __init__(self):
+        self._pending = Counter()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, post_id, count=1):
+        """
+        Учитывает просмотр поста. Возвращает количество еще не записанных просмотров этого поста.
+        """
+        pending, flush = self._add(post_id, count)
+        if flush:
+            self.flush()
+        return pending
+
+    async def arecord(self, post_id, count=1):
+        """
+        Асинхронный вариант record: просмотр учитывается в памяти, в поток уходит только сброс в базу.
+        """
+        pending, flush = self._add(post_id, count)
+        if flush:
+            await sync_to_async(self.flush)()
+        return pending
+
+    def _add(self, post_id, count):
+        """
+        Добавляет просмотры в буфер. Возвращает (незаписанные просмотры поста, нужен ли сброс).
+        """
+        config = get_config()
+        with self._lock:
+            self._pending[post_id] += count
+            self._total += count
+            pending = self._pending[post_id]
+            total = self._total
+        self._ensure_thread(config)
+        return pending, total >= config['FLUSH_THRESHOLD']
+
+    def pending_for(self, post_id):
+        """
+        Количество просмотров поста, еще не записанных в базу.
+        """
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """
+        Записывает накопленные просмотры в базу. Возвращает количество обновленных постов.
+        При ошибке базы просмотры возвращаются в буфер и будут записаны при следующем сбросе.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._total = 0
+            if not pending:
+                return 0
+            batch_size = get_config()['BATCH_SIZE']
+            items = list(pending.items())
+            written = 0
+            try:
+                for start in range(0, len(items), batch_size):
+                    batch = items[start:start + batch_size]
+                    _add_views(batch)
+                    written += len(batch)
+            except Exception:
+                with self._lock:
+                    self._pending.update(dict(items[written:]))
+                    self._total = sum(self._pending.values())
+                logger.exception('Не удалось записать счетчики просмотров')
+            return written
+
+    def _ensure_thread(self, config):
+        """
+        Лениво запускает фоновый поток периодического сброса буфера.
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(config['FLUSH_INTERVAL'],), name='view-counter-flush', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            close_old_connections()
+            self.flush()
+
+
+# Буфер текущего процесса; каждый рабочий процесс сбрасывает свои просмотры сам.
+view_counter = ViewCountBuffer()
+
+
+def record_view(post_id):
+    """
+    Учитывает просмотр поста и возвращает прибавку к значению views, загруженному до вызова:
+    количество еще не записанных в базу просмотров этого поста.
+    При VIEW_COUNTER['ENABLED'] = False просмотр записывается сразу, как раньше.
+    """
+    if not get_config()['ENABLED']:
+        _add_views([(post_id, 1)])
+        return 1
+    return view_counter.record(post_id)
+
+
+async def arecord_view(post_id):
+    """
+    Асинхронный вариант record_view для асинхронных представлений.
+    """
+    if not get_config()['ENABLED']:
+        await sync_to_async(_add_views)([(post_id, 1)])
+        return 1
+    return await view_counter.arecord(post_id)
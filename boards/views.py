@@ -1,33 +1,273 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from datetime import timedelta
+
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
-from django.db.models import F
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib import messages
-from django.http import Http404
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.http import Http404, HttpResponse, JsonResponse
 from django.conf import settings
-from .models import Board, Post, Response
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
+from django_ckeditor_5.exceptions import NoImageException
+from django_ckeditor_5.forms import UploadFileForm
+from django_ckeditor_5.permissions import check_upload_permission
+from django_ckeditor_5.storage_utils import get_django_storage, image_verify
+from django.template.loader import render_to_string
+from main.asynchronous import load_request
+from main.outbox import enqueue_mail
+from .models import Board, Post, Response, UploadSession
 from .forms import PostForm, ResponseForm
+from .pagination import keyset_paginate, akeyset_paginate, InvalidCursor
+from .view_counter import record_view, arecord_view
+from .search import SearchResults
+from .page_cache import anonymous_page_cache
+from .conditional import (
+    conditional_page, board_list_state, board_state, post_state, aboard_list_state, aboard_state, apost_state,
+)
+from .images import register_upload
+from . import uploads
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 
+# Количество постов на одной странице доски.
+POSTS_PER_PAGE = 20
+# Количество откликов в одной порции на странице поста.
+RESPONSES_PER_PAGE = 20
+# Количество откликов на одной странице «Отклики на мои объявления».
+INBOX_RESPONSES_PER_PAGE = 20
+# Количество последних объявлений в фильтре страницы «Отклики на мои объявления».
+INBOX_FILTER_POSTS = 30
+# Количество результатов поиска на одной странице.
+SEARCH_RESULTS_PER_PAGE = 20
+
 # --- Представления для досок ---
+def _boards(sort):
+    boards = Board.objects.all()
+    if sort == 'activity':
+        boards = boards.order_by(F('last_activity_at').desc(nulls_last=True), 'name')
+    return boards
+
+def _board_posts(board):
+    """
+    Посты доски без содержимого: страница показывает только заголовки.
+    """
+    return (
+        Post.objects.filter(board=board)
+        .select_related('author')
+        .only('title', 'created_at', 'views', 'board_id', 'author__username')
+    )
+
+@conditional_page(board_list_state)
+@anonymous_page_cache(lambda: ['boards'], params=['sort'])
 def board_list(request):
     """
     Отображает список всех досок объявлений.
+    Счетчики берутся из денормализованных полей доски, поэтому страница строится одним запросом.
+    Параметр ?sort=activity сортирует доски по последней активности.
     """
-    boards = Board.objects.all()
-    return render(request, 'boards/board_list.html', {'boards': boards})
+    sort = request.GET.get('sort')
+    return render(request, 'boards/board_list.html', {'boards': _boards(sort), 'sort': sort})
 
+@conditional_page(board_state)
+@anonymous_page_cache(lambda pk: [f'board:{pk}'], params=['after', 'before'])
 def posts_by_board(request, pk):
     """
-    Отображает список постов для выбранной доски.
+    Отображает список постов для выбранной доски с курсорной пагинацией.
     """
     board = get_object_or_404(Board, pk=pk)
-    posts = Post.objects.filter(board=board).order_by('-created_at')
-    return render(request, 'boards/posts_by_board.html', {'board': board, 'posts': posts})
+    try:
+        page = keyset_paginate(
+            _board_posts(board),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=POSTS_PER_PAGE,
+        )
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы.')
+    return render(request, 'boards/posts_by_board.html', {'board': board, 'posts': page, 'page': page})
+
+# --- Поиск ---
+def search(request):
+    """
+    Полнотекстовый поиск по заголовкам и содержимому постов и откликов.
+    Результаты ранжируются по релевантности, совпадения подсвечиваются,
+    параметр ?board= ограничивает поиск одной доской.
+    """
+    query = request.GET.get('q', '').strip()
+    board_id = request.GET.get('board')
+    board_id = int(board_id) if board_id and board_id.isdigit() else None
+
+    page = None
+    if query:
+        paginator = Paginator(SearchResults(query, board_id=board_id), SEARCH_RESULTS_PER_PAGE)
+        page = paginator.get_page(request.GET.get('page'))
+        # Заголовки постов для найденных откликов подгружаются одним запросом.
+        response_post_ids = {row['post_id'] for row in page if row['kind'] == 'response'}
+        titles = dict(Post.objects.filter(pk__in=response_post_ids).values_list('pk', 'title'))
+        for row in page:
+            if row['kind'] == 'response':
+                row['post_title'] = titles.get(row['post_id'], '')
+
+    return render(request, 'boards/search.html', {
+        'query': query,
+        'board_id': board_id,
+        'boards': Board.objects.only('pk', 'name'),
+        'page': page,
+    })
+
+# --- Загрузка изображений ---
+def _upload_error(message, status=400):
+    return JsonResponse({'error': {'message': f'{message}'}}, status=status)
+
+def _save_upload(upload):
+    """
+    Проверяет изображение, сохраняет его в хранилище CKEDITOR_5_FILE_STORAGE и ставит
+    в очередь на создание вариантов. Возвращает адрес оригинала.
+    """
+    image_verify(upload)
+    upload.seek(0)
+    storage = get_django_storage()
+    path = storage.save(f'{settings.CKEDITOR_5_UPLOAD_PATH}{upload.name}', upload)
+    register_upload(path, upload.size)
+    return storage.url(path)
+
+@csrf_exempt
+@require_POST
+@check_upload_permission
+def upload_image(request):
+    """
+    Принимает изображение из CKEditor (вместо django_ckeditor_5.views.upload_file).
+    Тело запроса читается потоково (см. boards/uploads.py), файл сохраняется в хранилище
+    CKEDITOR_5_FILE_STORAGE и ставится в очередь на создание вариантов; ответ с адресом
+    оригинала возвращается сразу, не дожидаясь обработки. Повторная загрузка того же файла
+    возвращает уже сохраненный адрес.
+
+    Обработчики загрузки нужно заменить до чтения тела запроса, поэтому CSRF проверяется
+    уже после этого, в _upload_image.
+    """
+    request.upload_handlers = [uploads.StreamingUploadHandler(request, get_django_storage())]
+    return _upload_image(request)
+
+@csrf_protect
+def _upload_image(request):
+    form = UploadFileForm(request.POST, request.FILES)
+    error = getattr(request, 'upload_error', None)
+    if error is not None:
+        return _upload_error(error.message, error.status)
+    if not form.is_valid():
+        message = form.errors['upload'][0] if 'upload' in form.errors else 'Некорректные данные формы.'
+        return _upload_error(message)
+    upload = form.cleaned_data['upload']
+    try:
+        return JsonResponse({'url': _save_upload(upload)})
+    except NoImageException as ex:
+        return _upload_error(ex)
+    finally:
+        upload.close()
+
+@require_POST
+@check_upload_permission
+def start_resumable_upload(request):
+    """
+    Начинает возобновляемую загрузку большого изображения.
+    Параметры POST: filename и size. Ответ: id загрузки, текущее смещение и наибольший
+    размер части; дальше части отправляются запросами PUT на resumable_upload.
+    """
+    if not request.user.is_authenticated:
+        return _upload_error('Войдите, чтобы загружать файлы.', status=403)
+    filename = request.POST.get('filename', '').strip()
+    size = request.POST.get('size', '')
+    if not filename or not size.isdigit() or not int(size):
+        return _upload_error('Укажите имя и размер файла.')
+    try:
+        # Те же проверки расширения и размера, что и у обычной загрузки CKEditor.
+        for validator in UploadFileForm.base_fields['upload'].validators:
+            validator(UploadedFile(name=filename, size=int(size)))
+        uploads.check_file_size(int(size))
+        uploads.UploadQuota(request.user).start()
+    except ValidationError as e:
+        return _upload_error(e.messages[0])
+    except uploads.UploadRejected as error:
+        return _upload_error(error.message, error.status)
+
+    storage = get_django_storage()
+    expired = UploadSession.objects.filter(
+        user=request.user, updated_at__lt=timezone.now() - timedelta(seconds=uploads.get_config()['SESSION_TTL'])
+    )
+    for session in expired:
+        uploads.discard_part(storage, session)
+    expired.delete()
+    session = UploadSession.objects.create(
+        user=request.user, filename=filename, size=int(size),
+        content_type=request.POST.get('content_type', '')[:100],
+    )
+    return JsonResponse(
+        {'id': str(session.pk), 'offset': 0, 'chunk_size': uploads.get_config()['RESUMABLE_CHUNK_SIZE']},
+        status=201,
+    )
+
+@check_upload_permission
+def resumable_upload(request, pk):
+    """
+    Часть возобновляемой загрузки.
+    GET — текущее смещение (после обрыва клиент продолжает с него);
+    PUT с заголовком Upload-Offset — очередная часть, тело читается потоково порциями;
+    DELETE — отмена загрузки. После последней части возвращается адрес изображения.
+    """
+    session = UploadSession.objects.filter(pk=pk, user_id=request.user.pk).first()
+    if session is None:
+        return _upload_error('Загрузка не найдена.', status=404)
+    storage = get_django_storage()
+    if request.method in ('GET', 'HEAD'):
+        return JsonResponse({'offset': session.received, 'size': session.size})
+    if request.method == 'DELETE':
+        uploads.discard_part(storage, session)
+        session.delete()
+        return HttpResponse(status=204)
+    if request.method != 'PUT':
+        return _upload_error('Метод не поддерживается.', status=405)
+
+    offset = request.headers.get('Upload-Offset', '')
+    if not offset.isdigit() or int(offset) != session.received:
+        return JsonResponse({'error': {'message': 'Неверное смещение части.'}, 'offset': session.received}, status=409)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        part = uploads.receive_part(storage, session, request, length)
+    except uploads.UploadRejected as error:
+        return _upload_error(error.message, error.status)
+    received = session.received + length
+    with part, uploads.locked_part(storage, session) as file:
+        # Смещение сдвигается, только если его не изменил параллельный запрос; часть пишет только победивший.
+        if not UploadSession.objects.filter(pk=session.pk, received=session.received).update(
+            received=received, updated_at=timezone.now()
+        ):
+            return JsonResponse({'error': {'message': 'Неверное смещение части.'}, 'offset': session.received}, status=409)
+        try:
+            uploads.write_part(file, session.received, part)
+        except OSError:
+            # Смещение возвращается, чтобы клиент повторил часть.
+            UploadSession.objects.filter(pk=session.pk, received=received).update(received=session.received)
+            raise
+    session.received = received
+    if not session.is_complete:
+        return JsonResponse({'offset': received, 'size': session.size})
+
+    upload = uploads.completed_part(storage, session, session.content_type)
+    try:
+        return JsonResponse({'url': _save_upload(upload)})
+    except NoImageException as ex:
+        return _upload_error(ex)
+    finally:
+        upload.close()
+        uploads.discard_part(storage, session)
+        session.delete()
 
 # --- Представления для постов ---
 @login_required
@@ -50,26 +290,144 @@ def create_post(request, pk):
         form = PostForm()
     return render(request, 'boards/post_create.html', {'form': form, 'board': board})
 
+def _responses(post):
+    """
+    Отклики поста: только поля, которые выводит шаблон, и имя автора одним JOIN.
+    """
+    return (
+        Response.objects.filter(post=post)
+        .select_related('author')
+        .only('content_html', 'created_at', 'post_id', 'author__username')
+    )
+
+def _response_page(request, post):
+    """
+    Возвращает порцию откликов поста по курсору из GET-параметров.
+    """
+    try:
+        return keyset_paginate(
+            _responses(post),
+            after=request.GET.get('after'),
+            per_page=RESPONSES_PER_PAGE,
+            descending=False,
+        )
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы.')
+
+async def _aresponse_page(request, post):
+    """
+    Асинхронный вариант _response_page.
+    """
+    try:
+        return await akeyset_paginate(
+            _responses(post),
+            after=request.GET.get('after'),
+            per_page=RESPONSES_PER_PAGE,
+            descending=False,
+        )
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы.')
+
+def _post(board_pk, post_pk):
+    # Исходный HTML не нужен: страница выводит очищенный при сохранении content_html.
+    return Post.objects.select_related('author', 'board').defer('content').filter(board__pk=board_pk, pk=post_pk)
+
+@conditional_page(
+    post_state,
+    # Ответ 304 тоже считается просмотром.
+    on_not_modified=lambda board_pk, post_pk: record_view(post_pk),
+)
+@anonymous_page_cache(
+    lambda board_pk, post_pk: [f'board:{board_pk}', f'post:{post_pk}'],
+    params=['after'],
+    # Страница из кеша тоже считается просмотром.
+    on_hit=lambda board_pk, post_pk: record_view(post_pk),
+)
 def post_detail(request, board_pk, post_pk):
     """
-    Отображает детали конкретного поста и список откликов к нему.
+    Отображает детали конкретного поста и первую порцию откликов к нему.
     Увеличивает счетчик просмотров поста.
     """
-    post = get_object_or_404(Post, board__pk=board_pk, pk=post_pk)
+    post = get_object_or_404(_post(board_pk, post_pk))
 
-    # Увеличение счетчика просмотров.
-    Post.objects.filter(pk=post_pk).update(views=F('views') + 1)
-    post.refresh_from_db()
+    # Просмотр попадает в буфер отложенной записи; на странице показываем
+    # сохраненное значение плюс еще не записанные просмотры.
+    post.views += record_view(post.pk)
 
-    responses = Response.objects.filter(post=post).order_by('created_at')
     form = ResponseForm()
 
     return render(request, 'boards/post_detail.html', {
         'post': post,
-        'responses': responses,
+        'responses': _response_page(request, post),
         'form': form
     })
 
+# --- Асинхронные варианты страниц для чтения ---
+# Подключаются только под ASGI (boards/asgi_urls.py); под WSGI работают синхронные представления выше.
+# Данные загружаются асинхронным ORM, пользователь и сессия — заранее (см. main/asynchronous.py),
+# поэтому шаблон рендерится без обращений к базе, а ожидание базы не блокирует цикл событий сервера.
+@conditional_page(aboard_list_state)
+@anonymous_page_cache(lambda: ['boards'], params=['sort'])
+async def aboard_list(request):
+    """
+    Асинхронный вариант board_list.
+    """
+    await load_request(request)
+    sort = request.GET.get('sort')
+    boards = [board async for board in _boards(sort)]
+    return render(request, 'boards/board_list.html', {'boards': boards, 'sort': sort})
+
+@conditional_page(aboard_state)
+@anonymous_page_cache(lambda pk: [f'board:{pk}'], params=['after', 'before'])
+async def aposts_by_board(request, pk):
+    """
+    Асинхронный вариант posts_by_board.
+    """
+    await load_request(request)
+    board = await aget_object_or_404(Board, pk=pk)
+    try:
+        page = await akeyset_paginate(
+            _board_posts(board),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=POSTS_PER_PAGE,
+        )
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы.')
+    return render(request, 'boards/posts_by_board.html', {'board': board, 'posts': page, 'page': page})
+
+@conditional_page(
+    apost_state,
+    on_not_modified=lambda board_pk, post_pk: arecord_view(post_pk),
+)
+@anonymous_page_cache(
+    lambda board_pk, post_pk: [f'board:{board_pk}', f'post:{post_pk}'],
+    params=['after'],
+    on_hit=lambda board_pk, post_pk: arecord_view(post_pk),
+)
+async def apost_detail(request, board_pk, post_pk):
+    """
+    Асинхронный вариант post_detail.
+    """
+    await load_request(request)
+    post = await aget_object_or_404(_post(board_pk, post_pk))
+    post.views += await arecord_view(post.pk)
+    return render(request, 'boards/post_detail.html', {
+        'post': post,
+        'responses': await _aresponse_page(request, post),
+        'form': ResponseForm(),
+    })
+
+def post_responses(request, board_pk, post_pk):
+    """
+    Возвращает HTML-фрагмент со следующей порцией откликов поста («Показать еще»).
+    """
+    post = get_object_or_404(Post.objects.only('pk', 'board_id'), board__pk=board_pk, pk=post_pk)
+    return render(request, 'boards/response_chunk.html', {
+        'post': post,
+        'responses': _response_page(request, post),
+    })
+
 @login_required
 def add_response(request, board_pk, post_pk):
     """
@@ -89,7 +447,11 @@ def add_response(request, board_pk, post_pk):
     else:
         return redirect('boards:post_detail', board_pk=board_pk, post_pk=post_pk)
 
-    return render(request, 'boards/post_detail.html', {'form': form, 'post': post})
+    return render(request, 'boards/post_detail.html', {
+        'form': form,
+        'post': post,
+        'responses': _response_page(request, post),
+    })
 
 
 @login_required
@@ -119,29 +481,73 @@ def edit_post(request, board_pk, post_pk):
 @login_required
 def my_posts_responses_view(request):
     """
-    Отображает отклики на объявления, созданные текущим пользователем.
+    Отображает отклики на объявления, созданные текущим пользователем, с курсорной пагинацией.
     Позволяет фильтровать отклики по конкретным объявлениям.
+
+    Страница строится фиксированным числом запросов независимо от количества постов и откликов:
+    последние INBOX_FILTER_POSTS постов для фильтра со счетчиками одним запросом, выбранный
+    в фильтре пост (если он задан) и страница откликов одним запросом с JOIN поста и автора
+    по индексу response_inbox_idx.
     """
-    user_posts = Post.objects.filter(author=request.user).order_by('-created_at')
+    # Счетчик коррелированным подзапросом, а не JOIN с GROUP BY: без группировки список
+    # читается по индексу post_author_created_idx уже в нужном порядке, без сортировки.
+    pending = (
+        Response.objects.filter(post=OuterRef('pk'), is_accepted=False)
+        .order_by().values('post').annotate(count=Count('pk')).values('count')
+    )
+    own_posts = (
+        Post.objects.filter(author=request.user)
+        .annotate(pending_count=Coalesce(Subquery(pending, output_field=IntegerField()), 0))
+        .only('pk', 'title', 'response_count', 'board_id')
+        .order_by('-created_at')
+    )
+    # Один лишний пост показывает, что объявлений больше, чем помещается в фильтр.
+    user_posts = list(own_posts[:INBOX_FILTER_POSTS + 1])
+    has_more_posts = len(user_posts) > INBOX_FILTER_POSTS
+    user_posts = user_posts[:INBOX_FILTER_POSTS]
     selected_post_id = request.GET.get('post')
 
-    responses = Response.objects.filter(post__author=request.user).order_by('-created_at')
+    responses = (
+        Response.objects.filter(post_author=request.user)
+        .select_related('post', 'author')
+        .only(
+            'content_html', 'created_at', 'is_accepted', 'post_id', 'post_author_id',
+            'post__title', 'post__board_id', 'author__username',
+        )
+    )
 
     if selected_post_id:
-        try:
-            selected_post = user_posts.get(pk=selected_post_id)
+        selected_post = None
+        if selected_post_id.isdigit():
+            selected_post = own_posts.filter(pk=selected_post_id).first()
+        if selected_post is not None:
+            if all(post.pk != selected_post.pk for post in user_posts):
+                # Старое объявление (например, по ссылке из письма) добавляется в фильтр, чтобы оставаться выбранным.
+                user_posts.append(selected_post)
             responses = responses.filter(post=selected_post)
             messages.info(request, f'Отклики отфильтрованы по посту: "{selected_post.title}"')
-        except Post.DoesNotExist:
+        else:
             messages.error(request, 'Выбранный пост не существует или не принадлежит вам.')
             selected_post_id = None
-            responses = Response.objects.filter(post__author=request.user).order_by('-created_at')
+
+    try:
+        page = keyset_paginate(
+            responses,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=INBOX_RESPONSES_PER_PAGE,
+        )
+    except InvalidCursor:
+        raise Http404('Некорректный курсор страницы.')
 
     context = {
         'user_posts': user_posts,
-        'responses': responses,
+        'has_more_posts': has_more_posts,
+        'filter_posts_limit': INBOX_FILTER_POSTS,
+        'responses': page,
+        'page': page,
         'selected_post_id': selected_post_id,
-        'has_responses': responses.exists(),
+        'has_responses': bool(page),
     }
     return render(request, 'boards/my_posts_responses.html', context)
 
@@ -175,29 +581,24 @@ def accept_response_view(request, pk):
                 'recipient_username': response.author.username,
                 'post_title': response.post.title,
                 'post_url': request.build_absolute_uri(reverse('boards:post_detail', args=[response.post.board.pk, response.post.pk])),
-                'response_content': response.content,
+                'response_content': response.content_html,
             }
 
             html_message = render_to_string(template_name, context)
             plain_message = (
                 f"Здравствуйте, {response.author.username}!\n\n"
                 f"Ваш отклик на пост \"{response.post.title}\" был принят автором.\n\n"
-                f"Содержание вашего отклика: {response.content}\n\n"
+                f"Содержание вашего отклика: {response.excerpt}\n\n"
                 f"Вы можете посмотреть пост здесь: {context['post_url']}\n\n"
                 f"С уважением,\nКоманда MyFanBoard."
             )
-            try:
-                send_mail(
-                    subject,
-                    plain_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [response.author.email],
-                    html_message=html_message,
-                    fail_silently=False,
-                )
-                messages.info(request, f'Уведомление отправлено автору отклика ({response.author.email}).')
-            except Exception as e:
-                messages.error(request, f'Не удалось отправить уведомление автору отклика: {e}')
+            enqueue_mail(
+                subject,
+                plain_message,
+                [response.author.email],
+                html_message=html_message,
+            )
+            messages.info(request, f'Уведомление автору отклика ({response.author.email}) поставлено в очередь отправки.')
 
     return redirect('boards:my_posts_responses')
 
@@ -241,7 +642,7 @@ class UnsubscribeNewsletterView(LoginRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         # Отписка пользователя от рассылки.
         request.user.profile.is_subscribed_to_newsletter = False
-        request.user.profile.save()
+        request.user.profile.save(update_fields=['is_subscribed_to_newsletter'])
 
         messages.success(request, 'Вы успешно отписались от новостной рассылки.')
         return redirect('home')
\ No newline at end of file
@@ -1,3 +1,26 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Регистрация моделей в админ-панели.
\ No newline at end of file
+from .models import OutboxMessage
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """
+    Настройки отображения исходящей очереди писем в админ-панели.
+    """
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'sent_at', 'locked_at', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description='Повторить отправку выбранных писем')
+    def retry_now(self, request, queryset):
+        """
+        Возвращает выбранные письма в очередь для немедленной отправки.
+        """
+        count = queryset.exclude(status=OutboxMessage.STATUS_SENT).update(
+            status=OutboxMessage.STATUS_PENDING, next_attempt_at=timezone.now(), attempts=0, locked_at=None
+        )
+        self.message_user(request, f"Писем возвращено в очередь: {count}.")
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        """
+        Подключает замер времени рендеринга шаблонов и отправки писем (см. main/instrumentation.py).
+        """
+        from . import instrumentation
+        instrumentation.install()
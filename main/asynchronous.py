@@ -0,0 +1,38 @@
+"""
+Вспомогательные функции асинхронных представлений.
+
+В асинхронном представлении синхронные обращения к базе запрещены (SynchronousOnlyOperation),
+а request.user и request.session загружаются лениво — при первом обращении, в том числе
+из шаблона и контекстных процессоров. load_request загружает их заранее асинхронно,
+после чего проверки пользователя, flash-сообщения и рендеринг шаблона не ходят в базу.
+
+ASGIHandler направляет запросы ASGI-сервера в settings.ASGI_URLCONF, где страницы для чтения —
+асинхронные представления. WSGI-сервер продолжает использовать ROOT_URLCONF с синхронными.
+"""
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler as BaseASGIHandler
+
+
+class ASGIHandler(BaseASGIHandler):
+    """
+    ASGI-обработчик проекта: разрешает URL по settings.ASGI_URLCONF, если он задан.
+    """
+    def resolve_request(self, request):
+        urlconf = getattr(settings, 'ASGI_URLCONF', None)
+        if urlconf and not hasattr(request, 'urlconf'):
+            request.urlconf = urlconf
+        return super().resolve_request(request)
+
+
+async def load_request(request):
+    """
+    Загружает сессию и пользователя запроса. Повторный вызов ничего не делает.
+    """
+    if getattr(request, '_async_loaded', False):
+        return
+    if hasattr(request, 'session'):
+        # Первое асинхронное чтение заполняет кеш сессии; дальше она читается из памяти.
+        await request.session.akeys()
+    if hasattr(request, 'auser'):
+        request.user = await request.auser()
+    request._async_loaded = True
@@ -0,0 +1,239 @@
+"""
+Замеры обработки HTTP-запросов: число и время SQL-запросов, время рендеринга шаблонов,
+отправки писем и общее время.
+
+RequestInstrumentationMiddleware отдает замеры заголовком Server-Timing (видны во вкладке
+«Сеть» инструментов разработчика браузера) и пишет их строкой JSON в журнал
+'myfanboard.requests'. Для медленных запросов (дольше SLOW_REQUEST_MS) в журнал попадают
+и самые долгие SQL-запросы. Заголовок и журнал — для доли SAMPLE_RATE запросов; время
+и число SQL-запросов всех запросов попадают в метрики (main/metrics.py), если они включены.
+
+SQL-запросы замеряются оберткой, которая ставится на каждое подключение к базе при его
+создании и относит запрос к замерам из contextvar текущего запроса. Так учитываются и запросы
+асинхронных представлений под ASGI, которые ORM выполняет в отдельных потоках.
+"""
+import functools
+import heapq
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import get_config as metrics_config, observe_request
+
+# Настройки по умолчанию; переопределяются словарем INSTRUMENTATION в settings.py.
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,          # Доля замеряемых запросов, от 0 до 1.
+    'SERVER_TIMING': True,       # Добавлять заголовок Server-Timing в ответ.
+    'LOG': True,                 # Писать строку с замерами в журнал 'myfanboard.requests'.
+    'SLOW_REQUEST_MS': 500,      # Начиная с этого времени запрос считается медленным.
+    'SLOW_QUERIES': 5,           # Сколько самых долгих SQL-запросов выводить для медленного запроса.
+}
+
+logger = logging.getLogger('myfanboard.requests')
+
+# Замеры текущего запроса; None — запрос не замеряется.
+_current = ContextVar('request_metrics', default=None)
+
+
+def get_config():
+    """
+    Возвращает настройки замеров с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestMetrics:
+    """
+    Замеры одного HTTP-запроса. Время хранится в секундах.
+    """
+    def __init__(self, slow_queries):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.timings = {'template': 0.0, 'mail': 0.0}
+        self._depth = {}
+        self._slow_queries = slow_queries
+        self._top = []
+
+    def record_query(self, sql, elapsed):
+        self.db_count += 1
+        self.db_time += elapsed
+        if self._slow_queries:
+            # Куча из SLOW_QUERIES самых долгих запросов, без хранения остальных.
+            entry = (elapsed, self.db_count, sql)
+            if len(self._top) < self._slow_queries:
+                heapq.heappush(self._top, entry)
+            elif elapsed > self._top[0][0]:
+                heapq.heapreplace(self._top, entry)
+
+    def top_queries(self):
+        return [{'ms': round(elapsed * 1000, 2), 'sql': sql} for elapsed, _, sql in sorted(self._top, reverse=True)]
+
+
+def _query_timer(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def _add_query_timer(sender=None, connection=None, **kwargs):
+    if _query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _query_timer)
+
+
+@contextmanager
+def measure(name):
+    """
+    Добавляет время выполнения блока к показателю name текущего запроса.
+    Вложенные блоки с тем же именем не учитываются повторно.
+    Вне замеряемого запроса ничего не делает.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._depth.get(name):
+        yield
+        return
+    metrics._depth[name] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._depth[name] = 0
+        metrics.timings[name] = metrics.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def _measured(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return method(*args, **kwargs)
+        with measure(name):
+            return method(*args, **kwargs)
+    wrapper._instrumented = True
+    return wrapper
+
+
+def install():
+    """
+    Оборачивает рендеринг шаблонов Django и отправку писем замером времени и подключает
+    замер SQL-запросов к создаваемым подключениям. Вызывается один раз при запуске (MainConfig.ready).
+    """
+    from django.core.mail import EmailMessage
+    from django.template.backends.django import Template
+
+    for cls, attribute, name in ((Template, 'render', 'template'), (EmailMessage, 'send', 'mail')):
+        method = getattr(cls, attribute)
+        if not getattr(method, '_instrumented', False):
+            setattr(cls, attribute, _measured(name, method))
+
+    connection_created.connect(_add_query_timer, dispatch_uid='instrumentation_query_timer')
+    for connection in connections.all(initialized_only=True):
+        _add_query_timer(connection=connection)
+
+
+def server_timing(metrics, total):
+    """
+    Значение заголовка Server-Timing: время в миллисекундах, число запросов в описании.
+    """
+    parts = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.db_count} queries"']
+    parts += [f'{name};dur={value * 1000:.1f}' for name, value in metrics.timings.items()]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Замеряет обработку запроса (см. описание модуля). Должен стоять первым в MIDDLEWARE,
+    чтобы учитывались и запросы к базе из остальных middleware (сессия, пользователь).
+    Работает и в синхронной (WSGI), и в асинхронной (ASGI) цепочке middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        measured = self._start()
+        if measured is None:
+            return self.get_response(request)
+        token = _current.set(measured[0])
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, *measured)
+
+    async def __acall__(self, request):
+        measured = self._start()
+        if measured is None:
+            return await self.get_response(request)
+        token = _current.set(measured[0])
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, *measured)
+
+    def _start(self):
+        """
+        Начинает замер. Возвращает (метрики, время начала, настройки, в выборке ли)
+        или None, если запрос не замеряется.
+        """
+        config = get_config()
+        sampled = config['ENABLED'] and random.random() < config['SAMPLE_RATE']
+        # Метрики (см. main/metrics.py) собираются со всех запросов, заголовок и журнал — с выборки.
+        if not sampled and not metrics_config()['ENABLED']:
+            return None
+        return RequestMetrics(config['SLOW_QUERIES']), time.perf_counter(), config, sampled
+
+    def _finish(self, request, response, metrics, started, config, sampled):
+        total = time.perf_counter() - started
+        if metrics_config()['ENABLED']:
+            match = getattr(request, 'resolver_match', None)
+            observe_request(match.view_name if match else '<unresolved>', response.status_code,
+                            total, metrics.db_count, metrics.db_time)
+        if not sampled:
+            return response
+        if config['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(metrics, total)
+        if config['LOG']:
+            self._log(request, response, metrics, total, config)
+        return response
+
+    def _log(self, request, response, metrics, total, config):
+        slow = total * 1000 >= config['SLOW_REQUEST_MS']
+        if not logger.isEnabledFor(logging.WARNING if slow else logging.INFO):
+            return
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'db_queries': metrics.db_count,
+            **{f'{name}_ms': round(value * 1000, 2) for name, value in metrics.timings.items()},
+        }
+        if slow:
+            record['top_queries'] = metrics.top_queries()
+            logger.warning(json.dumps(record, ensure_ascii=False), extra={'metrics': record})
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False), extra={'metrics': record})
@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main.query_plans import ERRORS, audit, errors, format_report
+
+
+class Command(BaseCommand):
+    """
+    Вызывает представления boards и users на данных текущей базы (например, после seed_fanboard),
+    проверяет планы всех их SQL-запросов через EXPLAIN QUERY PLAN и выводит запросы с полными
+    проходами по таблицам и сортировками во временном B-дереве вместе с предлагаемыми индексами.
+    Изменения, сделанные представлениями, откатываются.
+    """
+    help = 'Проверяет планы SQL-запросов представлений и предлагает недостающие индексы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notes', action='store_true',
+                            help='Показывать и замечания: поиск по индексу, не покрывающему запрос.')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON.')
+        parser.add_argument('--fail', action='store_true', help='Завершиться с ошибкой, если найдены проблемы плана.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Аудит планов поддерживает только SQLite (EXPLAIN QUERY PLAN).')
+        try:
+            results = audit()
+        except ValueError as error:
+            raise CommandError(str(error))
+        problems = errors(results)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+        else:
+            report = format_report(results, notes=options['notes'])
+            if report:
+                self.stdout.write(report)
+            summary = f'Проверено запросов: {len(results)}, с проблемами ({", ".join(sorted(ERRORS))}): {len(problems)}.'
+            self.stdout.write(self.style.SUCCESS(summary) if not problems else self.style.WARNING(summary))
+        if problems and options['fail']:
+            raise CommandError('Найдены запросы с полным проходом по таблице или временной сортировкой.')
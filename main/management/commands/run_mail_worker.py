@@ -0,0 +1,33 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main.outbox import claim_batch, deliver, get_config
+
+
+class Command(BaseCommand):
+    """
+    Фоновый процесс отправки писем из исходящей очереди (OutboxMessage).
+    """
+    help = 'Отправляет письма из исходящей очереди порциями с повторными попытками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать очередь один раз и завершиться.')
+        parser.add_argument('--batch-size', type=int, help='Писем в одной порции.')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        # Одно соединение переиспользуется для всех писем порции.
+        connection = get_connection()
+        while True:
+            close_old_connections()
+            batch = claim_batch(options['batch_size'])
+            if batch:
+                sent, failed = deliver(batch, connection=connection)
+                self.stdout.write(f'Отправлено: {sent}, ошибок: {failed}')
+                continue
+            if options['once']:
+                return
+            time.sleep(config['POLL_INTERVAL'])
@@ -0,0 +1,500 @@
+"""
+Метрики сайта в формате Prometheus: счетчики, гистограммы и вычисляемые при опросе показатели.
+
+Каждый рабочий процесс копит значения в памяти (горячий путь — блокировка и сложение в словаре)
+и раз в FLUSH_INTERVAL секунд записывает их снимок в свой файл в каталоге DIRECTORY.
+Страница /metrics складывает файлы всех процессов, поэтому показывает сумму по всем рабочим
+процессам сервера без внешних сервисов. Файлы завершившихся процессов при опросе сливаются
+в один базовый файл, чтобы счетчики не уменьшались, а каталог не рос с каждым перезапуском.
+Завершенность процесса определяется по PID из имени файла, поэтому каталог не должен быть
+общим для нескольких машин или контейнеров.
+"""
+import atexit
+import bisect
+import ipaddress
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+try:
+    import fcntl
+except ImportError:  # Windows: файлы завершившихся процессов не сливаются.
+    fcntl = None
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Настройки по умолчанию; переопределяются словарем METRICS в settings.py.
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': os.path.join(tempfile.gettempdir(), 'myfanboard-metrics'),  # Общий каталог рабочих процессов.
+    'FLUSH_INTERVAL': 5,                        # Секунды между записями снимка процесса.
+    'ALLOWED_IPS': [],                          # Адреса и сети, с которых /metrics доступна без входа.
+    'TRUSTED_PROXIES': [],                      # Прокси, чьему заголовку X-Forwarded-For можно верить.
+}
+
+# Файл со сложенными значениями завершившихся процессов и блокировка его перезаписи.
+BASE_FILENAME = 'base.json'
+LOCK_FILENAME = 'compact.lock'
+
+# Границы гистограмм времени, секунды.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы гистограммы числа SQL-запросов на HTTP-запрос.
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+def get_config():
+    """
+    Возвращает настройки метрик с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class Registry:
+    """
+    Значения метрик текущего процесса и их запись в общий каталог.
+    Значение хранится по ключу (имя ряда, кортеж пар меток).
+    """
+    def __init__(self):
+        self.families = {}
+        self.collectors = []
+        self._reset_process()
+        if hasattr(os, 'register_at_fork'):
+            # Дочерний процесс (например, рабочий процесс gunicorn с --preload) ведет свой файл с нуля.
+            os.register_at_fork(after_in_child=self._reset_process)
+
+    def _reset_process(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+        self._thread = None
+        self._filename = f'{os.getpid()}-{time.time_ns()}.json'
+
+    def register(self, metric):
+        self.families[metric.name] = metric
+        return metric
+
+    def collector(self, function):
+        """
+        Регистрирует функцию, вычисляющую показатели при опросе (например, длину очереди писем).
+        Функция возвращает список (имя, тип, описание, [(метки, значение), ...]).
+        """
+        self.collectors.append(function)
+        return function
+
+    def add(self, items):
+        """
+        Прибавляет значения; items — пары (ключ, прибавка).
+        """
+        with self._lock:
+            for key, amount in items:
+                self._values[key] += amount
+        if self._thread is None:
+            self._ensure_thread()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def _path(self, directory):
+        return os.path.join(directory, self._filename)
+
+    def flush(self):
+        """
+        Записывает снимок значений процесса в его файл (атомарно, через переименование).
+        """
+        values = self.snapshot()
+        if not values:
+            return
+        directory = get_config()['DIRECTORY']
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_json(directory, self._path(directory),
+                        [[name, labels, value] for (name, labels), value in values.items()])
+        except OSError:
+            logger.exception('Не удалось записать метрики процесса')
+
+    def _ensure_thread(self):
+        """
+        Лениво запускает фоновый поток периодической записи снимка.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(get_config()['FLUSH_INTERVAL'])
+            self.flush()
+
+    def collect(self):
+        """
+        Складывает значения всех процессов: базовый файл, файлы других процессов и текущие значения этого.
+        """
+        directory = get_config()['DIRECTORY']
+        self.compact(directory)
+        base_path = os.path.join(directory, BASE_FILENAME)
+        for _ in range(3):
+            base_version = _file_version(base_path)
+            totals = defaultdict(float)
+            merged, samples = _read_base(base_path)
+            _add_samples(totals, samples)
+            skipped = {self._filename, BASE_FILENAME, *merged}
+            for name in _process_files(directory):
+                if name not in skipped:
+                    _add_samples(totals, _read_samples(os.path.join(directory, name)))
+            # Базовый файл перезаписан во время чтения — файлы могли быть учтены дважды или пропущены.
+            if _file_version(base_path) == base_version:
+                break
+        for key, value in self.snapshot().items():
+            totals[key] += value
+        return totals
+
+    def compact(self, directory):
+        """
+        Сливает файлы завершившихся процессов в базовый файл и удаляет их.
+        Базовый файл хранит имена слитых файлов: читатель пропускает их, даже если они еще не удалены.
+        """
+        if fcntl is None:
+            return
+        if not any(_is_finished(name) for name in _process_files(directory)):
+            return
+        try:
+            lock = open(os.path.join(directory, LOCK_FILENAME), 'a')
+        except OSError:
+            return
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Файлы сливает другой процесс.
+                return
+            base_path = os.path.join(directory, BASE_FILENAME)
+            merged, samples = _read_base(base_path)
+            names = _process_files(directory)
+            # Имена, уже учтенные в базовом файле, но не удаленные из-за сбоя, остаются в списке до удаления.
+            merged = [name for name in merged if name in names]
+            totals = defaultdict(float)
+            _add_samples(totals, samples)
+            for name in names:
+                if name in merged or not _is_finished(name):
+                    continue
+                samples = _read_samples(os.path.join(directory, name))
+                if samples is None:
+                    continue
+                _add_samples(totals, samples)
+                merged.append(name)
+            try:
+                _write_json(directory, base_path, {
+                    'merged': merged,
+                    'samples': [[name, labels, value] for (name, labels), value in totals.items()],
+                })
+            except OSError:
+                logger.exception('Не удалось записать базовый файл метрик')
+                return
+            for name in merged:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def exposition(self):
+        """
+        Текст в формате Prometheus (text/plain; version=0.0.4).
+        """
+        totals = self.collect()
+        by_family = defaultdict(list)
+        for (name, labels), value in totals.items():
+            by_family[self._family_of(name)].append((name, labels, value))
+
+        lines = []
+        for name in sorted(self.families):
+            metric = self.families[name]
+            samples = by_family.get(name)
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.render(samples))
+        for function in self.collectors:
+            for name, kind, documentation, samples in function():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(_sample_line(name, labels, value) for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+    def _family_of(self, sample_name):
+        if sample_name in self.families:
+            return sample_name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in self.families:
+                return sample_name[:-len(suffix)]
+        return sample_name
+
+
+def _write_json(directory, path, data):
+    """
+    Атомарно записывает data в path: через временный файл и переименование.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as tmp:
+        json.dump(data, tmp)
+    os.replace(tmp_path, path)
+
+
+def _process_files(directory):
+    try:
+        return [name for name in os.listdir(directory) if name.endswith('.json') and name != BASE_FILENAME]
+    except FileNotFoundError:
+        return []
+
+
+def _read_samples(path):
+    """
+    Ряды из файла процесса или None, если файл удален или не читается.
+    """
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_base(path):
+    """
+    Возвращает (имена слитых файлов, ряды) базового файла.
+    """
+    data = _read_samples(path) or {}
+    return data.get('merged', []), data.get('samples', [])
+
+
+def _add_samples(totals, samples):
+    for sample_name, labels, value in samples or ():
+        totals[sample_name, tuple(tuple(pair) for pair in labels)] += value
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _is_finished(name):
+    """
+    Завершился ли процесс, записавший файл name ('<pid>-<время>.json').
+    """
+    pid = name.split('-', 1)[0]
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # Процесс существует, но принадлежит другому пользователю.
+        return False
+    return False
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{key}="{_escape(label)}"' for key, label in labels) + '}'
+    return f'{name} {_format_value(value)}'
+
+
+class Counter:
+    """
+    Монотонно растущий счетчик с метками.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple((label, str(labels[label])) for label in self.labelnames)
+        self.registry.add([((self.name, key), amount)])
+
+    def render(self, samples):
+        return [_sample_line(name, labels, value) for name, labels, value in sorted(samples)]
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными границами. Хранится число наблюдений в каждом интервале;
+    накопленные значения _bucket считаются при выводе.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._bucket_labels = [_format_value(bound) for bound in self.buckets]
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def items(self, value, key):
+        """
+        Прибавки к рядам гистограммы для одного наблюдения; key — кортеж пар меток.
+        """
+        bucket = self._bucket_labels[bisect.bisect_left(self.buckets, value)]
+        return [
+            ((f'{self.name}_bucket', key + (('le', bucket),)), 1),
+            ((f'{self.name}_sum', key), value),
+            ((f'{self.name}_count', key), 1),
+        ]
+
+    def observe(self, value, **labels):
+        self.registry.add(self.items(value, tuple((label, str(labels[label])) for label in self.labelnames)))
+
+    def render(self, samples):
+        series = defaultdict(lambda: {'buckets': {}, 'sum': 0, 'count': 0})
+        for name, labels, value in samples:
+            if name.endswith('_bucket'):
+                series[labels[:-1]]['buckets'][labels[-1][1]] = value
+            else:
+                series[labels][name.rsplit('_', 1)[1]] = value
+        lines = []
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bucket in self._bucket_labels:
+                cumulative += values['buckets'].get(bucket, 0)
+                lines.append(_sample_line(f'{self.name}_bucket', labels + (('le', bucket),), cumulative))
+            lines.append(_sample_line(f'{self.name}_sum', labels, values['sum']))
+            lines.append(_sample_line(f'{self.name}_count', labels, values['count']))
+        return lines
+
+
+# Реестр метрик сайта.
+REGISTRY = Registry()
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса по имени URL.', ['view'],
+)
+RESPONSES = Counter(
+    'http_responses_total', 'Ответы по имени URL и коду статуса.', ['view', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'Число SQL-запросов на HTTP-запрос.', ['view'], buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    'db_time_per_request_seconds', 'Суммарное время SQL-запросов на HTTP-запрос.', ['view'],
+)
+PAGE_CACHE = Counter(
+    'page_cache_requests_total', 'Обращения к кешу страниц: hit, miss или bypass.', ['result'],
+)
+OTP_ISSUED = Counter(
+    'otp_codes_issued_total', 'Выданные одноразовые коды по типу.', ['type'],
+)
+OTP_VERIFICATIONS = Counter(
+    'otp_verifications_total', 'Проверки одноразовых кодов: success или failure.', ['type', 'result'],
+)
+MAIL_ENQUEUED = Counter(
+    'mail_enqueued_total', 'Письма, поставленные в исходящую очередь.',
+)
+MAIL_DELIVERIES = Counter(
+    'mail_deliveries_total', 'Попытки отправки писем: уведомления из очереди и рассылки.', ['kind', 'result'],
+)
+
+
+@REGISTRY.collector
+def outbox_gauges():
+    """
+    Размер исходящей очереди писем по статусам и возраст самого старого неотправленного письма.
+    """
+    from django.db.models import Count, Min
+    from django.utils import timezone
+
+    from .models import OutboxMessage
+
+    counts = dict(OutboxMessage.objects.values_list('status').annotate(total=Count('pk')).order_by())
+    oldest = OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING).aggregate(
+        oldest=Min('created_at'))['oldest']
+    return [
+        ('mail_outbox_messages', 'gauge', 'Письма в исходящей очереди по статусам.', [
+            ((('status', status),), counts.get(status, 0)) for status, _ in OutboxMessage.STATUSES
+        ]),
+        ('mail_outbox_oldest_pending_seconds', 'gauge', 'Возраст самого старого неотправленного письма.', [
+            ((), (timezone.now() - oldest).total_seconds() if oldest else 0),
+        ]),
+    ]
+
+
+def observe_request(view, status, duration, queries, db_time):
+    """
+    Записывает замеры одного HTTP-запроса (вызывается из RequestInstrumentationMiddleware).
+    """
+    key = (('view', view),)
+    # Одно обращение к реестру на запрос: все ряды прибавляются под одной блокировкой.
+    REGISTRY.add([
+        *REQUEST_DURATION.items(duration, key),
+        *REQUEST_QUERIES.items(queries, key),
+        *REQUEST_DB_TIME.items(db_time, key),
+        ((RESPONSES.name, key + (('status', str(status)),)), 1),
+    ])
+
+
+def _in_networks(address, networks):
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def client_address(request, trusted_proxies):
+    """
+    Адрес клиента запроса. Если запрос пришел от доверенного прокси, адрес берется из X-Forwarded-For:
+    последний адрес справа, не принадлежащий доверенным прокси. Возвращает None, если адрес не определен.
+    """
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return None
+    if not _in_networks(address, trusted_proxies):
+        return address
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+    for part in reversed(forwarded):
+        try:
+            address = ipaddress.ip_address(part)
+        except ValueError:
+            return None
+        if not _in_networks(address, trusted_proxies):
+            return address
+    # Прокси не передал адрес клиента: за ним может оказаться кто угодно.
+    return None
+
+
+def is_allowed(request):
+    """
+    Доступ к /metrics: сотрудники сайта или запросы с адресов из ALLOWED_IPS.
+    По умолчанию список пуст: за локальным прокси REMOTE_ADDR у всех запросов 127.0.0.1,
+    поэтому адреса клиентов за прокси проверяются по X-Forwarded-For из TRUSTED_PROXIES.
+    """
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    config = get_config()
+    address = client_address(request, config['TRUSTED_PROXIES'])
+    return address is not None and _in_networks(address, config['ALLOWED_IPS'])
@@ -1,3 +1,44 @@
 from django.db import models
 
-# Create your models here.
+
+class OutboxMessage(models.Model):
+    """
+    Письмо в исходящей очереди (outbox).
+    Записывается в той же транзакции, что и породившее его действие,
+    и отправляется фоновым процессом run_mail_worker.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUSES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_DEAD, 'Не доставлено'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    body = models.TextField(verbose_name="Текст письма")
+    html_body = models.TextField(blank=True, default='', verbose_name="HTML-версия письма")
+    from_email = models.CharField(max_length=254, verbose_name="Отправитель")
+    recipients = models.JSONField(default=list, verbose_name="Получатели")
+    status = models.CharField(max_length=10, choices=STATUSES, default=STATUS_PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток отправки")
+    next_attempt_at = models.DateTimeField(verbose_name="Следующая попытка")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Взято в отправку")
+    last_error = models.TextField(blank=True, default='', verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата отправки")
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        ordering = ['-created_at']
+        indexes = [
+            # Выборка очередной порции писем рабочим процессом.
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)} ({self.get_status_display()})"
@@ -0,0 +1,140 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .instrumentation import measure
+from .models import OutboxMessage
+
+# Настройки по умолчанию; переопределяются словарем OUTBOX в settings.py.
+DEFAULTS = {
+    'BATCH_SIZE': 50,        # Писем за одну выборку рабочего процесса.
+    'MAX_ATTEMPTS': 5,       # После стольких неудач письмо переходит в статус «Не доставлено».
+    'BACKOFF_BASE': 30,      # Секунды до повторной попытки; удваиваются после каждой неудачи.
+    'BACKOFF_MAX': 3600,     # Верхняя граница задержки между попытками.
+    'LOCK_TIMEOUT': 300,     # Через столько секунд письмо, взятое упавшим процессом, возвращается в очередь.
+    'POLL_INTERVAL': 2,      # Пауза рабочего процесса при пустой очереди.
+}
+
+
+def get_config():
+    """
+    Возвращает настройки исходящей очереди с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'OUTBOX', {})}
+
+
+def enqueue_mail(subject, message, recipient_list, html_message=None, from_email=None):
+    """
+    Ставит письмо в исходящую очередь вместо немедленной отправки через send_mail.
+
+    Запись создается в текущей транзакции: если действие, породившее письмо, откатится,
+    письмо тоже не уйдет. Рабочий процесс видит письмо только после фиксации транзакции.
+    """
+    metrics.MAIL_ENQUEUED.inc()
+    with measure('mail'):
+        return OutboxMessage.objects.create(
+            subject=subject,
+            body=message,
+            html_body=html_message or '',
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=list(recipient_list),
+            next_attempt_at=timezone.now(),
+        )
+
+
+def _backoff(attempts, config):
+    return timedelta(seconds=min(config['BACKOFF_BASE'] * 2 ** (attempts - 1), config['BACKOFF_MAX']))
+
+
+def claim_batch(batch_size=None):
+    """
+    Забирает порцию готовых к отправке писем, помечая их как отправляемые.
+    Письма, зависшие в отправке дольше LOCK_TIMEOUT (процесс упал), возвращаются в очередь.
+    """
+    config = get_config()
+    now = timezone.now()
+    OutboxMessage.objects.filter(
+        status=OutboxMessage.STATUS_SENDING,
+        locked_at__lt=now - timedelta(seconds=config['LOCK_TIMEOUT']),
+    ).update(status=OutboxMessage.STATUS_PENDING, locked_at=None)
+
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')
+            .values_list('pk', flat=True)[:batch_size or config['BATCH_SIZE']]
+        )
+        # Условие по статусу не дает двум процессам забрать одно и то же письмо.
+        OutboxMessage.objects.filter(pk__in=ids, status=OutboxMessage.STATUS_PENDING).update(
+            status=OutboxMessage.STATUS_SENDING, locked_at=now
+        )
+    return list(
+        OutboxMessage.objects.filter(pk__in=ids, locked_at=now, status=OutboxMessage.STATUS_SENDING)
+        .order_by('next_attempt_at', 'pk')
+    )
+
+
+def _record_failure(outbox_message, error, config):
+    outbox_message.last_error = str(error)
+    if outbox_message.attempts >= config['MAX_ATTEMPTS']:
+        outbox_message.status = OutboxMessage.STATUS_DEAD
+    else:
+        outbox_message.status = OutboxMessage.STATUS_PENDING
+        outbox_message.next_attempt_at = timezone.now() + _backoff(outbox_message.attempts, config)
+
+
+def deliver(messages, connection=None):
+    """
+    Отправляет письма через одно SMTP-соединение и фиксирует результат каждого.
+    Неудачные письма планируются на повтор с экспоненциальной задержкой,
+    после MAX_ATTEMPTS неудач — переводятся в статус «Не доставлено».
+    Возвращает пару (отправлено, не отправлено).
+    """
+    config = get_config()
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        connection.open()
+    except Exception as e:
+        # Сервер недоступен — вся порция уходит на повтор.
+        connection_error = e
+    else:
+        connection_error = None
+    try:
+        for outbox_message in messages:
+            outbox_message.attempts += 1
+            outbox_message.locked_at = None
+            try:
+                if connection_error is not None:
+                    raise connection_error
+                email = EmailMultiAlternatives(
+                    outbox_message.subject,
+                    outbox_message.body,
+                    outbox_message.from_email,
+                    outbox_message.recipients,
+                    connection=connection,
+                )
+                if outbox_message.html_body:
+                    email.attach_alternative(outbox_message.html_body, 'text/html')
+                email.send(fail_silently=False)
+            except Exception as e:
+                failed += 1
+                metrics.MAIL_DELIVERIES.inc(kind='notification', result='failed')
+                _record_failure(outbox_message, e, config)
+            else:
+                sent += 1
+                metrics.MAIL_DELIVERIES.inc(kind='notification', result='sent')
+                outbox_message.status = OutboxMessage.STATUS_SENT
+                outbox_message.sent_at = timezone.now()
+                outbox_message.last_error = ''
+            outbox_message.save(update_fields=[
+                'status', 'attempts', 'locked_at', 'last_error', 'next_attempt_at', 'sent_at',
+            ])
+    finally:
+        if connection_error is None:
+            connection.close()
+    return sent, failed
@@ -0,0 +1,259 @@
+"""
+Аудит планов SQL-запросов представлений (команда audit_query_plans и тест QueryPlanTests).
+
+Каждое представление из boards и users вызывается через тестовый клиент внутри транзакции,
+которая затем откатывается; все SELECT, UPDATE и DELETE записываются и проверяются через
+EXPLAIN QUERY PLAN SQLite. Проблемы плана:
+
+- full_scan — полный проход по таблице без индекса (SCAN таблица), по таблице FTS5 без MATCH
+  и без rowid (SCAN таблица VIRTUAL TABLE INDEX 0:) или по всему индексу без LIMIT
+  (SCAN таблица USING [COVERING] INDEX);
+- temp_btree — сортировка или группировка во временном B-дереве (USE TEMP B-TREE);
+- non_covering — поиск по индексу, который не покрывает запрос (замечание, не ошибка).
+
+Для каждой проблемы предлагается индекс по столбцам из WHERE и ORDER BY запроса.
+"""
+import re
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+# Таблицы, для которых полный проход и сортировка ожидаемы: справочник досок выводится целиком.
+ALLOWED_SCANS = {'boards_board'}
+# Проблемы, из-за которых аудит считается непройденным.
+ERRORS = {'full_scan', 'temp_btree'}
+
+_EXPLAINED = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(.*)$')
+_INDEX_SCAN = re.compile(r'^ USING (?:COVERING )?INDEX \w+')
+# idxStr модуля FTS5 (таблица boards_search): M — условие MATCH, = — поиск по rowid,
+# пустая строка — проход по всей таблице. Сортировка по релевантности bm25 допустима только после MATCH.
+_VIRTUAL_SCAN = re.compile(r'^ VIRTUAL TABLE INDEX \d+:(\S*)')
+_LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+_SEARCH = re.compile(r'^SEARCH (\w+)(?: AS \w+)? USING (COVERING )?INDEX (\w+)')
+_TEMP_BTREE = re.compile(r'USE TEMP B-TREE FOR (.+)$')
+
+User = get_user_model()
+
+
+def _case(name, method, url, user=None, data=None):
+    return {'name': name, 'method': method, 'url': url, 'user': user, 'data': data or {}}
+
+
+def default_cases():
+    """
+    Запросы ко всем представлениям boards и users на данных текущей базы.
+    Идентификаторы берутся из существующих записей: автор поста с откликами, другой пользователь.
+    """
+    from boards.models import Board, Post, Response
+
+    response = Response.objects.select_related('post').order_by('-pk').first()
+    post = response.post if response else Post.objects.order_by('-pk').first()
+    if post is None:
+        raise ValueError('В базе нет постов: сначала запустите seed_fanboard.')
+    author = User.objects.get(pk=post.author_id)
+    reader = User.objects.exclude(pk=author.pk).filter(is_active=True).first() or author
+    board = Board.objects.get(pk=post.board_id)
+    detail = [board.pk, post.pk]
+    word = (post.title.split() or ['a'])[0]
+
+    cases = [
+        _case('boards:list', 'get', reverse('boards:list')),
+        _case('boards:list?sort=activity', 'get', reverse('boards:list') + '?sort=activity'),
+        _case('boards:search', 'get', reverse('boards:search') + f'?q={word}'),
+        _case('boards:posts_by_board', 'get', reverse('boards:posts_by_board', args=[board.pk])),
+        _case('boards:post_detail', 'get', reverse('boards:post_detail', args=detail)),
+        _case('boards:post_responses', 'get', reverse('boards:post_responses', args=detail)),
+        _case('boards:create_post', 'get', reverse('boards:create_post', args=[board.pk]), reader),
+        _case('boards:create_post', 'post', reverse('boards:create_post', args=[board.pk]), reader,
+              {'title': 'Аудит', 'content': '<p>Аудит планов</p>'}),
+        _case('boards:add_response', 'post', reverse('boards:add_response', args=detail), reader,
+              {'content': '<p>Аудит планов</p>'}),
+        _case('boards:edit_post', 'get', reverse('boards:edit_post', args=detail), author),
+        _case('boards:edit_post', 'post', reverse('boards:edit_post', args=detail), author,
+              {'title': post.title, 'content': '<p>Аудит планов</p>'}),
+        _case('boards:my_posts_responses', 'get', reverse('boards:my_posts_responses'), author),
+        _case('boards:my_posts_responses?post', 'get', reverse('boards:my_posts_responses') + f'?post={post.pk}', author),
+        _case('boards:unsubscribe_newsletter', 'get', reverse('boards:unsubscribe_newsletter'), author),
+        _case('register', 'get', reverse('register')),
+        _case('register', 'post', reverse('register'), data={'email': 'query-plan-audit@example.com'}),
+        _case('login_request_code', 'get', reverse('login_request_code')),
+        _case('login_request_code', 'post', reverse('login_request_code'), data={'email': reader.email}),
+        _case('verify_login_code', 'post', reverse('verify_login_code'), data={'email': reader.email, 'code': '000000'}),
+        _case('logout', 'get', reverse('logout'), author),
+    ]
+    if response is not None:
+        cases += [
+            _case('boards:accept_response', 'post', reverse('boards:accept_response', args=[response.pk]), author),
+            _case('boards:delete_response', 'post', reverse('boards:delete_response', args=[response.pk]), author),
+        ]
+    return cases
+
+
+def capture(cases):
+    """
+    Выполняет запросы cases и возвращает словарь SQL → {'params', 'views'}.
+    Все изменения откатываются.
+    """
+    statements = {}
+
+    def record(name):
+        def wrapper(execute, sql, params, many, context):
+            if not many and _EXPLAINED.match(sql):
+                entry = statements.setdefault(sql, {'params': params, 'views': set(), 'alias': context['connection'].alias})
+                entry['views'].add(name)
+            return execute(sql, params, many, context)
+        return wrapper
+
+    overrides = {
+        'ALLOWED_HOSTS': ['testserver'],
+        'PAGE_CACHE': {'ENABLED': False},
+        'VIEW_COUNTER': {'ENABLED': False},
+    }
+    with override_settings(**overrides), transaction.atomic():
+        for case in cases:
+            client = Client()
+            if case['user'] is not None:
+                client.force_login(case['user'])
+            if case['url'].startswith(reverse('verify_login_code')):
+                session = client.session
+                session['email_for_login_verification'] = case['data']['email']
+                session.save()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record(case['name'])))
+                getattr(client, case['method'])(case['url'], case['data'])
+        # Планы строятся до отката: вставленные в ходе аудита строки нужны параметрам запросов.
+        for sql, entry in statements.items():
+            entry['plan'] = explain(sql, entry['params'], entry['alias'])
+        transaction.set_rollback(True)
+    return statements
+
+
+def explain(sql, params, using='default'):
+    """
+    Строки плана EXPLAIN QUERY PLAN (столбец detail).
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _columns(sql, table, clause):
+    """
+    Столбцы таблицы, упомянутые в части запроса: 'where' или 'order'.
+    """
+    # Берется последнее вхождение: условия FILTER (WHERE ...) и подзапросов стоят раньше внешнего WHERE.
+    if clause == 'where':
+        matches = re.findall(r'\bWHERE\b((?:(?!\bWHERE\b).)*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', sql, re.S)
+    else:
+        matches = re.findall(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|$)', sql, re.S)
+    if not matches:
+        return []
+    columns = []
+    for column, direction in re.findall(rf'"{table}"\."(\w+)"(?:\s+(DESC|ASC))?', matches[-1]):
+        name = f'-{column}' if direction == 'DESC' else column
+        if name not in columns and column not in columns:
+            columns.append(name)
+    return columns
+
+
+def suggest_index(sql, table):
+    """
+    Предлагаемый индекс: столбцы условий WHERE, затем столбцы сортировки.
+    """
+    columns = _columns(sql, table, 'where')
+    columns += [column for column in _columns(sql, table, 'order') if column.lstrip('-') not in columns]
+    if not columns:
+        return None
+    name = f'{table}_{"_".join(column.lstrip("-") for column in columns)}_idx'
+    sql_columns = ', '.join(f'"{column.lstrip("-")}"{" DESC" if column.startswith("-") else ""}' for column in columns)
+    return f'CREATE INDEX "{name[:60]}" ON "{table}" ({sql_columns});'
+
+
+def _order_table(sql):
+    """
+    Таблица, по столбцу которой идет сортировка; для сортировки по выражению — таблица из FROM.
+    """
+    match = re.search(r'\bORDER BY\s+"(\w+)"\.', sql) or re.search(r'\bFROM\s+"?(\w+)"?', sql)
+    return match.group(1) if match else None
+
+
+def analyze(sql, plan):
+    """
+    Проблемы плана одного запроса: список словарей kind, table, detail, suggestion.
+    """
+    findings = []
+    matched = set()
+    for detail in plan:
+        scan = _SCAN.match(detail)
+        if scan and scan.group(1) not in ALLOWED_SCANS:
+            table, rest = scan.groups()
+            virtual = _VIRTUAL_SCAN.match(rest)
+            if virtual and 'M' in virtual.group(1):
+                matched.add(table)
+            elif (
+                not rest.strip()
+                or virtual and '=' not in virtual.group(1)
+                or _INDEX_SCAN.match(rest) and not _LIMIT.search(sql)
+            ):
+                findings.append({'kind': 'full_scan', 'table': table, 'detail': detail})
+        search = _SEARCH.match(detail)
+        if search and not search.group(2):
+            findings.append({'kind': 'non_covering', 'table': search.group(1), 'detail': detail})
+        temp = _TEMP_BTREE.search(detail)
+        if temp:
+            table = _order_table(sql)
+            if table not in ALLOWED_SCANS and table not in matched:
+                findings.append({'kind': 'temp_btree', 'table': table, 'detail': detail})
+    for finding in findings:
+        finding['suggestion'] = suggest_index(sql, finding['table']) if finding['kind'] in ERRORS else None
+    return findings
+
+
+def audit(cases=None):
+    """
+    Выполняет аудит и возвращает список проверенных запросов с найденными проблемами.
+    Каждый элемент: sql, views, plan, findings.
+    """
+    statements = capture(default_cases() if cases is None else cases)
+    return [
+        {'sql': sql, 'views': sorted(entry['views']), 'plan': entry['plan'], 'findings': analyze(sql, entry['plan'])}
+        for sql, entry in statements.items()
+    ]
+
+
+def errors(results):
+    """
+    Запросы с ошибками плана (full_scan, temp_btree).
+    """
+    return [result for result in results if any(finding['kind'] in ERRORS for finding in result['findings'])]
+
+
+def format_report(results, notes=False):
+    """
+    Текстовый отчет: запросы с проблемами, сгруппированные по представлениям, и предлагаемые индексы.
+    """
+    lines = []
+    suggestions = defaultdict(set)
+    for result in results:
+        shown = [finding for finding in result['findings'] if notes or finding['kind'] in ERRORS]
+        if not shown:
+            continue
+        lines.append(f'[{", ".join(result["views"])}]')
+        lines.append(f'  {result["sql"]}')
+        for finding in shown:
+            lines.append(f'  {finding["kind"]}: {finding["detail"]}')
+            if finding['suggestion']:
+                suggestions[finding['suggestion']].update(result['views'])
+        lines.append('')
+    if suggestions:
+        lines.append('Предлагаемые индексы:')
+        for suggestion, views in sorted(suggestions.items()):
+            lines.append(f'  {suggestion}  -- {", ".join(sorted(views))}')
+    return '\n'.join(lines)
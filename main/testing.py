@@ -0,0 +1,221 @@
+import os
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation
+
+# Файлы, которые не считаются местом вызова запроса: обертки над выполнением SQL.
+_SKIPPED_FILES = {os.path.abspath(__file__), os.path.abspath(instrumentation.__file__)}
+
+
+def _relative(path):
+    path = os.path.abspath(path)
+    base = str(settings.BASE_DIR)
+    return os.path.relpath(path, base) if path.startswith(base + os.sep) else path
+
+
+def _is_project_file(path):
+    path = os.path.abspath(path)
+    return (
+        path.startswith(str(settings.BASE_DIR) + os.sep)
+        and 'site-packages' not in path
+        and path not in _SKIPPED_FILES
+    )
+
+
+def call_site():
+    """
+    Место в коде проекта, откуда выполнен запрос: ближайший по стеку узел шаблона
+    (шаблон и строка) или функция проекта (файл, строка и имя функции).
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None and origin.name:
+                return f'{_relative(origin.name)}:{token.lineno}'
+        if _is_project_file(code.co_filename):
+            return f'{_relative(code.co_filename)}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return '<вне кода проекта>'
+
+
+class _CountingCursor:
+    """
+    Обертка над курсором драйвера базы: записывает каждый запрос с местом вызова
+    и считает строки, прочитанные из его результата.
+    """
+    def __init__(self, cursor, recorder, alias):
+        self.cursor = cursor
+        self.recorder = recorder
+        self.alias = alias
+        self.query = None
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        for row in self.cursor:
+            self._count(1)
+            yield row
+
+    def _record(self, sql, many=False):
+        self.query = {'sql': sql, 'alias': self.alias, 'site': call_site(), 'rows': 0, 'many': many}
+        self.recorder.queries.append(self.query)
+
+    def _count(self, rows):
+        if self.query is not None:
+            self.query['rows'] += rows
+
+    def execute(self, sql, params=None):
+        self._record(sql)
+        self.cursor.execute(sql) if params is None else self.cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, param_list):
+        self._record(sql, many=True)
+        self.cursor.executemany(sql, param_list)
+        return self
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+
+class QueryRecorder:
+    """
+    Записывает SQL-запросы ко всем базам внутри блока with: текст, место вызова
+    и число прочитанных строк. В отличие от CaptureQueriesContext считает и строки,
+    поэтому ловит не только N+1, но и выборки без LIMIT.
+    """
+    def __init__(self):
+        self.queries = []
+        self._patched = []
+
+    def __enter__(self):
+        for connection in connections.all():
+            create_cursor = connection.create_cursor
+
+            def counting_create_cursor(name=None, create_cursor=create_cursor, alias=connection.alias):
+                return _CountingCursor(create_cursor(name), self, alias)
+
+            connection.create_cursor = counting_create_cursor
+            self._patched.append(connection)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection in self._patched:
+            del connection.create_cursor
+        self._patched = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def rows(self):
+        return sum(query['rows'] for query in self.queries)
+
+    def report(self):
+        """
+        Запросы, сгруппированные по месту вызова: сначала места с наибольшим числом запросов.
+        """
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[query['site']].append(query)
+        lines = []
+        for site, queries in sorted(groups.items(), key=lambda item: -len(item[1])):
+            rows = sum(query['rows'] for query in queries)
+            lines.append(f'  {site}: запросов {len(queries)}, строк {rows}')
+            for sql, repeats in Counter(query['sql'] for query in queries).items():
+                lines.append(f'      {"%d× " % repeats if repeats > 1 else ""}{sql}')
+        return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """
+    Проверки бюджета SQL-запросов для тестов представлений.
+
+    assertQueryBudget(queries, rows) — не больше queries запросов и rows прочитанных строк
+    внутри блока with. budget_at_sizes() повторяет проверку на нескольких объемах данных
+    (DATA_SIZES, наполнение — метод grow_data) и требует, чтобы число запросов не росло
+    вместе с данными. При нарушении в сообщение выводятся запросы, сгруппированные по месту вызова.
+    """
+    # Объемы данных, на которых проверяется бюджет, от меньшего к большему.
+    DATA_SIZES = ()
+
+    def grow_data(self, size):
+        """
+        Дополняет тестовые данные до объема size.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def assertQueryBudget(self, queries, rows=None):
+        with QueryRecorder() as recorder:
+            yield recorder
+        problems = []
+        if recorder.count > queries:
+            problems.append(f'запросов {recorder.count} при бюджете {queries}')
+        if rows is not None and recorder.rows > rows:
+            problems.append(f'прочитано строк {recorder.rows} при бюджете {rows}')
+        if problems:
+            self.fail(f'Превышен бюджет SQL: {", ".join(problems)}.\n{recorder.report()}')
+
+    def budget_at_sizes(self, queries, rows=None):
+        """
+        Генератор для цикла for: на каждом объеме данных возвращает (size, budget), где budget —
+        блок with для замеряемого запроса. После последнего объема проверяет, что число
+        запросов на большем объеме не больше, чем на меньшем.
+        """
+        recorders = []
+        for size in self.DATA_SIZES:
+            self.grow_data(size)
+            budget = self.assertQueryBudget(queries, rows)
+            yield size, _Remember(budget, recorders)
+        if len(recorders) != len(self.DATA_SIZES):
+            self.fail('Блок budget выполнен не на каждом объеме данных.')
+        first, last = recorders[0], recorders[-1]
+        if last.count > first.count:
+            self.fail(
+                f'Число запросов растет с объемом данных: {first.count} → {last.count} '
+                f'(объемы {self.DATA_SIZES[0]} и {self.DATA_SIZES[-1]}).\n'
+                f'На объеме {self.DATA_SIZES[0]}:\n{first.report()}\n'
+                f'На объеме {self.DATA_SIZES[-1]}:\n{last.report()}'
+            )
+
+
+class _Remember:
+    """
+    Блок with бюджета, запоминающий записанные запросы для сравнения между объемами данных.
+    """
+    def __init__(self, budget, recorders):
+        self.budget = budget
+        self.recorders = recorders
+
+    def __enter__(self):
+        recorder = self.budget.__enter__()
+        self.recorders.append(recorder)
+        return recorder
+
+    def __exit__(self, *exc_info):
+        return self.budget.__exit__(*exc_info)
@@ -1,3 +1,487 @@
-from django.test import TestCase
+import contextvars
+import multiprocessing
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.utils import load_backend
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from boards.models import Board, Post, Response
+from myfanboard_project.db_routers import PrimaryReplicaRouter, PrimaryStickinessMiddleware, is_pinned
+from myfanboard_project.sqlite import BUSY_TIMEOUT, database_config
+from . import metrics
+from .metrics import Counter, Registry
+from .models import OutboxMessage
+from .outbox import claim_batch, deliver, enqueue_mail
+from .query_plans import analyze, audit, errors, format_report, suggest_index
+from .testing import QueryBudgetMixin, QueryRecorder
+
+User = get_user_model()
+
+
+class OutboxTests(TestCase):
+    """
+    Тесты исходящей очереди писем и рабочего процесса run_mail_worker.
+    """
+    def test_response_notification_is_queued_not_sent(self):
+        author = User.objects.create_user('author', 'author@example.com')
+        responder = User.objects.create_user('responder', 'responder@example.com')
+        post = Post.objects.create(title='Пост', content='<p>текст</p>', author=author,
+                                   board=Board.objects.create(name='Доска'))
+
+        Response.objects.create(post=post, author=responder, content='<p>отклик</p>')
+
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.recipients, ['author@example.com'])
+        self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+
+    def test_rolled_back_transaction_discards_message(self):
+        try:
+            with transaction.atomic():
+                enqueue_mail('Тема', 'Текст', ['user@example.com'])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_worker_sends_pending_messages(self):
+        enqueue_mail('Тема 1', 'Текст', ['a@example.com'], html_message='<p>Текст</p>')
+        enqueue_mail('Тема 2', 'Текст', ['b@example.com'])
+
+        call_command('run_mail_worker', once=True, stdout=mock.MagicMock())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual([m.subject for m in mail.outbox], ['Тема 1', 'Тема 2'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_SENT).count(), 2)
+
+    @override_settings(OUTBOX={'MAX_ATTEMPTS': 2, 'BACKOFF_BASE': 60})
+    def test_failures_back_off_then_dead_letter(self):
+        message = enqueue_mail('Тема', 'Текст', ['a@example.com'])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP недоступен')):
+            self.assertEqual(deliver(claim_batch()), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+            self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=50))
+            # До истечения задержки письмо не выбирается повторно.
+            self.assertEqual(claim_batch(), [])
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            deliver(claim_batch())
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_DEAD)
+        self.assertIn('SMTP недоступен', message.last_error)
+
+    def test_stale_lock_is_reclaimed(self):
+        message = enqueue_mail('Тема', 'Текст', ['a@example.com'])
+        OutboxMessage.objects.update(status=OutboxMessage.STATUS_SENDING,
+                                     locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual([m.pk for m in claim_batch()], [message.pk])
+
+
+@override_settings(DATABASE_ROUTING={'REPLICAS': ['replica_1', 'replica_2'], 'STICKY_SECONDS': 5})
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Тесты маршрутизации чтения на реплики и закрепления за основной базой после записи.
+    """
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_isolated(self, func, *args):
+        # Каждый вызов работает в новом контексте, как отдельный запрос или поток.
+        return contextvars.Context().run(func, *args)
+
+    def test_reads_go_to_replicas_round_robin(self):
+        reads = self.run_isolated(lambda: [self.router.db_for_read(Post) for _ in range(4)])
+        self.assertEqual(reads, ['replica_1', 'replica_2', 'replica_1', 'replica_2'])
+
+    @override_settings(DATABASE_ROUTING={'REPLICAS': ['replica_1', 'replica_2'], 'SELECTION': 'least_recent'})
+    def test_least_recent_selection(self):
+        reads = self.run_isolated(lambda: [self.router.db_for_read(Post) for _ in range(3)])
+        self.assertEqual(reads, ['replica_1', 'replica_2', 'replica_1'])
+
+    @override_settings(DATABASE_ROUTING={'REPLICAS': []})
+    def test_without_replicas_everything_uses_primary(self):
+        self.assertEqual(self.run_isolated(self.router.db_for_read, Post), 'default')
+
+    def test_sessions_always_read_from_primary(self):
+        self.assertEqual(self.run_isolated(self.router.db_for_read, Session), 'default')
+
+    def test_reads_after_write_stick_to_primary(self):
+        def scenario():
+            before = self.router.db_for_read(Post)
+            write = self.router.db_for_write(Post)
+            return before, write, self.router.db_for_read(Post), self.router.db_for_read(Response)
+
+        self.assertEqual(self.run_isolated(scenario), ('replica_1', 'default', 'default', 'default'))
+        # Закрепление не выходит за пределы своего контекста.
+        self.assertFalse(self.run_isolated(is_pinned))
+
+    def test_middleware_sets_cookie_after_write(self):
+        reads = []
+
+        def view(request):
+            if request.method == 'POST':
+                self.router.db_for_write(Post)
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        middleware = PrimaryStickinessMiddleware(view)
+        response = self.run_isolated(middleware, self.factory.get('/boards/'))
+        self.assertNotIn('use_primary', response.cookies)
+
+        response = self.run_isolated(middleware, self.factory.post('/boards/1/new/'))
+        self.assertEqual(response.cookies['use_primary']['max-age'], 5)
+
+        # Следующий запрос с cookie (например, после редиректа) читает из основной базы.
+        request = self.factory.get('/boards/1/')
+        request.COOKIES['use_primary'] = '1'
+        self.run_isolated(middleware, request)
+        self.assertEqual(reads, ['replica_1', 'default', 'default'])
+
+    def test_admin_always_uses_primary(self):
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        self.run_isolated(PrimaryStickinessMiddleware(view), self.factory.get('/admin/boards/post/'))
+        self.assertEqual(reads, ['default'])
+
+    async def test_async_middleware_sees_write_made_in_sync_to_async_thread(self):
+        reads = []
+
+        async def view(request):
+            # Так асинхронный ORM выполняет запись: в отдельном потоке через sync_to_async.
+            await sync_to_async(self.router.db_for_write)(Post)
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        middleware = PrimaryStickinessMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(self.factory.post('/boards/1/new/'))
+        self.assertEqual(response.cookies['use_primary']['max-age'], 5)
+        self.assertEqual(reads, ['default'])
+
+
+class SqliteProductionModeTests(SimpleTestCase):
+    """
+    Производственный режим SQLite (myfanboard_project/sqlite.py) на отдельной временной базе.
+    """
+    def connect(self, production):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        config = connections.configure_settings({
+            'default': database_config(os.path.join(directory, 'db.sqlite3'), production=production),
+        })['default']
+        connection = load_backend(config['ENGINE']).DatabaseWrapper(config, 'sqlite_production_test')
+        self.addCleanup(connection.close)
+        # Соединение открывается до регистрации в django.db.connections (нужной transaction.atomic):
+        # SimpleTestCase запрещает открывать соединения с псевдонимами не из databases.
+        connection.ensure_connection()
+        connections[connection.alias] = connection
+        self.addCleanup(connections.__delitem__, connection.alias)
+        return connection
+
+    def pragmas(self, connection):
+        with connection.cursor() as cursor:
+            values = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+            return values
+
+    def test_production_mode_sets_pragmas_and_immediate_transactions(self):
+        connection = self.connect(production=True)
+
+        self.assertEqual(self.pragmas(connection), {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': BUSY_TIMEOUT,
+            'cache_size': -64 * 1024, 'temp_store': 2,
+        })
+        with CaptureQueriesContext(connection) as queries, transaction.atomic(using=connection.alias):
+            pass
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 600)
+
+    def test_default_mode_keeps_sqlite_defaults(self):
+        connection = self.connect(production=False)
+
+        self.assertEqual(self.pragmas(connection)['journal_mode'], 'delete')
+        with CaptureQueriesContext(connection) as queries, transaction.atomic(using=connection.alias):
+            pass
+        self.assertEqual(queries[0]['sql'], 'BEGIN')
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Тесты проверки бюджета SQL-запросов (main/testing.py) и бюджет главной страницы.
+    """
+    DATA_SIZES = (2, 20)
+
+    def grow_data(self, size):
+        for number in range(Board.objects.count(), size):
+            Board.objects.create(name=f'Доска {number}')
+
+    def test_home(self):
+        for size, budget in self.budget_at_sizes(queries=0, rows=0):
+            with budget:
+                response = self.client.get(reverse('home'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_rows_are_counted_per_call_site(self):
+        Board.objects.create(name='Доска')
+        with QueryRecorder() as recorder:
+            list(Board.objects.all())
+            Board.objects.filter(name='нет такой').first()
+        self.assertEqual(recorder.count, 2)
+        self.assertEqual(recorder.rows, 1)
+        self.assertEqual(len({query['site'] for query in recorder.queries}), 2)
+        self.assertIn('main/tests.py', recorder.queries[0]['site'])
+
+    def test_growing_query_count_fails_with_sql_grouped_by_call_site(self):
+        with self.assertRaises(AssertionError) as raised:
+            for size, budget in self.budget_at_sizes(queries=100):
+                with budget:
+                    # N+1: по запросу на каждую доску.
+                    for board in Board.objects.all():
+                        board.posts.count()
+        message = str(raised.exception)
+        self.assertIn('Число запросов растет с объемом данных: 3 → 21', message)
+        self.assertIn('запросов 20, строк 20', message)
+        self.assertIn('20× SELECT COUNT(*)', message)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], PAGE_CACHE={'ENABLED': False})
+class RequestInstrumentationTests(TestCase):
+    """
+    Тесты замеров запросов (main/instrumentation.py).
+    """
+    def setUp(self):
+        Board.objects.create(name='Доска')
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('boards:list'))
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'template', 'mail', 'total'})
+        self.assertIn('desc="2 queries"', timing['db'])
+        self.assertGreater(float(timing['template'].split('=')[1]), 0)
+
+    @override_settings(INSTRUMENTATION={'SAMPLE_RATE': 0})
+    def test_unsampled_request_is_not_measured(self):
+        response = self.client.get(reverse('boards:list'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(INSTRUMENTATION={'SLOW_REQUEST_MS': 0, 'SLOW_QUERIES': 1})
+    def test_slow_request_logs_top_queries(self):
+        with self.assertLogs('myfanboard.requests', 'WARNING') as logs:
+            self.client.get(reverse('boards:list'))
+        record = logs.records[0].metrics
+        self.assertEqual(record['view'], 'boards:list')
+        self.assertEqual(record['db_queries'], 2)
+        self.assertEqual(len(record['top_queries']), 1)
+        self.assertIn('boards_board', record['top_queries'][0]['sql'])
+
+    def test_queued_mail_is_measured(self):
+        author = User.objects.create_user('author', 'author@example.com')
+        responder = User.objects.create_user('responder', 'responder@example.com')
+        post = Post.objects.create(title='Пост', content='<p>текст</p>', author=author, board=Board.objects.get())
+        self.client.force_login(responder)
+        with self.assertLogs('myfanboard.requests', 'INFO') as logs:
+            self.client.post(reverse('boards:add_response', args=[post.board_id, post.pk]), {'content': '<p>Отклик</p>'})
+        self.assertGreater(logs.records[0].metrics['mail_ms'], 0)
+
+
+def metric_value(text, sample):
+    """
+    Значение ряда sample (имя с метками, как в выводе) из текста /metrics или 0.
+    """
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], PAGE_CACHE={'ENABLED': False})
+class MetricsTests(TestCase):
+    """
+    Тесты метрик Prometheus (main/metrics.py) и страницы /metrics.
+    """
+    def setUp(self):
+        directory = self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(METRICS={'DIRECTORY': directory, 'ALLOWED_IPS': ['127.0.0.1']})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def scrape(self, **kwargs):
+        response = self.client.get(reverse('metrics'), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_values_of_other_processes_are_summed(self):
+        before = metric_value(self.scrape(), 'mail_enqueued_total')
+        other_process = Registry()
+        Counter('mail_enqueued_total', 'Письма в очереди.', registry=other_process).inc(5)
+        other_process.flush()
+        metrics.MAIL_ENQUEUED.inc()
+        self.assertEqual(metric_value(self.scrape(), 'mail_enqueued_total'), before + 6)
+
+    @skipUnless(hasattr(os, 'fork'), 'Нужен fork().')
+    def test_forked_worker_reports_its_own_values(self):
+        before = metric_value(self.scrape(), 'mail_enqueued_total')
+
+        def worker():
+            metrics.MAIL_ENQUEUED.inc(3)
+            metrics.REGISTRY.flush()
+
+        process = multiprocessing.get_context('fork').Process(target=worker)
+        process.start()
+        process.join()
+        # Значения родителя не копируются в файл дочернего процесса.
+        self.assertEqual(metric_value(self.scrape(), 'mail_enqueued_total'), before + 3)
+
+    @skipUnless(hasattr(os, 'fork') and metrics.fcntl, 'Нужны fork() и fcntl.')
+    def test_finished_process_files_are_merged_into_base(self):
+        def worker(amount):
+            metrics.MAIL_ENQUEUED.inc(amount)
+            metrics.REGISTRY.flush()
+
+        before = metric_value(self.scrape(), 'mail_enqueued_total')
+        for amount in (2, 3):
+            process = multiprocessing.get_context('fork').Process(target=worker, args=(amount,))
+            process.start()
+            process.join()
+        self.assertEqual(metric_value(self.scrape(), 'mail_enqueued_total'), before + 5)
+        # Файлы завершившихся процессов удалены, их значения остались в базовом файле.
+        self.assertNotIn(f'{process.pid}-', ' '.join(os.listdir(self.directory)))
+        self.assertIn(metrics.BASE_FILENAME, os.listdir(self.directory))
+        self.assertEqual(metric_value(self.scrape(), 'mail_enqueued_total'), before + 5)
+
+    def test_request_latency_histogram_per_url_name(self):
+        sample = 'http_request_duration_seconds_count{view="boards:list"}'
+        before = metric_value(self.scrape(), sample)
+        self.client.get(reverse('boards:list'))
+        self.client.get(reverse('boards:list'))
+        text = self.scrape()
+        self.assertEqual(metric_value(text, sample), before + 2)
+        self.assertEqual(metric_value(text, 'http_request_duration_seconds_bucket{view="boards:list",le="+Inf"}'),
+                         before + 2)
+        self.assertIn('db_queries_per_request_bucket{view="boards:list",le="1"}', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('mail_outbox_messages{status="pending"}', text)
+
+    def test_otp_issuance_and_verification_rates(self):
+        user = User.objects.create_user('player', 'player@example.com')
+        issued = 'otp_codes_issued_total{type="login"}'
+        success = 'otp_verifications_total{type="login",result="success"}'
+        failure = 'otp_verifications_total{type="login",result="failure"}'
+        before = self.scrape()
+
+        self.client.post(reverse('login_request_code'), {'email': user.email})
+        self.client.post(reverse('verify_login_code'), {'email': user.email, 'code': '000000x'})
+        code = user.one_time_codes.get(is_used=False)
+        self.client.post(reverse('verify_login_code'), {'email': user.email, 'code': code.code})
+
+        after = self.scrape()
+        self.assertEqual(metric_value(after, issued), metric_value(before, issued) + 1)
+        self.assertEqual(metric_value(after, failure), metric_value(before, failure) + 1)
+        self.assertEqual(metric_value(after, success), metric_value(before, success) + 1)
+
+    def test_endpoint_is_restricted_to_staff_and_internal_addresses(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+        staff = User.objects.create_user('admin', 'admin@example.com', is_staff=True)
+        self.client.force_login(staff)
+        self.scrape(REMOTE_ADDR='203.0.113.5')
+
+    def test_local_address_is_not_allowed_by_default(self):
+        # За локальным прокси у всех запросов REMOTE_ADDR 127.0.0.1.
+        with override_settings(METRICS={'DIRECTORY': self.directory}):
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+    def test_forwarded_address_is_used_only_behind_trusted_proxy(self):
+        config = {'DIRECTORY': self.directory, 'ALLOWED_IPS': ['10.0.0.0/8'], 'TRUSTED_PROXIES': ['127.0.0.1']}
+        cases = [
+            ('127.0.0.1', '10.1.2.3', 200),
+            # Левые адреса клиент может подставить сам; учитывается последний адрес до доверенного прокси.
+            ('127.0.0.1', '10.1.2.3, 203.0.113.5', 403),
+            ('127.0.0.1', '203.0.113.5, 10.1.2.3', 200),
+            ('127.0.0.1', '', 403),
+            ('203.0.113.5', '10.1.2.3', 403),
+        ]
+        with override_settings(METRICS=config):
+            for remote_addr, forwarded, status in cases:
+                with self.subTest(remote_addr=remote_addr, forwarded=forwarded):
+                    response = self.client.get(reverse('metrics'), REMOTE_ADDR=remote_addr,
+                                               HTTP_X_FORWARDED_FOR=forwarded)
+                    self.assertEqual(response.status_code, status)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Аудит планов SQL-запросов представлений (main/query_plans.py): новый запрос
+    без подходящего индекса ломает этот тест.
+    """
+    def setUp(self):
+        author = User.objects.create_user('author', 'author@example.com')
+        reader = User.objects.create_user('reader', 'reader@example.com')
+        board = Board.objects.create(name='Доска')
+        post = Post.objects.create(title='Сериал', content='<p>Пост о сериале</p>', author=author, board=board)
+        Response.objects.create(post=post, author=reader, content='<p>Отклик</p>')
+
+    def test_views_have_no_full_scans_or_temp_sorts(self):
+        results = audit()
+
+        self.assertGreater(len(results), 20)
+        self.assertFalse(errors(results), f'\n{format_report(results)}')
+
+    def test_audit_rolls_back_changes(self):
+        posts, responses = Post.objects.count(), Response.objects.count()
+
+        audit()
+
+        self.assertEqual((Post.objects.count(), Response.objects.count()), (posts, responses))
+
+    def test_analyze_flags_scan_and_suggests_index(self):
+        sql = 'SELECT "boards_post"."id" FROM "boards_post" WHERE "boards_post"."views" > %s ORDER BY "boards_post"."views" DESC'
+        findings = analyze(sql, ['SCAN boards_post', 'USE TEMP B-TREE FOR ORDER BY'])
+
+        self.assertEqual([finding['kind'] for finding in findings], ['full_scan', 'temp_btree'])
+        self.assertEqual(suggest_index(sql, 'boards_post'),
+                         'CREATE INDEX "boards_post_views_idx" ON "boards_post" ("views");')
+
+    def test_analyze_flags_index_and_fulltext_scans(self):
+        by_index = 'SELECT "boards_post"."id" FROM "boards_post" ORDER BY "boards_post"."created_at" DESC'
+        fulltext = 'SELECT object_id FROM boards_search WHERE kind = %s ORDER BY bm25(boards_search)'
+        cases = [
+            (by_index, ['SCAN boards_post USING INDEX boards_post_created_idx'], ['full_scan']),
+            (by_index, ['SCAN boards_post USING COVERING INDEX boards_post_created_idx'], ['full_scan']),
+            (by_index + ' LIMIT 21', ['SCAN boards_post USING INDEX boards_post_created_idx'], []),
+            (fulltext, ['SCAN boards_search VIRTUAL TABLE INDEX 0:', 'USE TEMP B-TREE FOR ORDER BY'],
+             ['full_scan', 'temp_btree']),
+            (fulltext.replace('kind', 'boards_search MATCH %s AND kind'),
+             ['SCAN boards_search VIRTUAL TABLE INDEX 0:M6', 'USE TEMP B-TREE FOR ORDER BY'], []),
+            ('DELETE FROM boards_search WHERE rowid = %s', ['SCAN boards_search VIRTUAL TABLE INDEX 0:='], []),
+        ]
+        for sql, plan, kinds in cases:
+            with self.subTest(plan=plan, sql=sql):
+                self.assertEqual([finding['kind'] for finding in analyze(sql, plan)], kinds)
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     # Главная страница.
     path('', views.home, name='home'),
+    # Метрики в формате Prometheus (только для сотрудников и внутренних адресов).
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,5 +1,18 @@
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from . import metrics as site_metrics
+
 def home(request):
     # Очень простое представление, которое просто рендерит шаблон
-    return render(request, 'main/home.html', {})
\ No newline at end of file
+    return render(request, 'main/home.html', {})
+
+def metrics(request):
+    """
+    Метрики всех рабочих процессов в текстовом формате Prometheus.
+    Доступны сотрудникам сайта и адресам из METRICS['ALLOWED_IPS'].
+    """
+    if not site_metrics.is_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(site_metrics.REGISTRY.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
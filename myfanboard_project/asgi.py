@@ -3,14 +3,30 @@
 
 Этот файл предоставляет вызываемый объект ASGI в качестве переменной уровня модуля под названием ``application``.
 
+Страницы для чтения (список досок, доска, пост) под ASGI обслуживают асинхронные представления
+(ASGI_URLCONF, см. main/asynchronous.ASGIHandler), а middleware проекта поддерживают асинхронную
+цепочку, поэтому ожидание базы на этих страницах не блокирует цикл событий и рабочий процесс
+продолжает принимать запросы. Запуск, например:
+
+    uvicorn myfanboard_project.asgi:application --workers 4
+
+Остальные представления синхронные; Django выполняет их в потоках. WSGI-сервер (wsgi.py) использует
+синхронные варианты тех же страниц. Сравнение интерфейсов при том же числе рабочих потоков —
+команда bench_interfaces.
+
 Дополнительную информацию об этом файле см.:
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myfanboard_project.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+# То же, что django.core.asgi.get_asgi_application(), но с обработчиком проекта.
+django.setup(set_prefix=False)
+
+from main.asynchronous import ASGIHandler  # noqa: E402
+
+application = ASGIHandler()
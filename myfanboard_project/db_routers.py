@@ -0,0 +1,170 @@
+"""
+Маршрутизация запросов между основной базой и репликами только для чтения.
+
+Чтение уходит на реплики из DATABASE_ROUTING['REPLICAS'], запись — в основную базу ('default').
+Чтобы пользователь сразу видел свои изменения (read-your-writes), после первой записи все
+запросы до конца обработки HTTP-запроса идут в основную базу, а PrimaryStickinessMiddleware
+ставит cookie, закрепляющую за основной базой и следующие запросы в течение STICKY_SECONDS
+(время, за которое реплики успевают догнать основную базу). Админ-панель всегда работает
+с основной базой.
+"""
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+
+# Настройки по умолчанию; переопределяются словарем DATABASE_ROUTING в settings.py.
+DEFAULTS = {
+    'REPLICAS': [],                      # Алиасы реплик из DATABASES.
+    'SELECTION': 'round_robin',          # 'round_robin' или 'least_recent' (дольше всех не использовавшаяся).
+    'PRIMARY_APP_LABELS': ['sessions', 'main'],  # Приложения, которые всегда читают из основной базы.
+    'STICKY_SECONDS': 5,                 # Сколько секунд после записи читать из основной базы.
+    'COOKIE_NAME': 'use_primary',
+}
+
+# Закреплен ли текущий контекст (запрос или поток) за основной базой.
+_use_primary = ContextVar('use_primary', default=False)
+# Была ли в текущем контексте запись.
+_wrote = ContextVar('wrote', default=False)
+
+
+def get_config():
+    """
+    Возвращает настройки маршрутизации с учетом значений по умолчанию.
+    """
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_ROUTING', {})}
+
+
+def pin_primary():
+    """
+    Закрепляет текущий контекст за основной базой.
+    """
+    _use_primary.set(True)
+
+
+def is_pinned():
+    """
+    Проверяет, закреплен ли текущий контекст за основной базой.
+    """
+    return _use_primary.get()
+
+
+class _ReplicaSelector:
+    """
+    Выбирает реплику для очередного чтения.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._replicas = None
+        self._cycle = None
+        self._last_used = {}
+
+    def choose(self, replicas, selection):
+        with self._lock:
+            if self._replicas != replicas:
+                self._replicas = list(replicas)
+                self._cycle = itertools.cycle(self._replicas)
+                self._last_used = {alias: 0.0 for alias in self._replicas}
+            if selection == 'least_recent':
+                alias = min(self._replicas, key=self._last_used.__getitem__)
+                self._last_used[alias] = time.monotonic()
+                return alias
+            return next(self._cycle)
+
+
+class PrimaryReplicaRouter:
+    """
+    Роутер базы данных: чтение с реплик, запись и чтение после записи — в основной базе.
+    """
+    def __init__(self):
+        self._selector = _ReplicaSelector()
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаются из той же базы, что и исходный объект.
+            return instance._state.db
+        config = get_config()
+        if not config['REPLICAS'] or is_pinned() or model._meta.app_label in config['PRIMARY_APP_LABELS']:
+            return DEFAULT_DB_ALIAS
+        return self._selector.choose(config['REPLICAS'], config['SELECTION'])
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_config()['REPLICAS']}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик копируется с основной базы, миграции применяются только к ней.
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Закрепляет за основной базой запросы админ-панели, запросы с cookie «недавно писал»
+    и остаток запроса после первой записи. Если во время запроса была запись,
+    ставит cookie на STICKY_SECONDS, чтобы следующий запрос (например, после редиректа)
+    тоже прочитал свежие данные из основной базы.
+
+    Должен стоять перед SessionMiddleware: тогда сохранение сессии тоже учитывается как запись.
+    Работает и в синхронной (WSGI), и в асинхронной (ASGI) цепочке middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._pin(request)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            self._unpin(tokens)
+        return self._finish(response, wrote)
+
+    async def __acall__(self, request):
+        # Асинхронные представления выполняют запросы ORM в потоках через sync_to_async;
+        # contextvars копируются туда и обратно, поэтому закрепление и признак записи видны здесь.
+        tokens = self._pin(request)
+        try:
+            response = await self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            self._unpin(tokens)
+        return self._finish(response, wrote)
+
+    def _pin(self, request):
+        config = get_config()
+        pinned = (
+            config['COOKIE_NAME'] in request.COOKIES
+            or request.path.startswith(reverse('admin:index'))
+        )
+        return _use_primary.set(pinned), _wrote.set(False)
+
+    def _unpin(self, tokens):
+        primary_token, wrote_token = tokens
+        _use_primary.reset(primary_token)
+        _wrote.reset(wrote_token)
+
+    def _finish(self, response, wrote):
+        config = get_config()
+        if wrote and config['REPLICAS']:
+            response.set_cookie(
+                config['COOKIE_NAME'], '1', max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax'
+            )
+        return response
@@ -8,8 +8,11 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
+from .sqlite import database_config
+
 
 # Построение путей внутри проекта: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,7 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы замерять и запросы к базе из остальных middleware (см. main/instrumentation.py).
+    'main.instrumentation.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Стоит перед SessionMiddleware, чтобы сохранение сессии тоже закрепляло запрос за основной базой.
+    'myfanboard_project.db_routers.PrimaryStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,7 +59,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Загружает request.user вместе с профилем одним запросом (см. users/backends.py).
+AUTHENTICATION_BACKENDS = [
+    'users.backends.ProfileModelBackend',
+]
+
 ROOT_URLCONF = 'myfanboard_project.urls'
+# URLconf для запросов через ASGI: страницы для чтения — асинхронные представления
+# (см. main/asynchronous.ASGIHandler и myfanboard_project/asgi.py).
+ASGI_URLCONF = 'myfanboard_project.urls_asgi'
 
 TEMPLATES = [
     {
@@ -75,11 +90,56 @@ WSGI_APPLICATION = 'myfanboard_project.wsgi.application'
 # База данных
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Производственный режим SQLite (WAL, прагмы, BEGIN IMMEDIATE, постоянные соединения)
+# включается переменной окружения SQLITE_PRODUCTION_MODE=1. Подробности в myfanboard_project/sqlite.py.
+SQLITE_PRODUCTION_MODE = os.environ.get('SQLITE_PRODUCTION_MODE') == '1'
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': database_config(BASE_DIR / 'db.sqlite3', production=SQLITE_PRODUCTION_MODE),
+}
+
+# Реплики только для чтения: пути к файлам SQLite через запятую в SQLITE_REPLICAS
+# (например, копии основной базы, обновляемые через Litestream или sqlite3 .backup).
+# В тестах реплики зеркалируют основную тестовую базу.
+DATABASE_REPLICA_FILES = [path for path in os.environ.get('SQLITE_REPLICAS', '').split(',') if path]
+
+for number, path in enumerate(DATABASE_REPLICA_FILES, start=1):
+    DATABASES[f'replica_{number}'] = {
+        **database_config(path, production=SQLITE_PRODUCTION_MODE),
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['myfanboard_project.db_routers.PrimaryReplicaRouter']
+
+# Маршрутизация чтения между основной базой и репликами (см. myfanboard_project/db_routers.py).
+DATABASE_ROUTING = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'SELECTION': 'round_robin',
+    'STICKY_SECONDS': 5,
+}
+
+
+# Кеш
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Для разработки — кеш в памяти процесса. При нескольких рабочих процессах используйте общий кеш,
+# например 'django.core.cache.backends.filebased.FileBasedCache' с LOCATION на общем диске
+# или 'django.core.cache.backends.redis.RedisCache'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+    },
+}
+
+# Кеш страниц для анонимных пользователей (см. boards/page_cache.py).
+PAGE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'pages',
+    'TIMEOUT': 60,
 }
 
 
@@ -133,6 +193,72 @@ DEFAULT_FROM_EMAIL = 'no-reply@myfanboard.com' # Email, от которого б
 SERVER_EMAIL = DEFAULT_FROM_EMAIL # Email для серверных сообщений (ошибки и т.д.)
 SITE_URL = 'http://127.0.0.1:8000'
 
+# Исходящая очередь писем (см. main/outbox.py). Письма отправляет процесс
+# `python manage.py run_mail_worker`, запросы пользователей не ждут SMTP.
+OUTBOX = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 30,
+    'BACKOFF_MAX': 3600,
+}
+
+# Отправка новостных рассылок (см. boards/newsletter.py): получатели читаются порциями
+# по CHUNK_SIZE, письма уходят пачками по BATCH_SIZE через WORKERS параллельных соединений.
+NEWSLETTER = {
+    'CHUNK_SIZE': 1000,
+    'BATCH_SIZE': 100,
+    'WORKERS': 4,
+}
+
+# Замеры запросов (см. main/instrumentation.py): заголовок Server-Timing и строка JSON
+# в журнале 'myfanboard.requests'. По умолчанию в журнал попадают только запросы дольше
+# SLOW_REQUEST_MS вместе с самыми долгими SQL-запросами; REQUEST_LOG_LEVEL=INFO — все запросы.
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_MS': 500,
+}
+
+# Метрики Prometheus на /metrics (см. main/metrics.py). Рабочие процессы пишут снимки
+# в общий каталог DIRECTORY; страница доступна сотрудникам и адресам из ALLOWED_IPS.
+# За обратным прокси адрес клиента берется из X-Forwarded-For, только если прокси указан в TRUSTED_PROXIES.
+METRICS = {
+    'ENABLED': True,
+    'DIRECTORY': os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'myfanboard-metrics')),
+    'FLUSH_INTERVAL': 5,
+    'ALLOWED_IPS': [],
+    'TRUSTED_PROXIES': [],
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'myfanboard.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        # Ошибки фоновых потоков (сброс счетчиков, обработка изображений, рассылки, метрики).
+        'boards': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'main': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+        'users': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Буферизация счетчика просмотров постов (см. boards/view_counter.py).
+# Просмотры накапливаются в памяти процесса и записываются пачкой раз в FLUSH_INTERVAL секунд
+# или при накоплении FLUSH_THRESHOLD просмотров.
+VIEW_COUNTER = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 5,
+    'FLUSH_THRESHOLD': 500,
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -176,19 +302,57 @@ CKEDITOR_5_CONFIGS = {
 }
 
 CKEDITOR_5_UPLOAD_PATH = "uploads/" # Папка для загрузки файлов внутри MEDIA_ROOT.
-CKEDITOR_5_FILE_STORAGE = 'django_ckeditor_5.storage.DefaultStorage' # Использование хранилища по умолчанию.
+# Хранилище с адресацией по содержимому: одинаковые загрузки хранятся одним файлом
+# uploads/ab/cd/<sha256>.<ext> со счетчиком ссылок (см. boards/storage.py).
+CKEDITOR_5_FILE_STORAGE = 'boards.storage.ContentAddressedStorage'
+
+# Фоновое создание вариантов загруженных изображений (см. boards/images.py):
+# WebP шириной WIDTHS для srcset и перекодированный оригинал шириной FALLBACK_WIDTH.
+IMAGE_PIPELINE = {
+    'WORKERS': 2,
+    'WIDTHS': {'thumbnail': 320, 'medium': 960, 'large': 1600},
+    'FALLBACK_WIDTH': 960,
+    'MAX_PIXELS': 50_000_000,
+    'WEBP_QUALITY': 80,
+    'JPEG_QUALITY': 82,
+}
+
+# Прием загрузок изображений (см. boards/uploads.py): тело запроса читается порциями CHUNK_SIZE
+# прямо во временный каталог хранилища, лимиты проверяются по ходу чтения.
+UPLOADS = {
+    'CHUNK_SIZE': 1024 * 1024,
+    'MAX_FILE_SIZE': 256 * 1024 * 1024,
+    'USER_UPLOADS_PER_MINUTE': 20,
+    'USER_BYTES_PER_HOUR': 1024 * 1024 * 1024,
+    'RESUMABLE_CHUNK_SIZE': 8 * 1024 * 1024,
+    'SESSION_TTL': 24 * 60 * 60,
+    'UNREFERENCED_TTL': 24 * 60 * 60,
+    'CACHE_ALIAS': 'default',
+}
 
 # Дополнительные настройки для CKEditor 5, которые могут помочь с разрешениями:
 # CKEDITOR_5_UPLOAD_VIEW_CHECK_PERMISSIONS = True # По умолчанию True. Если True, то разрешения DRF будут работать.
 # Если False, то Django не будет проверять разрешения.
 
 REST_FRAMEWORK = {
+    # API использует ту же сессию, что и сайт: вход выполняется через одноразовый код.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        # 'rest_framework.authentication.SessionAuthentication',
-        # 'rest_framework.authentication.BasicAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
-        'rest_framework.permissions.AllowAny',
+        'rest_framework.permissions.IsAuthenticatedOrReadOnly',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'rest_framework.throttling.AnonRateThrottle',
+        'rest_framework.throttling.UserRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '60/min',
+        'user': '600/min',
+    },
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
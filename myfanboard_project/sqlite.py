@@ -0,0 +1,99 @@
+"""
+Производственный режим SQLite.
+
+Включается переменной окружения SQLITE_PRODUCTION_MODE=1 (см. settings.py):
+- журнал WAL: читатели не блокируют писателя и наоборот;
+- synchronous=NORMAL: в режиме WAL безопасно и без fsync на каждую транзакцию;
+- busy_timeout: ожидание освобождения блокировки вместо немедленной ошибки;
+- mmap и увеличенный кеш страниц;
+- транзакции начинаются с BEGIN IMMEDIATE, поэтому блокировка записи берется сразу
+  и не возникает взаимоблокировка при повышении блокировки чтения до записи;
+- постоянные соединения (CONN_MAX_AGE).
+
+Запись в запросах пользователей защищена только busy_timeout: BEGIN IMMEDIATE ждет блокировку
+записи до BUSY_TIMEOUT миллисекунд и лишь затем завершается ошибкой «database is locked».
+Повтор через retry_on_lock применяется к фоновым записям вне транзакции (сброс буфера просмотров
+boards/view_counter.py, команда stress_sqlite). Запись в представлениях не повторяется:
+это несколько связанных запросов (сохранение модели и обработчики сигналов) или transaction.atomic,
+и повтор одного запроса после уже выполненных остальных небезопасен.
+"""
+import functools
+import time
+
+from django.db import OperationalError, connections
+
+# Миллисекунды ожидания блокировки внутри SQLite.
+BUSY_TIMEOUT = 5000
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': BUSY_TIMEOUT,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # Отрицательное значение — размер в КиБ (64 МиБ).
+    'temp_store': 'MEMORY',
+}
+
+# Секунды жизни постоянного соединения.
+CONN_MAX_AGE = 600
+
+
+def production_options():
+    """
+    Возвращает OPTIONS для DATABASES: прагмы выполняются при открытии каждого соединения.
+    """
+    return {
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in PRAGMAS.items()),
+        'transaction_mode': 'IMMEDIATE',
+        # Таймаут драйвера sqlite3 в секундах; совпадает с busy_timeout.
+        'timeout': BUSY_TIMEOUT / 1000,
+    }
+
+
+def database_config(name, production=False):
+    """
+    Возвращает настройки соединения SQLite для файла name в обычном или производственном режиме.
+    """
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    if production:
+        config.update({
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': production_options(),
+        })
+    return config
+
+
+def is_lock_error(error):
+    """
+    Проверяет, что ошибка базы вызвана конкурентной блокировкой SQLite.
+    """
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_lock(func=None, *, attempts=5, delay=0.05, using='default'):
+    """
+    Декоратор, повторяющий запись при ошибке «database is locked» с экспоненциальной задержкой.
+
+    Повтор выполняется только вне transaction.atomic: внутри транзакции часть изменений
+    уже сделана, и повторять нужно всю транзакцию целиком, поэтому ошибка пробрасывается.
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, attempts=attempts, delay=delay, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                last_attempt = attempt == attempts - 1
+                if last_attempt or not is_lock_error(e) or connections[using].in_atomic_block:
+                    raise
+                time.sleep(delay * 2 ** attempt)
+
+    return wrapper
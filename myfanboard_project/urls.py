@@ -21,11 +21,21 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.decorators.csrf import csrf_exempt
 
+from boards.views import resumable_upload, start_resumable_upload, upload_image
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('users.urls')),
     path('', include('main.urls')),
     path("boards/", include('boards.urls')),
+    # Версионированный JSON API только для чтения (см. boards/api.py).
+    path('api/v1/', include('boards.api_urls')),
+    # Загрузка изображений CKEditor с фоновым созданием вариантов (см. boards/images.py);
+    # стоит раньше django_ckeditor_5.urls и заменяет его представление с тем же именем.
+    path("ckeditor5/image_upload/", upload_image, name="ck_editor_5_upload_file"),
+    # Возобновляемая загрузка больших изображений по частям (см. boards/uploads.py).
+    path("ckeditor5/uploads/", start_resumable_upload, name="resumable_upload_start"),
+    path("ckeditor5/uploads/<uuid:pk>/", resumable_upload, name="resumable_upload"),
     path("ckeditor5/", include('django_ckeditor_5.urls')),
 ]
 
@@ -0,0 +1,16 @@
+"""
+Конфигурация URL под ASGI (settings.ASGI_URLCONF, см. main/asynchronous.ASGIHandler).
+
+Совпадает с urls.py, но маршруты досок берутся из boards/asgi_urls.py с асинхронными страницами
+для чтения. Под WSGI асинхронное представление выполнялось бы через async_to_sync в отдельном
+цикле событий на каждый запрос, поэтому WSGI-сервер использует urls.py с синхронными представлениями.
+"""
+from django.urls import include, path
+
+from . import urls
+
+urlpatterns = [
+    # Стоит раньше include('boards.urls') из urls.py и перекрывает его маршруты и пространство имен.
+    path("boards/", include('boards.asgi_urls')),
+    *urls.urlpatterns,
+]
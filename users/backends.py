@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+# Получение текущей активной модели пользователя Django.
+User = get_user_model()
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    Стандартная аутентификация Django, которая загружает пользователя из сессии
+    вместе с профилем одним запросом с JOIN.
+
+    AuthenticationMiddleware вызывает get_user один раз за запрос, поэтому
+    request.user.profile далее доступен без дополнительного запроса.
+    """
+    def get_user(self, user_id):
+        try:
+            user = User._default_manager.select_related('profile').get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
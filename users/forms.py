@@ -1,8 +1,7 @@
 from django import forms
-from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import OneTimeCode
+from .otp import find_active_code
 
 # Получение текущей активной модели пользователя Django.
 User = get_user_model()
@@ -58,25 +57,12 @@ class VerifyCodeForm(forms.Form):
         if not code or not email:
             return cleaned_data
 
-        try:
-            # Поиск одноразового кода, соответствующего Email, коду, неиспользованного и непросроченного.
-            otp_code = OneTimeCode.objects.filter(
-                user__email=email,
-                code=code,
-                is_used=False,
-                expires_at__gt=timezone.now()
-            ).order_by('-created_at').first()
-
-            if not otp_code:
-                raise ValidationError('Неверный или просроченный код. Пожалуйста, попробуйте снова или запросите новый.')
-
-            cleaned_data['otp_code_obj'] = otp_code
-
-        except OneTimeCode.DoesNotExist:
+        # Поиск одноразового кода, соответствующего Email, коду, неиспользованного и непросроченного.
+        otp_code = find_active_code(email, code)
+        if not otp_code:
             raise ValidationError('Неверный или просроченный код. Пожалуйста, попробуйте снова или запросите новый.')
-        except Exception as e:
-            raise ValidationError('Произошла ошибка. Пожалуйста, попробуйте позже.')
 
+        cleaned_data['otp_code_obj'] = otp_code
         return cleaned_data
 
 class UserLoginForm(forms.Form):
@@ -0,0 +1,112 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import OneTimeCode
+from users.otp import find_active_code
+
+User = get_user_model()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Измеряет задержку проверки одноразового кода на таблице с миллионами исторических кодов.
+    Все данные создаются внутри транзакции и откатываются по завершении.
+    """
+    help = 'Сравнивает задержку проверки OTP без индексов, со старым запросом и через find_active_code.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codes', type=int, default=2_000_000, help='Количество исторических кодов.')
+        parser.add_argument('--users', type=int, default=20_000, help='Количество пользователей.')
+        parser.add_argument('--lookups', type=int, default=2000, help='Количество проверок в каждом режиме.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write('Тестовые данные удалены.')
+
+    def _run(self, options):
+        self.stdout.write('Заполнение таблицы...')
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(username=f'otp-bench-{i}', email=f'otp-bench-{i}@example.com', is_active=True)
+            for i in range(options['users'])
+        )
+        if not users[0].pk:
+            users = list(User.objects.filter(username__startswith='otp-bench-'))
+
+        table = OneTimeCode._meta.db_table
+        insert_sql = (
+            f"INSERT INTO {table} (user_id, code, type, created_at, expires_at, is_used) "
+            "VALUES (%s, %s, %s, %s, %s, %s)"
+        )
+        batch = []
+        with connection.cursor() as cursor:
+            for i in range(options['codes']):
+                created = now - timedelta(minutes=random.randint(11, 60 * 24 * 365))
+                batch.append([
+                    random.choice(users).pk, f'{random.randrange(10 ** 6):06d}', 'login',
+                    created, created + timedelta(minutes=10), random.random() < 0.7,
+                ])
+                if len(batch) >= 10000:
+                    cursor.executemany(insert_sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert_sql, batch)
+            # Действующие коды, которые будут проверяться.
+            active = [
+                [user.pk, f'{random.randrange(10 ** 6):06d}', 'login', now, now + timedelta(minutes=10), False]
+                for user in users
+            ]
+            cursor.executemany(insert_sql, active)
+            if connection.vendor == 'sqlite':
+                # Обновляет статистику планировщика после массовой вставки.
+                cursor.execute(f"ANALYZE {table}")
+        samples = [(user.email, row[1]) for user, row in zip(users, active)]
+
+        def legacy(email, code):
+            otp_code = OneTimeCode.objects.filter(
+                user__email=email, code=code, is_used=False, expires_at__gt=timezone.now()
+            ).order_by('-created_at').first()
+            # Представления затем обращаются к otp_code.user — это еще один запрос.
+            return otp_code and otp_code.user
+
+        # Индексы удаляются и создаются заново внутри той же транзакции (без входа в schema_editor,
+        # который на SQLite требует отключения проверки внешних ключей вне транзакции).
+        editor = connection.schema_editor(collect_sql=True)
+        indexes = OneTimeCode._meta.indexes
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+        self._measure('Старый запрос без индексов', legacy, samples, options['lookups'])
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(str(index.create_sql(OneTimeCode, editor)))
+        self._measure('Старый запрос с индексами', legacy, samples, options['lookups'])
+        self._measure('find_active_code', find_active_code, samples, options['lookups'])
+
+    def _measure(self, label, lookup, samples, count):
+        timings = []
+        for email, code in random.choices(samples, k=count):
+            started = time.perf_counter()
+            if lookup(email, code) is None:
+                raise RuntimeError(f'{label}: код не найден для {email}.')
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{label}: медиана {statistics.median(timings):.3f} мс, p95 {p95:.3f} мс'
+        )
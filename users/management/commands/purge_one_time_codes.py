@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from users.otp import purge_one_time_codes
+
+
+class Command(BaseCommand):
+    """
+    Удаляет просроченные и использованные одноразовые коды.
+    Рассчитана на периодический запуск (например, из cron раз в час).
+    """
+    help = 'Удаляет просроченные и использованные одноразовые коды короткими порциями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Количество кодов в одной порции.')
+        parser.add_argument('--pause', type=float, default=0, help='Пауза между порциями в секундах.')
+
+    def handle(self, *args, **options):
+        total = 0
+        for deleted in purge_one_time_codes(batch_size=options['batch_size'], pause=options['pause']):
+            total += deleted
+            self.stdout.write(f'Удалено кодов: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Очистка завершена, удалено кодов: {total}.'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_userprofile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='onetimecode',
+            index=models.Index(condition=models.Q(('is_used', False)), fields=['user', 'code', '-created_at'], name='otp_active_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='onetimecode',
+            index=models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ),
+        # find_active_code сначала ищет пользователя по email, а у стандартной модели User
+        # индекса по этому полю нет.
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS "auth_user_email_idx" ON "auth_user" ("email");',
+            reverse_sql='DROP INDEX IF EXISTS "auth_user_email_idx";',
+        ),
+    ]
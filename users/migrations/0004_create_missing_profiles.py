@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    """
+    Создает профили пользователям, у которых их нет.
+    Раньше сигнал досоздавал профиль при любом сохранении User, теперь только при создании.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserProfile = apps.get_model('users', 'UserProfile')
+    missing = User.objects.filter(profile__isnull=True).values_list('pk', flat=True)
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id) for user_id in missing.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_one_time_code_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
@@ -53,6 +53,17 @@ class OneTimeCode(models.Model):
         verbose_name = 'Одноразовый код'
         verbose_name_plural = 'Одноразовые коды'
         ordering = ['-created_at'] # Сортировка по дате создания (от новых к старым)
+        indexes = [
+            # Проверка кода: user_id + code среди неиспользованных, самый новый первым.
+            # Частичный индекс содержит только активные коды и не растет вместе с историей.
+            models.Index(
+                fields=['user', 'code', '-created_at'],
+                condition=models.Q(is_used=False),
+                name='otp_active_lookup_idx',
+            ),
+            # Очистка просроченных кодов командой purge_one_time_codes.
+            models.Index(fields=['expires_at'], name='otp_expires_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -112,17 +123,12 @@ class UserProfile(models.Model):
         return f"Профиль {self.user.username}"
 
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
     """
-    Сигнал, создающий или обновляющий профиль пользователя при сохранении объекта User.
+    Сигнал, создающий профиль для нового пользователя.
+    Профиль не пересохраняется при каждом сохранении User (например, при обновлении last_login
+    во время входа): у него нет полей, зависящих от пользователя.
+    get_or_create делает сигнал идемпотентным, а при загрузке фикстур (raw) профиль приходит из них.
     """
-    if created:
-        # Если пользователь только что создан, создаем для него профиль.
-        UserProfile.objects.create(user=instance)
-    else:
-        # Если пользователь уже существует, пытаемся сохранить его профиль.
-        try:
-            instance.profile.save()
-        except UserProfile.DoesNotExist:
-            # Если профиля нет (например, если он был удален вручную), создаем его.
-            UserProfile.objects.create(user=instance)
\ No newline at end of file
+    if created and not raw:
+        UserProfile.objects.get_or_create(user=instance)
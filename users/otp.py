@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OneTimeCode
+
+# Получение текущей активной модели пользователя Django.
+User = get_user_model()
+
+
+def find_active_code(email, code):
+    """
+    Находит самый новый действующий одноразовый код пользователя с данным Email.
+
+    Сначала по Email определяется пользователь, затем код ищется по user_id и коду
+    в частичном индексе otp_active_lookup_idx, который содержит только неиспользованные коды.
+    Пользователь сразу подставляется в найденный код, чтобы представления не делали лишний запрос.
+    Возвращает OneTimeCode или None.
+    """
+    users = {user.pk: user for user in User.objects.filter(email=email)}
+    if not users:
+        return None
+    otp_code = (
+        OneTimeCode.objects.filter(
+            user_id__in=list(users),
+            code=code,
+            is_used=False,
+            expires_at__gt=timezone.now(),
+        )
+        .order_by('-created_at')
+        .first()
+    )
+    if otp_code is not None:
+        otp_code.user = users[otp_code.user_id]
+    return otp_code
+
+
+def _delete_in_batches(queryset, batch_size, pause):
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        # Каждая порция удаляется в своей короткой транзакции, чтобы не держать
+        # блокировку записи и не мешать входу пользователей.
+        with transaction.atomic():
+            OneTimeCode.objects.filter(pk__in=ids).delete()
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_one_time_codes(batch_size=5000, pause=0, now=None):
+    """
+    Удаляет просроченные и использованные одноразовые коды порциями по batch_size.
+    Генерирует количество удаленных кодов после каждой порции.
+    """
+    now = now or timezone.now()
+    # Просроченные коды выбираются по индексу otp_expires_idx.
+    yield from _delete_in_batches(OneTimeCode.objects.filter(expires_at__lte=now).order_by('expires_at'), batch_size, pause)
+    # Использованные, но еще не просроченные коды созданы за последние минуты: их немного,
+    # и после удаления просроченных таблица уже мала.
+    yield from _delete_in_batches(OneTimeCode.objects.filter(is_used=True).order_by('pk'), batch_size, pause)
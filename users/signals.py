@@ -1,17 +1,19 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from django.conf import settings
+from main import metrics
+from main.outbox import enqueue_mail
+
 from .models import OneTimeCode
 
 @receiver(post_save, sender=OneTimeCode)
 def send_otp_email_on_create(sender, instance, created, **kwargs):
     """
-    Отправляет одноразовый код по email, когда новый объект OneTimeCode сохраняется в базе данных.
+    Ставит в очередь письмо с одноразовым кодом, когда новый объект OneTimeCode сохраняется в базе данных.
     Этот сигнал срабатывает только при создании нового кода.
     """
     if created:
+        metrics.OTP_ISSUED.inc(type=instance.type)
         subject = ''
         template_name = ''
 
@@ -49,15 +51,11 @@ def send_otp_email_on_create(sender, instance, created, **kwargs):
             f"С уважением,\nКоманда фан-ресурса."
         )
 
-        try:
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [instance.user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            print(f"Отправлен {instance.type} код на {instance.user.email}")
-        except Exception as e:
-            print(f"Ошибка при отправке {instance.type} кода на {instance.user.email}: {e}")
\ No newline at end of file
+        # Письмо ставится в исходящую очередь в той же транзакции, что и код,
+        # и отправляется фоновым процессом run_mail_worker.
+        enqueue_mail(
+            subject,
+            plain_message,
+            [instance.user.email],
+            html_message=html_message,
+        )
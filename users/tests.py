@@ -1,4 +1,199 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Здесь будут написаны ваши тесты.
-# Пока файл пуст, но готов к добавлению тестов.
\ No newline at end of file
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main.testing import QueryBudgetMixin
+from .models import OneTimeCode, UserProfile
+from .otp import find_active_code, purge_one_time_codes
+
+User = get_user_model()
+
+
+def profile_queries(queries):
+    return [query['sql'] for query in queries if 'users_userprofile' in query['sql']]
+
+
+class ProfileLoadingTests(TestCase):
+    """
+    Тесты создания профиля и загрузки его вместе с пользователем.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('player', 'player@example.com')
+
+    def test_profile_created_once(self):
+        self.assertTrue(UserProfile.objects.filter(user=self.user).exists())
+        # Повторный сигнал о создании не приводит к ошибке и второму профилю.
+        post_save.send(sender=User, instance=self.user, created=True)
+        self.assertEqual(UserProfile.objects.filter(user=self.user).count(), 1)
+
+    def test_user_save_does_not_touch_profile(self):
+        with CaptureQueriesContext(connection) as context:
+            self.user.first_name = 'Игрок'
+            self.user.save()
+        self.assertEqual(profile_queries(context.captured_queries), [])
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_login_does_not_touch_profile(self):
+        code = OneTimeCode.objects.create(user=self.user, type='login')
+        session = self.client.session
+        session['email_for_login_verification'] = self.user.email
+        session.save()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('verify_login_code'), {'email': self.user.email, 'code': code.code}
+            )
+        self.assertRedirects(response, '/home/', fetch_redirect_response=False)
+        # Раньше обновление last_login вызывало SELECT и UPDATE профиля.
+        self.assertEqual(profile_queries(context.captured_queries), [])
+
+    def test_authenticated_page_loads_profile_with_user(self):
+        self.client.force_login(self.user)
+        # Один запрос к сессии и один запрос пользователя вместе с профилем.
+        with self.assertNumQueries(2), CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('boards:unsubscribe_newsletter'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(profile_queries(context.captured_queries)), 1)
+        self.assertIn('JOIN', profile_queries(context.captured_queries)[0])
+
+
+class OneTimeCodeTests(TestCase):
+    """
+    Тесты поиска действующего кода и очистки устаревших кодов.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('player', 'player@example.com')
+        self.other = User.objects.create_user('other', 'other@example.com')
+
+    def test_find_active_code_returns_newest_unused_code(self):
+        old = OneTimeCode.objects.create(user=self.user, type='login', code='111111')
+        OneTimeCode.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        new = OneTimeCode.objects.create(user=self.user, type='login', code='111111')
+
+        with self.assertNumQueries(2):
+            found = find_active_code(self.user.email, '111111')
+            # Пользователь уже подставлен в код.
+            self.assertEqual(found.user, self.user)
+        self.assertEqual(found, new)
+
+    def test_find_active_code_skips_invalid_codes(self):
+        OneTimeCode.objects.create(user=self.user, type='login', code='222222', is_used=True)
+        OneTimeCode.objects.create(user=self.user, type='login', code='333333',
+                                   expires_at=timezone.now() - timedelta(seconds=1))
+        OneTimeCode.objects.create(user=self.other, type='login', code='444444')
+
+        self.assertIsNone(find_active_code(self.user.email, '222222'))
+        self.assertIsNone(find_active_code(self.user.email, '333333'))
+        # Код другого пользователя не подходит.
+        self.assertIsNone(find_active_code(self.user.email, '444444'))
+        with self.assertNumQueries(1):
+            self.assertIsNone(find_active_code('missing@example.com', '444444'))
+
+    def test_user_email_is_indexed(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name FROM sqlite_master WHERE type = %s AND tbl_name = %s',
+                           ['index', 'auth_user'])
+            indexes = {row[0] for row in cursor.fetchall()}
+        self.assertIn('auth_user_email_idx', indexes)
+
+    def test_purge_deletes_expired_and_used_codes_in_batches(self):
+        now = timezone.now()
+        expired = [
+            OneTimeCode.objects.create(user=self.user, type='login', expires_at=now - timedelta(minutes=1))
+            for _ in range(3)
+        ]
+        used = OneTimeCode.objects.create(user=self.user, type='login', is_used=True)
+        active = OneTimeCode.objects.create(user=self.other, type='login')
+
+        batches = list(purge_one_time_codes(batch_size=2, now=now))
+
+        self.assertEqual(batches, [2, 1, 1])
+        self.assertEqual(list(OneTimeCode.objects.all()), [active])
+        self.assertFalse(OneTimeCode.objects.filter(pk__in=[code.pk for code in [*expired, used]]).exists())
+
+    def test_purge_without_stale_codes_does_nothing(self):
+        OneTimeCode.objects.create(user=self.user, type='login')
+        self.assertEqual(list(purge_one_time_codes()), [])
+        self.assertEqual(OneTimeCode.objects.count(), 1)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджеты SQL-запросов и прочитанных строк для каждого URL из users/urls.py
+    на двух объемах данных: число пользователей и накопленных одноразовых кодов.
+    """
+    DATA_SIZES = (3, 60)
+
+    def setUp(self):
+        self.user = User.objects.create_user('player', 'player@example.com')
+
+    def grow_data(self, size):
+        """
+        Доводит число пользователей до size; у каждого есть использованные коды прошлых входов.
+        """
+        for number in range(User.objects.count(), size):
+            user = User.objects.create_user(f'user{number}', f'user{number}@example.com')
+            for _ in range(3):
+                OneTimeCode.objects.create(user=user, type='login', is_used=True)
+
+    def _start_session(self, key, email):
+        session = self.client.session
+        session[key] = email
+        session.save()
+
+    def test_register(self):
+        for size, budget in self.budget_at_sizes(queries=0, rows=0):
+            with budget:
+                response = self.client.get(reverse('register'))
+            self.assertEqual(response.status_code, 200)
+        for size, budget in self.budget_at_sizes(queries=15, rows=5):
+            with budget:
+                response = self.client.post(reverse('register'), {'email': f'new{size}@example.com'})
+            self.assertEqual(response.status_code, 302)
+
+    def test_verify_registration_code(self):
+        for size, budget in self.budget_at_sizes(queries=1, rows=1):
+            user = User.objects.create_user(f'new{size}', f'new{size}@example.com', is_active=False)
+            code = OneTimeCode.objects.create(user=user, type='registration')
+            self._start_session('email_for_verification', user.email)
+            with budget:
+                response = self.client.get(reverse('verify_registration_code'))
+            self.assertEqual(response.status_code, 200)
+            with self.assertQueryBudget(queries=10, rows=3):
+                response = self.client.post(
+                    reverse('verify_registration_code'), {'email': user.email, 'code': code.code}
+                )
+            self.assertEqual(response.status_code, 302)
+
+    def test_login_request_code(self):
+        for size, budget in self.budget_at_sizes(queries=0, rows=0):
+            with budget:
+                response = self.client.get(reverse('login_request_code'))
+            self.assertEqual(response.status_code, 200)
+        for size, budget in self.budget_at_sizes(queries=10, rows=4):
+            with budget:
+                response = self.client.post(reverse('login_request_code'), {'email': self.user.email})
+            self.assertEqual(response.status_code, 302)
+
+    def test_verify_login_code(self):
+        for size, budget in self.budget_at_sizes(queries=16, rows=4):
+            code = OneTimeCode.objects.create(user=self.user, type='login')
+            self._start_session('email_for_login_verification', self.user.email)
+            with budget:
+                response = self.client.post(reverse('verify_login_code'), {'email': self.user.email, 'code': code.code})
+            self.assertEqual(response.status_code, 302)
+            self.client.logout()
+
+    def test_logout(self):
+        for size, budget in self.budget_at_sizes(queries=4, rows=3):
+            self.client.force_login(self.user)
+            with budget:
+                response = self.client.get(reverse('logout'))
+            self.assertEqual(response.status_code, 302)
@@ -6,6 +6,8 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.db import transaction
 
+from main import metrics
+
 from .forms import UserRegisterForm, VerifyCodeForm, UserLoginForm
 from .models import OneTimeCode
 
@@ -90,14 +92,15 @@ class UserVerifyRegistrationCodeView(FormView):
             with transaction.atomic():
                 # Активация пользователя.
                 user.is_active = True
-                user.save()
+                user.save(update_fields=['is_active'])
                 # Пометка одноразового кода как использованного.
                 otp_code_obj.is_used = True
-                otp_code_obj.save()
+                otp_code_obj.save(update_fields=['is_used'])
 
                 # Удаление email из сессии после успешной верификации.
                 self.request.session.pop('email_for_verification', None)
 
+            metrics.OTP_VERIFICATIONS.inc(type='registration', result='success')
             messages.success(self.request, 'Ваш аккаунт успешно подтвержден! Теперь вы можете войти.')
             return super().form_valid(form)
 
@@ -105,6 +108,13 @@ class UserVerifyRegistrationCodeView(FormView):
             messages.error(self.request, f'Произошла ошибка при подтверждении: {e}')
             return self.form_invalid(form)
 
+    def form_invalid(self, form):
+        """
+        Неверный или просроченный код учитывается в метриках проверок.
+        """
+        metrics.OTP_VERIFICATIONS.inc(type='registration', result='failure')
+        return super().form_invalid(form)
+
 # --- Запрос кода для входа ---
 class UserLoginRequestCodeView(FormView):
     """
@@ -181,13 +191,14 @@ class UserLoginVerifyCodeView(FormView):
             with transaction.atomic():
                 # Помечаем код как использованный.
                 otp_code_obj.is_used = True
-                otp_code_obj.save()
+                otp_code_obj.save(update_fields=['is_used'])
 
                 # Входим пользователя в систему.
                 login(self.request, user)
                 # Удаляем email из сессии.
                 self.request.session.pop('email_for_login_verification', None)
 
+            metrics.OTP_VERIFICATIONS.inc(type='login', result='success')
             messages.success(self.request, 'Вы успешно вошли в систему!')
             return super().form_valid(form)
 
@@ -195,6 +206,13 @@ class UserLoginVerifyCodeView(FormView):
             messages.error(self.request, f'Произошла ошибка при входе: {e}')
             return self.form_invalid(form)
 
+    def form_invalid(self, form):
+        """
+        Неверный или просроченный код учитывается в метриках проверок.
+        """
+        metrics.OTP_VERIFICATIONS.inc(type='login', result='failure')
+        return super().form_invalid(form)
+
 # --- Выход пользователя ---
 class UserLogoutView(View):
     """